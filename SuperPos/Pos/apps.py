@@ -1,6 +1,27 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
 
+def _serving() -> bool:
+    """Whether this process serves requests: a WSGI/ASGI server, or the
+    runserver process that is not just the autoreloader's parent."""
+    if os.path.basename(sys.argv[0]) != "manage.py":
+        return True
+    if sys.argv[1:2] != ["runserver"]:
+        return False
+    return os.environ.get("RUN_MAIN") == "true" or "--noreload" in sys.argv
+
+
 class PosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Pos'
+
+    def ready(self):
+        # Fill the RSA keypair pool from startup, so the first requests are
+        # served from it instead of generating inline.
+        if os.environ.get("RSA_POOL_PREFILL_AT_STARTUP", "True") == "True" and _serving():
+            from .services import crypto
+
+            crypto.keypair_pool.start()
@@ -12,10 +12,12 @@
 #     factors = serializers.ListField(child=serializers.IntegerField())
 from rest_framework import serializers
 
+from .services import crypto, quantum
+
 class FactorInputSerializer(serializers.Serializer):
     number = serializers.IntegerField(
-        required=True, min_value=2, 
-        help_text="The number to factorize"
+        required=True, min_value=2, max_value=2**quantum.FACTOR_MAX_BITS - 1,
+        help_text="The number to factorize (quantum methods accept fewer bits, see quantum.ORDER_FINDING_MAX_BITS)"
     )
     use_quantum = serializers.BooleanField(
         default=False, required=False,
@@ -29,17 +31,50 @@ class FactorInputSerializer(serializers.Serializer):
         choices=['ideal', 'depolarizing', 'bitflip'], default='ideal', required=False,
         help_text="Type of noise model applied to the quantum circuit"
     )
+    method = serializers.ChoiceField(
+        choices=['circuit', 'iterative', 'fast-ideal'], default='circuit', required=False,
+        help_text="Simulate the full order finding circuit, the single-control-qubit iterative circuit, or sample ideal outcomes analytically (ideal noise model only)"
+    )
+    parallel = serializers.BooleanField(
+        default=False, required=False,
+        help_text="Race order finding attempts across a process pool and keep the first factor found"
+    )
     backend = serializers.ChoiceField(
         choices=['simulator', 'ibm_q', 'google_qpu'], default='simulator', required=False,
         help_text="Choose the backend to run quantum computations (simulated or real quantum device)"
     )
 
+    def validate(self, data):
+        if data.get('method') == 'fast-ideal' and data.get('noise_model') != 'ideal':
+            raise serializers.ValidationError(
+                "The fast-ideal method only supports the ideal noise model"
+            )
+        if data.get('use_quantum'):
+            method = data.get('method', 'circuit')
+            max_bits = quantum.ORDER_FINDING_MAX_BITS[method]
+            if data['number'].bit_length() > max_bits:
+                raise serializers.ValidationError({
+                    'number': f"The {method} method accepts numbers of at most {max_bits} bits"
+                })
+        return data
+
 class FactorResultSerializer(serializers.Serializer):
     result = serializers.CharField(help_text="Result status (e.g., 'composite', 'prime')")
     factors = serializers.ListField(
         child=serializers.IntegerField(), 
         help_text="List of prime factors"
     )
+    stages = serializers.ListField(
+        child=serializers.DictField(), required=False,
+        help_text="Which pipeline stage (trial_division, perfect_power, even, pollard_brent, order_finding) found each split"
+    )
     quantum_details = serializers.DictField(
         required=False, help_text="Additional details about quantum execution"
     )
+
+class RSAKeyInputSerializer(serializers.Serializer):
+    key_size = serializers.IntegerField(
+        default=crypto.DEFAULT_KEY_SIZE, required=False,
+        min_value=crypto.MIN_KEY_SIZE, max_value=crypto.MAX_KEY_SIZE,
+        help_text="Size of the RSA modulus n in bits"
+    )
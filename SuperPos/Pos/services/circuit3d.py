@@ -0,0 +1,175 @@
+import contextlib
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import BinaryIO, Optional
+
+import cirq
+import cirq_web
+
+from . import quantum
+
+# Generated viewer pages, one <circuit hash>.html file each, next to the
+# <circuit hash>.json editor circuit they are generated from. Every worker
+# process shares the directory, so any of them can serve any simulated circuit.
+CACHE_DIR = os.environ.get(
+    "CIRCUIT3D_CACHE_DIR", os.path.join(tempfile.gettempdir(), "superpos-circuit3d")
+)
+CACHE_MAX_ENTRIES = int(os.environ.get("CIRCUIT3D_CACHE_MAX_ENTRIES", 256))
+CACHE_MAX_BYTES = int(os.environ.get("CIRCUIT3D_CACHE_MAX_BYTES", 256 * 2**20))
+
+_KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+_evict_lock = threading.Lock()
+
+
+def render_circuit_html(circuit: cirq.Circuit) -> str:
+    """Full viewer page: the cirq_web 3D model next to the circuit's text diagram."""
+    # The model is written by cirq_web's public exporter into a private
+    # directory and embedded below; open_html renames the page into place.
+    with tempfile.TemporaryDirectory(prefix="superpos-circuit3d-") as directory:
+        model_path = cirq_web.Circuit3D(circuit).generate_html_file(
+            output_directory=directory, file_name="model.html"
+        )
+        with open(model_path, encoding="utf-8") as f:
+            html_content = f.read()
+
+    # Full template with custom styling
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Quantum Circuit Documentation</title>
+    <style>
+        :root {{
+            --background: 222.2 84% 4.9%;
+            --foreground: 210 40% 98%;
+            --card: 222.2 84% 4.9%;
+            --card-foreground: 210 40% 98%;
+            --primary: 217.2 91.2% 59.8%;
+            --secondary: 217.2 32.6% 17.5%;
+            --muted: 217.2 32.6% 17.5%;
+            --muted-foreground: 215 20.2% 65.1%;
+            --accent: 217.2 32.6% 17.5%;
+            --border: 217.2 32.6% 17.5%;
+            --radius: 0.5rem;
+        }}
+        body {{
+            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif;
+            background-color: hsl(var(--background));
+            color: hsl(var(--foreground));
+            margin: 0; padding: 0;
+        }}
+        .container {{ max-width: 80rem; margin: 0 auto; padding: 2rem; }}
+        .base {{ display: flex; gap: 2rem; width: 100%; margin-bottom: 2rem; }}
+        .model, .documentation {{ flex: 1; background-color: hsl(var(--card)); border-radius: var(--radius); padding: 1.5rem; border: 1px solid hsl(var(--border)); }}
+        h2 {{ color: hsl(var(--primary)); font-size: 1.5rem; margin-top: 0; }}
+        pre {{ background-color: hsl(var(--secondary)); padding: 1rem; border-radius: var(--radius); overflow-x: auto; font-family: monospace; }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="base">
+            <div class="model">
+                <h2>Model Content</h2>
+                {html_content}
+            </div>
+            <div class="documentation">
+                <h2>Technical Documentation</h2>
+                <p>Circuit diagram and state vector information are generated dynamically from the simulation kernel.</p>
+                <h3>Gate Set Applied:</h3>
+                <pre>{circuit.to_text_diagram(transpose=True)}</pre>
+            </div>
+        </div>
+    </div>
+</body>
+</html>"""
+
+
+def remember(key: str, circuit_data: dict) -> None:
+    """Stores a simulated circuit's JSON so its viewer can be built on request."""
+    path = _path(key, ".json")
+    if os.path.exists(path):
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    _write_atomic(path, json.dumps(circuit_data))
+    _evict()
+
+
+def _path(key: str, suffix: str = ".html") -> str:
+    return os.path.join(CACHE_DIR, key + suffix)
+
+
+def _write_atomic(path: str, content: str) -> None:
+    """Writes to a temporary file next to path and renames it into place."""
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _evict() -> None:
+    """Deletes the least recently used circuits until the cache is within bounds.
+
+    A circuit's page and JSON are evicted together; the newer of their
+    mtimes is its recency.
+    """
+    with _evict_lock:
+        circuits = {}
+        for entry in os.scandir(CACHE_DIR):
+            key, suffix = os.path.splitext(entry.name)
+            if suffix in (".html", ".json"):
+                with contextlib.suppress(FileNotFoundError):
+                    stat = entry.stat()
+                    mtime, size, paths = circuits.get(key, (0, 0, []))
+                    circuits[key] = (
+                        max(mtime, stat.st_mtime),
+                        size + stat.st_size,
+                        paths + [entry.path],
+                    )
+        entries = sorted(circuits.values())
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > CACHE_MAX_ENTRIES or total > CACHE_MAX_BYTES):
+            _, size, paths = entries.pop(0)
+            for path in paths:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+            total -= size
+
+
+def open_html(key: str) -> Optional[BinaryIO]:
+    """Opens the viewer page for a circuit hash, generating it on first request.
+
+    Returns None for malformed hashes and for circuits that were never
+    simulated or have been evicted. The file is opened before eviction runs,
+    so a concurrent eviction cannot pull it away.
+    """
+    if not _KEY_PATTERN.fullmatch(key):
+        return None
+    path = _path(key)
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        try:
+            with open(_path(key, ".json"), encoding="utf-8") as source:
+                circuit_data = json.load(source)
+        except FileNotFoundError:
+            return None
+        circuit = quantum.create_circuit_from_json(circuit_data)
+        _write_atomic(path, render_circuit_html(circuit))
+        f = open(path, "rb")
+        _evict()
+        return f
+
+    # Serving a page refreshes its mtime, which eviction treats as recency.
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(path)
+    return f
@@ -1,36 +1,116 @@
 import math
+import os
 import random
 import base64
+import io
+import time
+import numpy as np
 from sympy import mod_inverse
 
+from .cache import LRUCache
+from .keypool import KeypairPool
+from . import numtheory
+from .numtheory import small_primes
+
+# Largest prime used to sieve candidate windows in generate_prime.
+SIEVE_PRIME_LIMIT = int(os.environ.get("RSA_SIEVE_PRIME_LIMIT", 2**16))
+# Bounds for the modulus size accepted by generate_rsa_keypair.
+MIN_KEY_SIZE = 16
+MAX_KEY_SIZE = int(os.environ.get("RSA_MAX_KEY_SIZE", 4096))
+DEFAULT_KEY_SIZE = 32
+# factor_n: wall-clock budget in seconds and rho iterations before ECM takes over.
+FACTOR_TIME_BUDGET = float(os.environ.get("RSA_FACTOR_TIME_BUDGET", 10))
+RHO_MAX_ITERATIONS = int(os.environ.get("RSA_RHO_MAX_ITERATIONS", 2**21))
+# RSA blocks processed per buffer when streaming (rounded down to a multiple of 3).
+STREAM_BATCH_BLOCKS = int(os.environ.get("RSA_STREAM_BATCH_BLOCKS", 48))
+
+# With these bases Miller-Rabin is deterministic below 3.3 * 10**24.
+_MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+_MR_DETERMINISTIC_LIMIT = 3317044064679887385961981
+_MR_EXTRA_ROUNDS = 16
+
 
 def is_prime(n):
-    """Check if a number is prime."""
+    """Check if a number is prime (Miller-Rabin)."""
     if n < 2:
         return False
-    for i in range(2, int(math.sqrt(n)) + 1):
-        if n % i == 0:
+    for p in _MR_BASES:
+        if n % p == 0:
+            return n == p
+
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+
+    bases = list(_MR_BASES[:4] if n < 3215031751 else _MR_BASES)
+    if n >= _MR_DETERMINISTIC_LIMIT:
+        bases += [random.randrange(2, n - 1) for _ in range(_MR_EXTRA_ROUNDS)]
+    for a in bases:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
             return False
     return True
 
 
+def _sieve_window(start, size, primes):
+    """Marks which of start, start + 2, ..., start + 2*(size-1) have no factor in primes.
+
+    start must be odd and larger than every sieving prime.
+    """
+    survivors = np.ones(size, dtype=bool)
+    # start + 2*i == 0 (mod p)  <=>  i == -start * 2**-1 (mod p)
+    residues = np.array([start % p for p in primes.tolist()], dtype=np.int64)
+    offsets = (-residues * ((primes + 1) // 2)) % primes
+    # Primes at least as large as the window hit it at most once.
+    large = primes >= size
+    survivors[offsets[large & (offsets < size)]] = False
+    for p, offset in zip(primes[~large].tolist(), offsets[~large].tolist()):
+        survivors[offset::p] = False
+    return survivors
+
+
 def generate_prime(bit_length):
-    """Generate a random prime number with the specified bit length."""
+    """Generate a random prime number with the specified bit length.
+
+    Candidates come from random windows of odd numbers with the top two bits
+    set (so a product of two such primes has exactly 2*bit_length bits);
+    each window is sieved by small primes and only survivors get
+    Miller-Rabin tested.
+    """
+    if bit_length < 3:
+        raise ValueError("bit_length must be at least 3")
+    lowest = 3 << (bit_length - 2)
+    # Sieving pays off up to roughly bit_length**2; Miller-Rabin is cheap below.
+    primes = small_primes(min(SIEVE_PRIME_LIMIT, lowest, 8 * bit_length**2))[1:]
+    window = max(64, 4 * bit_length)
     while True:
-        p = random.getrandbits(bit_length)
-        if p % 2 == 0:
-            p += 1
-        if is_prime(p):
-            return p
-
-
-def generate_rsa_keypair():
-    """Generate an RSA key pair."""
-    bit_length = 16
-    p = generate_prime(bit_length)
-    q = generate_prime(bit_length)
+        start = random.getrandbits(bit_length) | lowest | 1
+        survivors = _sieve_window(start, window, primes)
+        for i in np.flatnonzero(survivors).tolist():
+            p = start + 2 * i
+            if p.bit_length() > bit_length:
+                break
+            if is_prime(p):
+                return p
+
+
+def generate_rsa_keypair(key_size=DEFAULT_KEY_SIZE):
+    """Generate an RSA key pair with a modulus of key_size bits."""
+    if not MIN_KEY_SIZE <= key_size <= MAX_KEY_SIZE:
+        raise ValueError(
+            f"key_size must be between {MIN_KEY_SIZE} and {MAX_KEY_SIZE} bits"
+        )
+    p = generate_prime(key_size // 2)
+    q = generate_prime(key_size - key_size // 2)
     while q == p:
-        q = generate_prime(bit_length)
+        q = generate_prime(key_size - key_size // 2)
 
     n = p * q
     phi = (p - 1) * (q - 1)
@@ -41,42 +121,210 @@ def generate_rsa_keypair():
     return n, e, d
 
 
+def _aligned_batch(batch_blocks):
+    """Rounds a block count down to a multiple of 3 (at least 3).
+
+    A multiple of 3 bytes encodes to whole 4-character Base64 groups, so the
+    pieces of a streamed batch concatenate to the Base64 of the whole.
+    """
+    return max(3, batch_blocks - batch_blocks % 3)
+
+
+def _read_into(stream, view):
+    """Fills view from a file-like stream; returns the byte count (short only at EOF)."""
+    readinto = getattr(stream, "readinto", None)
+    filled = 0
+    while filled < len(view):
+        if readinto is not None:
+            count = readinto(view[filled:])
+        else:
+            data = stream.read(len(view) - filled)
+            count = len(data)
+            view[filled : filled + count] = data
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def iter_encrypt(stream, e, n, batch_blocks=STREAM_BATCH_BLOCKS):
+    """Encrypts a byte stream block by block, yielding Base64 pieces.
+
+    The plaintext and ciphertext buffers are allocated once, so memory use
+    does not depend on the stream length; the joined pieces equal
+    encrypt_message's output for the same bytes.
+    """
+    chunk_size = (n.bit_length() - 1) // 8
+    block_size = (n.bit_length() + 7) // 8
+    batch_blocks = _aligned_batch(batch_blocks)
+    plain = memoryview(bytearray(chunk_size * batch_blocks))
+    cipher = memoryview(bytearray(block_size * batch_blocks))
+    while True:
+        count = _read_into(stream, plain)
+        blocks = -(-count // chunk_size)
+        for i in range(blocks):
+            chunk = plain[i * chunk_size : min((i + 1) * chunk_size, count)]
+            chunk_int = int.from_bytes(chunk, byteorder="big")
+            encrypted_int = pow(chunk_int, e, n)
+            cipher[i * block_size : (i + 1) * block_size] = encrypted_int.to_bytes(
+                block_size, byteorder="big"
+            )
+        if blocks:
+            yield base64.b64encode(cipher[: blocks * block_size])
+        if count < len(plain):
+            return
+
+
 def encrypt_message(message, e, n):
     """Encrypt the message using RSA."""
-    chunk_size = (n.bit_length() - 1) // 8
-    message_bytes = message.encode("utf-8")
-    encrypted_chunks = []
-    for i in range(0, len(message_bytes), chunk_size):
-        chunk = message_bytes[i : i + chunk_size]
-        chunk_int = int.from_bytes(chunk, byteorder="big")
-        encrypted_int = pow(chunk_int, e, n)
-        block_size = (n.bit_length() + 7) // 8
-        encrypted_bytes = encrypted_int.to_bytes(block_size, byteorder="big")
-        encrypted_chunks.append(encrypted_bytes)
-    combined_encrypted = b"".join(encrypted_chunks)
-    return base64.b64encode(combined_encrypted).decode("utf-8")
-
-
-def factor_n(n):
-    """Factor n using trial division (simulating Shor's algorithm)."""
-    for i in range(2, int(math.sqrt(n)) + 1):
-        if n % i == 0:
-            return i, n // i
-    return None, None
+    stream = io.BytesIO(message.encode("utf-8"))
+    return b"".join(iter_encrypt(stream, e, n)).decode("utf-8")
+
+
+def factor_n(n, time_budget=None):
+    """Split n into two factors with Pollard-Brent rho, falling back to ECM.
+
+    Raises numtheory.FactorizationTimeout after time_budget seconds
+    (RSA_FACTOR_TIME_BUDGET by default); returns (None, None) if n is
+    prime or no factor was found.
+    """
+    time_budget = FACTOR_TIME_BUDGET if time_budget is None else time_budget
+    deadline = time.monotonic() + time_budget if time_budget else None
+    if n < 4 or numtheory.is_prime(n):
+        return None, None
+
+    if n % 2 == 0:
+        p = 2
+    else:
+        power = numtheory.perfect_power(n)
+        p = power[0] if power is not None else None
+    if p is None:
+        p = numtheory.pollard_brent(
+            n, max_iterations=RHO_MAX_ITERATIONS, deadline=deadline
+        )
+    if p is None:
+        p = numtheory.ecm_split(n, deadline=deadline)
+    if p is None:
+        return None, None
+    p = min(p, n // p)
+    return p, n // p
+
+
+def iter_decrypt(stream, n, decrypt_int, batch_blocks=STREAM_BATCH_BLOCKS):
+    """Decrypts a Base64 ciphertext stream block by block, yielding plaintext bytes.
+
+    Whitespace in the input is ignored. Partial Base64 groups and partial
+    blocks are carried over to the next batch, so batches may end anywhere.
+    """
+    block_size = (n.bit_length() + 7) // 8
+    batch_blocks = _aligned_batch(batch_blocks)
+    encoded = memoryview(bytearray(block_size * batch_blocks // 3 * 4))
+    plain = memoryview(bytearray(block_size * batch_blocks))
+    text_carry = cipher_carry = b""
+    while True:
+        count = _read_into(stream, encoded)
+        at_end = count < len(encoded)
+        text = text_carry + encoded[:count].tobytes().translate(None, b" \t\r\n")
+        usable = len(text) if at_end else len(text) - len(text) % 4
+        text_carry = text[usable:]
+        cipher = cipher_carry + base64.b64decode(text[:usable])
+        usable = len(cipher) if at_end else len(cipher) - len(cipher) % block_size
+        cipher_carry = cipher[usable:]
+
+        used = 0
+        for i in range(0, usable, block_size):
+            chunk_int = int.from_bytes(cipher[i : i + block_size], byteorder="big")
+            decrypted_int = decrypt_int(chunk_int)
+            length = (decrypted_int.bit_length() + 7) // 8
+            plain[used : used + length] = decrypted_int.to_bytes(
+                length, byteorder="big"
+            )
+            used += length
+        if used:
+            yield plain[:used].tobytes()
+        if at_end:
+            return
+
+
+def _decrypt_blocks(encrypted_base64, n, decrypt_int):
+    """Decrypts a whole Base64 message held in memory."""
+    if isinstance(encrypted_base64, str):
+        encrypted_base64 = encrypted_base64.encode("ascii")
+    stream = io.BytesIO(encrypted_base64)
+    return b"".join(iter_decrypt(stream, n, decrypt_int)).decode("utf-8")
 
 
 def decrypt_message(encrypted_base64, d, n):
     """Decrypt the RSA-encrypted Base64 message."""
-    # print(type(encrypted_base64))
-    encrypted_bytes = base64.b64decode(encrypted_base64)
-    chunk_size = (n.bit_length() + 7) // 8
-    decrypted_chunks = []
-    for i in range(0, len(encrypted_bytes), chunk_size):
-        chunk = encrypted_bytes[i : i + chunk_size]
-        chunk_int = int.from_bytes(chunk, byteorder="big")
-        decrypted_int = pow(chunk_int, d, n)
-        decrypted_bytes = decrypted_int.to_bytes(
-            (decrypted_int.bit_length() + 7) // 8, byteorder="big"
-        )
-        decrypted_chunks.append(decrypted_bytes)
-    return b"".join(decrypted_chunks).decode("utf-8")
+    return _decrypt_blocks(encrypted_base64, n, lambda c: pow(c, d, n))
+
+
+class RSAPrivateKey:
+    """RSA private key that decrypts with the Chinese Remainder Theorem.
+
+    Two exponentiations modulo p and q with half-size exponents replace one
+    modulo n, which is about 3-4x less work.
+    """
+
+    def __init__(self, p, q, e):
+        self.p, self.q, self.e = p, q, e
+        self.n = p * q
+        self.d = mod_inverse(e, (p - 1) * (q - 1))
+        self.dP = self.d % (p - 1)
+        self.dQ = self.d % (q - 1)
+        self.qInv = pow(q, -1, p)
+
+    def decrypt_int(self, c):
+        m1 = pow(c, self.dP, self.p)
+        m2 = pow(c, self.dQ, self.q)
+        h = self.qInv * (m1 - m2) % self.p
+        return m2 + h * self.q
+
+    def decrypt_message(self, encrypted_base64):
+        """Decrypt the RSA-encrypted Base64 message."""
+        return _decrypt_blocks(encrypted_base64, self.n, self.decrypt_int)
+
+    def iter_decrypt(self, stream):
+        """Decrypts a Base64 ciphertext stream; see iter_decrypt."""
+        return iter_decrypt(stream, self.n, self.decrypt_int)
+
+
+# Private keys recovered by factoring, keyed by public key. Failed factorizations
+# are not stored, so a later request gets a fresh attempt.
+private_key_cache = LRUCache(
+    max_entries=int(os.environ.get("RSA_KEY_CACHE_SIZE", 256)),
+)
+
+
+def rsa_private_key(n, e):
+    """Recovers the private key for (n, e) by factoring n, memoized per public key.
+
+    Returns None if n cannot be factored; that outcome is not cached.
+    """
+    key = private_key_cache.get((n, e))
+    if key is not None:
+        return key
+    p, q = factor_n(n)
+    if p is None:
+        return None
+    key = RSAPrivateKey(p, q, e)
+    private_key_cache.put((n, e), key)
+    return key
+
+
+def _sizes_from_env(name, default):
+    return [
+        int(size) for size in os.environ.get(name, default).split(",") if size.strip()
+    ]
+
+
+# Pre-generated keypairs for the key sizes students use most; other sizes
+# are generated inline. Only the form's default size is filled up front, the
+# other pools after their first request.
+keypair_pool = KeypairPool(
+    generate_rsa_keypair,
+    key_sizes=_sizes_from_env("RSA_POOL_KEY_SIZES", "32,512,1024,2048"),
+    depth=int(os.environ.get("RSA_POOL_DEPTH", 16)),
+    low_watermark=int(os.environ.get("RSA_POOL_LOW_WATERMARK", 8)),
+    prefill_sizes=_sizes_from_env("RSA_POOL_PREFILL_SIZES", str(DEFAULT_KEY_SIZE)),
+)
@@ -0,0 +1,158 @@
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Sequence
+
+
+class KeypairPool:
+    """Bounded per-key-size pools of pre-generated keypairs.
+
+    A daemon thread, started by ``start`` or on first use, fills the ``prefill_sizes`` pools
+    (all of ``key_sizes`` by default) and tops a pool back up to ``depth``
+    once it falls below ``low_watermark``; the other pools are filled after
+    their first request. ``get`` pops a pooled keypair and only generates
+    inline when the pool for that size is empty (or the size is not pooled
+    at all).
+
+    With ``use_process`` the keys are generated in a one-worker process pool,
+    so refilling does not hold the GIL while requests are being served;
+    ``generator`` must then be picklable. The worker is spawned rather than
+    forked, so it does not inherit the server's threads and locks.
+    """
+
+    def __init__(
+        self,
+        generator: Callable[[int], tuple],
+        key_sizes: Sequence[int],
+        depth: int = 16,
+        low_watermark: Optional[int] = None,
+        use_process: bool = True,
+        prefill_sizes: Optional[Sequence[int]] = None,
+    ):
+        self.generator = generator
+        self.key_sizes = tuple(key_sizes)
+        self.depth = depth
+        self.low_watermark = depth // 2 if low_watermark is None else low_watermark
+        self._pools: Dict[int, deque] = {size: deque() for size in self.key_sizes}
+        if prefill_sizes is None:
+            prefill_sizes = self.key_sizes
+        self._refilling = {
+            size for size in prefill_sizes if size in self._pools and depth > 0
+        }
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.use_process = use_process
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._pid = os.getpid()
+        self.served_from_pool = 0
+        self.served_inline = 0
+        self.generated = 0
+        self.generation_seconds = 0.0
+        self.started_at: Optional[float] = None
+
+    def get(self, key_size: int) -> tuple:
+        keypair = None
+        with self._lock:
+            pool = self._pools.get(key_size)
+            if pool:
+                keypair = pool.popleft()
+                self.served_from_pool += 1
+            else:
+                self.served_inline += 1
+            if pool is not None and len(pool) < self.low_watermark:
+                self._refilling.add(key_size)
+                self._wakeup.set()
+        self._ensure_worker()
+        if keypair is None:
+            keypair = self.generator(key_size)
+        return keypair
+
+    def start(self) -> None:
+        """Starts filling the pools now rather than on the first ``get``."""
+        self._ensure_worker()
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked after starting (e.g. a preloading server): neither
+                # the thread nor the executor's process came along.
+                self._pid = os.getpid()
+                self._thread = self._executor = None
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if not self._refilling:
+                return
+            self.started_at = self.started_at or time.monotonic()
+            if self.use_process and self._executor is None:
+                try:
+                    self._executor = concurrent.futures.ProcessPoolExecutor(
+                        1, mp_context=multiprocessing.get_context("spawn")
+                    )
+                except (OSError, NotImplementedError):
+                    self.use_process = False
+            self._thread = threading.Thread(
+                target=self._run, name="rsa-keypair-pool", daemon=True
+            )
+            self._thread.start()
+
+    def _next_size(self) -> Optional[int]:
+        """The emptiest pool still being refilled, or None when all are full."""
+        with self._lock:
+            for size in list(self._refilling):
+                if len(self._pools[size]) >= self.depth:
+                    self._refilling.discard(size)
+            if not self._refilling:
+                return None
+            return min(self._refilling, key=lambda size: len(self._pools[size]))
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            size = self._next_size()
+            if size is None:
+                self._wakeup.wait()
+                continue
+            start = time.perf_counter()
+            if self._executor is not None:
+                try:
+                    keypair = self._executor.submit(self.generator, size).result()
+                except (RuntimeError, concurrent.futures.BrokenExecutor):
+                    # The executor is shut down at interpreter exit.
+                    return
+            else:
+                keypair = self.generator(size)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                if len(self._pools[size]) < self.depth:
+                    self._pools[size].append(keypair)
+                self.generated += 1
+                self.generation_seconds += elapsed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "depth": {str(size): len(pool) for size, pool in self._pools.items()},
+                "capacity": self.depth,
+                "low_watermark": self.low_watermark,
+                "refilling": sorted(self._refilling),
+                "served_from_pool": self.served_from_pool,
+                "served_inline": self.served_inline,
+                "generated": self.generated,
+                "generation_seconds": self.generation_seconds,
+                # Keys per second of worker time, and per second since start.
+                "refill_rate": (
+                    self.generated / self.generation_seconds
+                    if self.generation_seconds
+                    else 0.0
+                ),
+                "average_refill_rate": (
+                    self.generated / (time.monotonic() - self.started_at)
+                    if self.started_at
+                    else 0.0
+                ),
+                "worker_alive": self._thread is not None and self._thread.is_alive(),
+            }
@@ -0,0 +1,237 @@
+import functools
+import math
+import os
+import random
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import sympy
+from sympy.ntheory import ecm
+
+# Largest baby-step table bsgs_order builds (~100 bytes per dict entry).
+BSGS_MAX_BABY_STEPS = int(os.environ.get("BSGS_MAX_BABY_STEPS", 2**22))
+
+
+def carmichael_lambda(factorization: Dict[int, int]) -> int:
+    """Carmichael function λ(n) from the prime factorization {p: k} of n."""
+    result = 1
+    for p, k in factorization.items():
+        if p == 2 and k >= 3:
+            value = 2 ** (k - 2)
+        else:
+            value = (p - 1) * p ** (k - 1)
+        result = result * value // math.gcd(result, value)
+    return result
+
+
+def reduce_order(x: int, n: int, r: int) -> int:
+    """Strips prime factors from a multiple r of the order while x**r stays 1."""
+    for prime in sympy.factorint(r):
+        while r % prime == 0 and pow(x, r // prime, n) == 1:
+            r //= prime
+    return r
+
+
+def bsgs_order(
+    x: int, n: int, bound: Optional[int] = None, deadline: Optional[float] = None
+) -> int:
+    """Order of x modulo n by baby-step giant-step.
+
+    The baby steps x**j for j < m go into a dict; the first giant step
+    x**(m*i) found there gives x**(m*i - j) == 1. Until the order exceeds m
+    the baby steps are distinct, so m*i - j is the order itself. m is
+    sqrt(bound), which takes O(sqrt(bound)) steps, but at most
+    BSGS_MAX_BABY_STEPS; larger bounds take bound / m giant steps instead,
+    checked against ``deadline`` (see check_deadline).
+    """
+    bound = n if bound is None else bound
+    m = min(math.isqrt(bound) + 1, BSGS_MAX_BABY_STEPS)
+
+    baby = {}
+    y = 1
+    for j in range(m):
+        if j and y == 1:
+            return j
+        if j % 65536 == 0:
+            check_deadline(deadline)
+        baby[y] = j
+        y = y * x % n
+
+    giant = pow(x, m, n)
+    y = giant
+    for i in range(1, bound // m + 2):
+        j = baby.get(y)
+        if j is not None:
+            return m * i - j
+        if i % 65536 == 0:
+            check_deadline(deadline)
+        y = y * giant % n
+    raise ValueError(f"{x} has no multiplicative order modulo {n}")
+
+
+def multiplicative_order(
+    x: int,
+    n: int,
+    factorization: Optional[Dict[int, int]] = None,
+    deadline: Optional[float] = None,
+) -> int:
+    """Smallest r > 0 with x**r % n == 1.
+
+    When the factorization of n is known (or n is prime) the order divides
+    λ(n), so it is found by reducing λ(n); otherwise by baby-step giant-step,
+    which raises FactorizationTimeout past ``deadline``. n itself is never
+    factored here: its order is what factor_number uses to factor it.
+    """
+    if math.gcd(x, n) != 1:
+        raise ValueError(f"{x} is not invertible modulo {n}")
+    if n == 1:
+        return 1
+    if factorization is None and sympy.isprime(n):
+        factorization = {n: 1}
+    if factorization is not None:
+        return reduce_order(x, n, carmichael_lambda(factorization))
+    return bsgs_order(x % n, n, deadline=deadline)
+
+
+class FactorizationTimeout(Exception):
+    """Raised when factoring runs past its time budget."""
+
+
+def check_deadline(deadline: Optional[float]) -> None:
+    """Raises FactorizationTimeout once time.monotonic() passes the deadline."""
+    if deadline is not None and time.monotonic() > deadline:
+        raise FactorizationTimeout("Factorization exceeded its time budget")
+
+
+@functools.lru_cache(maxsize=4096)
+def is_prime(n: int) -> bool:
+    """Memoized sympy.isprime; factoring asks about the same cofactors repeatedly."""
+    return bool(sympy.isprime(n))
+
+
+@functools.lru_cache(maxsize=8)
+def small_primes(limit: int) -> np.ndarray:
+    """Primes below limit, from a sieve of Eratosthenes."""
+    sieve = np.ones(limit, dtype=bool)
+    sieve[:2] = False
+    for p in range(2, math.isqrt(limit - 1) + 1):
+        if sieve[p]:
+            sieve[p * p :: p] = False
+    primes = np.flatnonzero(sieve)
+    primes.flags.writeable = False
+    return primes
+
+
+def trial_division(n: int, limit: int) -> Tuple[Dict[int, int], int]:
+    """Strips prime factors below limit; returns ({p: k}, remaining cofactor)."""
+    primes = small_primes(limit)
+    if n < 2**63:
+        candidates = primes[np.int64(n) % primes == 0].tolist()
+    else:
+        candidates = [p for p in primes.tolist() if n % p == 0]
+    found = {}
+    for p in candidates:
+        while n % p == 0:
+            n //= p
+            found[p] = found.get(p, 0) + 1
+    return found, n
+
+
+def perfect_power(n: int) -> Optional[Tuple[int, int]]:
+    """Returns (b, k) with b**k == n and k > 1 as large as possible, else None.
+
+    Uses exact integer roots, so unlike math.pow it is correct for any size.
+    """
+    for k in sympy.primerange(2, n.bit_length() + 1):
+        root, exact = sympy.integer_nthroot(n, k)
+        if exact:
+            deeper = perfect_power(root)
+            if deeper is None:
+                return root, k
+            return deeper[0], deeper[1] * k
+    return None
+
+
+def pollard_brent(
+    n: int,
+    max_iterations: int = 2**22,
+    batch: int = 128,
+    deadline: Optional[float] = None,
+    rng: Optional[random.Random] = None,
+) -> Optional[int]:
+    """Finds a non-trivial factor of odd composite n with Brent's rho.
+
+    Differences are multiplied together and gcd'ed once per batch, with a
+    step-by-step replay when a batch overshoots to n. Returns None if
+    max_iterations pass without a factor.
+    """
+    rng = rng or random
+    iterations = 0
+    while iterations < max_iterations:
+        y, c = rng.randrange(1, n), rng.randrange(1, n)
+        g = r = q = 1
+        while g == 1 and iterations < max_iterations:
+            x = y
+            for k in range(r):
+                y = (y * y + c) % n
+                if k % batch == 0:
+                    check_deadline(deadline)
+            k = 0
+            while k < r and g == 1:
+                check_deadline(deadline)
+                ys = y
+                for _ in range(min(batch, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = math.gcd(q, n)
+                k += batch
+                iterations += batch
+            r *= 2
+        if g == n:
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = math.gcd(abs(x - ys), n)
+        if 1 < g < n:
+            return g
+    return None
+
+
+# (B1, curves) per ECM level, sized for factors of about 15, 20, 25, 30 and
+# 35 digits; B2 is 100 * B1.
+ECM_SCHEDULE = ((2000, 25), (11000, 90), (50000, 300), (250000, 700), (1000000, 1800))
+
+
+def ecm_split(
+    n: int,
+    deadline: Optional[float] = None,
+    rng: Optional[random.Random] = None,
+) -> Optional[int]:
+    """Finds a non-trivial factor of composite n with Lenstra's ECM (sympy.ntheory.ecm).
+
+    Curves run one at a time. A curve cannot be interrupted, so before each
+    one its cost is estimated from the previous curve (scaled by B1), and
+    FactorizationTimeout is raised early if it would overrun the deadline.
+    Returns None once the schedule is exhausted.
+    """
+    rng = rng or random
+    estimate, previous_B1 = 0.0, None
+    for B1, curves in ECM_SCHEDULE:
+        if previous_B1 is not None:
+            estimate *= B1 / previous_B1
+        previous_B1 = B1
+        for _ in range(curves):
+            check_deadline(None if deadline is None else deadline - estimate)
+            start = time.monotonic()
+            try:
+                factors = ecm(
+                    n, B1=B1, B2=100 * B1, max_curve=1, seed=rng.getrandbits(32)
+                )
+            except ValueError:
+                factors = ()
+            estimate = time.monotonic() - start
+            for f in sorted(factors):
+                if 1 < f < n and n % f == 0:
+                    return f
+    return None
@@ -0,0 +1,273 @@
+import cirq
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from . import stabilizer, statevector
+
+# Pauli codes used for frames and recorded errors: (x bit, z bit).
+_PAULI_CODES = {(True, False): 1, (True, True): 2, (False, True): 3}
+
+
+def pauli_probabilities(channel) -> Optional[Tuple[float, float, float]]:
+    """(p_x, p_y, p_z) of a single-qubit Pauli channel, None for any other."""
+    if cirq.num_qubits(channel) != 1 or not cirq.has_mixture(channel):
+        return None
+    probabilities = [0.0, 0.0, 0.0]
+    for p, unitary in cirq.mixture(channel):
+        for i, pauli in enumerate((cirq.X, cirq.Y, cirq.Z)):
+            if cirq.equal_up_to_global_phase(unitary, cirq.unitary(pauli)):
+                probabilities[i] += p
+                break
+        else:
+            if not cirq.equal_up_to_global_phase(unitary, np.eye(2)):
+                return None
+    return tuple(probabilities)
+
+
+def _z_transparent_qubits(op: cirq.Operation) -> Set[cirq.Qid]:
+    """Qubits on which a Z error commutes with op.
+
+    Diagonal gates commute with Z everywhere, controlled operations on their
+    controls, and arithmetic gates (basis permutations) on the registers
+    they leave unchanged, like the exponent register of ModularExp.
+    """
+    if statevector.is_diagonal(op):
+        return set(op.qubits)
+    if isinstance(op, cirq.ControlledOperation):
+        return set(op.controls)
+    gate = op.gate
+    if isinstance(gate, cirq.ArithmeticGate):
+        registers = gate.registers()
+        outputs = gate.apply(*[r if isinstance(r, int) else 0 for r in registers])
+        num_outputs = 1 if isinstance(outputs, int) else len(list(outputs))
+        transparent, position = set(), 0
+        for i, register in enumerate(registers):
+            if isinstance(register, int):
+                continue
+            if i >= num_outputs:
+                transparent.update(op.qubits[position : position + len(register)])
+            position += len(register)
+        return transparent
+    return set()
+
+
+def _terminal_measurements(circuit: cirq.Circuit) -> bool:
+    """True if every measurement is a plain one after the last gate on its qubits."""
+    measured = set()
+    for op in circuit.all_operations():
+        if measured.intersection(op.qubits):
+            return False
+        if cirq.is_measurement(op):
+            gate = op.gate
+            if not isinstance(gate, cirq.MeasurementGate) or gate.confusion_map:
+                return False
+            measured.update(op.qubits)
+        elif not cirq.has_unitary(op):
+            return False
+    return True
+
+
+class _Frames:
+    """Pauli frames of every shot: frame s holds the errors of shot s that
+    have been commuted past the gates simulated so far.
+
+    Clifford gates conjugate the frames exactly. At any other gate the parts
+    of a frame that do not commute with it are taken out and recorded as
+    errors to insert in front of that gate when the shot is simulated.
+    """
+
+    def __init__(self, shots: int, num_qubits: int):
+        self.x = np.zeros((shots, num_qubits), dtype=bool)
+        self.z = np.zeros((shots, num_qubits), dtype=bool)
+        # The single-qubit Pauli whose eigenstate each qubit is known to be
+        # in ("x", "y" or "z"), or None once it may be entangled. An error
+        # equal to that Pauli is only a phase.
+        self.axis: List[Optional[str]] = ["z"] * num_qubits
+        self.recorded: List[Tuple[np.ndarray, int, int, np.ndarray]] = []
+
+    def add_errors(self, ex: np.ndarray, ez: np.ndarray) -> None:
+        for a, axis in enumerate(self.axis):
+            if axis == "z":
+                ez[:, a] = False
+            elif axis == "x":
+                ex[:, a] = False
+            elif axis == "y":
+                ez[:, a] ^= ex[:, a]
+                ex[:, a] = False
+        self.x ^= ex
+        self.z ^= ez
+
+    def clifford(self, instructions: Sequence[stabilizer.Instruction]) -> None:
+        x, z, axis = self.x, self.z, self.axis
+        for inst in instructions:
+            if inst.kind == "h":
+                (a,) = inst.targets
+                x[:, a], z[:, a] = z[:, a].copy(), x[:, a].copy()
+                axis[a] = {"x": "z", "z": "x"}.get(axis[a], axis[a])
+            elif inst.kind == "s":
+                (a,) = inst.targets
+                z[:, a] ^= x[:, a]
+                axis[a] = {"x": "y", "y": "x"}.get(axis[a], axis[a])
+            elif inst.kind == "cnot":
+                a, b = inst.targets
+                x[:, b] ^= x[:, a]
+                z[:, a] ^= z[:, b]
+                axis[b] = None
+                if axis[a] != "z":
+                    axis[a] = None
+            elif inst.kind == "cz":
+                a, b = inst.targets
+                z[:, a] ^= x[:, b]
+                z[:, b] ^= x[:, a]
+                for q in (a, b):
+                    if axis[q] != "z":
+                        axis[q] = None
+            elif inst.kind == "swap":
+                a, b = inst.targets
+                x[:, [a, b]] = x[:, [b, a]]
+                z[:, [a, b]] = z[:, [b, a]]
+                axis[a], axis[b] = axis[b], axis[a]
+            # Paulis only change the frame's sign.
+
+    def stop_at(self, position: int, axes: Sequence[int], transparent: Set[int]):
+        """Takes out the parts of the frames that do not commute with the
+        gate at ``position`` (all but Z on the ``transparent`` axes)."""
+        for a in axes:
+            stuck_z = (
+                np.zeros(len(self.z), dtype=bool) if a in transparent else self.z[:, a]
+            )
+            stuck = self.x[:, a] | stuck_z
+            shots = np.flatnonzero(stuck)
+            if len(shots):
+                codes = np.where(self.x[shots, a], np.where(stuck_z[shots], 2, 1), 3)
+                self.recorded.append((shots, position, a, codes))
+                self.x[shots, a] = False
+                if a not in transparent:
+                    self.z[shots, a] = False
+            if a not in transparent or self.axis[a] != "z":
+                self.axis[a] = None
+
+    def patterns(self, shots: int) -> Dict[tuple, List[int]]:
+        """Groups shots by the errors recorded for them (in circuit order)."""
+        per_shot: Dict[int, list] = {}
+        for rows, position, a, codes in self.recorded:
+            for shot, code in zip(rows.tolist(), codes.tolist()):
+                per_shot.setdefault(shot, []).append((position, a, code))
+        groups: Dict[tuple, List[int]] = {}
+        for shot in range(shots):
+            pattern = tuple(sorted(per_shot.get(shot, ())))
+            groups.setdefault(pattern, []).append(shot)
+        return groups
+
+
+def _apply_pauli(state: np.ndarray, axis: int, code: int) -> np.ndarray:
+    """Applies X (1), Y (2) or Z (3) to a state tensor, up to global phase."""
+    if code in (1, 2):
+        state = np.flip(state, axis=axis).copy()
+    if code in (2, 3):
+        index = [slice(None)] * state.ndim
+        index[axis] = 1
+        state[tuple(index)] *= -1
+    return state
+
+
+class _Runner:
+    """Applies a fixed list of unitary operations to state tensors."""
+
+    def __init__(self, operations: Sequence[cirq.Operation], axis: Dict):
+        self.operations = operations
+        self.axes = [[axis[q] for q in op.qubits] for op in operations]
+
+    def run(self, state: np.ndarray, start: int, stop: int, errors=()) -> np.ndarray:
+        """Applies operations start..stop-1, each preceded by its errors."""
+        buffer = np.empty_like(state)
+        errors = list(errors)
+        for i in range(start, stop):
+            while errors and errors[0][0] == i:
+                _, a, code = errors.pop(0)
+                state = _apply_pauli(state, a, code)
+            args = cirq.ApplyUnitaryArgs(state, buffer, self.axes[i])
+            result = cirq.apply_unitary(self.operations[i], args)
+            if result is buffer:
+                buffer = state
+            state = result
+        return state
+
+
+def sample_with_pauli_noise(
+    circuit: cirq.Circuit, channel, repetitions: int, seed=None
+) -> Optional[cirq.Result]:
+    """Samples ``circuit.with_noise(channel)`` without a trajectory per shot.
+
+    Errors are drawn for all shots at once and pushed through the circuit as
+    Pauli frames: through Clifford gates, Z through diagonal gates and
+    controls, and into measurements, where X parts flip the recorded bits.
+    Errors that reach a gate they do not commute with are inserted there, and
+    each distinct set of them is simulated once, starting from the noiseless
+    state at its first error; shots without such errors all share the one
+    noiseless simulation. The result has the distribution of cirq's
+    trajectories.
+
+    Returns None when this does not apply: non-Pauli noise, and circuits with
+    non-unitary operations or gates after a measurement on the same qubit.
+    """
+    probabilities = pauli_probabilities(channel)
+    if probabilities is None or not _terminal_measurements(circuit):
+        return None
+    p_x, p_y, p_z = probabilities
+    rng = np.random.default_rng(seed)
+    qubits = sorted(circuit.all_qubits())
+    axis = {q: i for i, q in enumerate(qubits)}
+    n = len(qubits)
+
+    frames = _Frames(repetitions, n)
+    operations, measurements, flips = [], {}, {}
+    for moment in circuit:
+        for op in moment:
+            axes = [axis[q] for q in op.qubits]
+            if cirq.is_measurement(op):
+                key = cirq.measurement_key_name(op)
+                measurements[key] = (axes, np.array(op.gate.full_invert_mask()))
+                flips[key] = frames.x[:, axes].copy()
+                continue
+            program = stabilizer.compile_circuit(cirq.Circuit(op), qubits)
+            if program is not None:
+                frames.clifford(program[0])
+            else:
+                transparent = {axis[q] for q in _z_transparent_qubits(op)}
+                frames.stop_at(len(operations), axes, transparent)
+            operations.append(op)
+        # Noise after every moment, as cirq's ConstantQubitNoiseModel adds it.
+        u = rng.random((repetitions, n))
+        frames.add_errors(u < p_x + p_y, (u >= p_x) & (u < p_x + p_y + p_z))
+
+    runner = _Runner(operations, axis)
+    groups = frames.patterns(repetitions)
+    outcomes = np.zeros(repetitions, dtype=np.int64)
+
+    def sample(state, shots):
+        probability = np.abs(state.reshape(-1)) ** 2
+        outcomes[shots] = rng.choice(
+            len(probability), size=len(shots), p=probability / probability.sum()
+        )
+
+    state = np.zeros((2,) * n, dtype=np.complex64)
+    state[(0,) * n] = 1
+    done = 0
+    for pattern in sorted(groups, key=lambda p: p[0][0] if p else len(operations)):
+        start = pattern[0][0] if pattern else len(operations)
+        state = runner.run(state, done, start)
+        done = start
+        if pattern:
+            branch = runner.run(state.copy(), start, len(operations), pattern)
+            sample(branch, groups[pattern])
+    state = runner.run(state, done, len(operations))
+    if () in groups:
+        sample(state, groups[()])
+
+    records = {}
+    for key, (axes, invert) in measurements.items():
+        shifts = np.array([n - 1 - a for a in axes], dtype=np.int64)
+        bits = ((outcomes[:, None] >> shifts) & 1).astype(bool)
+        records[key] = (bits ^ flips[key] ^ invert).astype(np.int8)
+    return cirq.ResultDict(params=cirq.ParamResolver({}), measurements=records)
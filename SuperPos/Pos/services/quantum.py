@@ -1,16 +1,139 @@
+import base64
+import concurrent.futures
 import random
 import cirq
 import cirq_web
-import fractions
+import functools
 import math
-import sympy
 import os
 import json
+import hashlib
+import multiprocessing
+import signal
+import threading
+import time
 import plotly
 from plotly import graph_objs as go
 import numpy as np
 from typing import Optional, Callable
 
+from . import numtheory, pauliframe, repetition, stabilizer, statevector
+from .cache import LRUCache
+from .numtheory import FactorizationTimeout
+
+SIMULATOR_BACKENDS = ("numpy", "cirq", "stabilizer")
+ORDER_FINDING_METHODS = ("circuit", "iterative", "fast-ideal")
+# Largest n, in bits, that each order finding method accepts: "circuit"
+# simulates 3L+3 qubits, "iterative" simulates L+1 qubits once per shot and
+# "fast-ideal" finds the order classically.
+ORDER_FINDING_MAX_BITS = {
+    "circuit": int(os.environ.get("ORDER_FINDING_CIRCUIT_MAX_BITS", 7)),
+    "iterative": int(os.environ.get("ORDER_FINDING_ITERATIVE_MAX_BITS", 10)),
+    "fast-ideal": int(os.environ.get("ORDER_FINDING_FAST_IDEAL_MAX_BITS", 64)),
+}
+# Shots the iterative method simulates between two deadline checks.
+ITERATIVE_BATCH_SHOTS = int(os.environ.get("ORDER_FINDING_ITERATIVE_BATCH_SHOTS", 100))
+# Encodings of the /simulate "state_vector": a dict per amplitude (legacy),
+# parallel arrays, or parallel base64 little-endian float32 arrays.
+STATE_FORMATS = ("list", "columnar", "base64")
+# Clifford-only circuits on more qubits than this use the stabilizer tableau
+# whatever backend is requested; its payloads include the dense state only up
+# to STABILIZER_DENSE_MAX_QUBITS.
+STABILIZER_AUTO_QUBITS = int(os.environ.get("STABILIZER_AUTO_QUBITS", 20))
+STABILIZER_DENSE_MAX_QUBITS = int(os.environ.get("STABILIZER_DENSE_MAX_QUBITS", 16))
+MAX_SHOTS = int(os.environ.get("SIMULATION_MAX_SHOTS", 10000))
+# Channel applied to every qubit after every moment by each noise_model.
+NOISE_CHANNELS = {"depolarizing": cirq.depolarize(0.01), "bitflip": cirq.bit_flip(0.02)}
+# Limits of one fault tolerance sweep: trials over all of its points, and
+# repetition code size.
+FAULT_TOLERANCE_MAX_TRIALS = int(
+    os.environ.get("FAULT_TOLERANCE_SWEEP_MAX_TRIALS", 20_000_000)
+)
+FAULT_TOLERANCE_MAX_QUBITS = int(os.environ.get("FAULT_TOLERANCE_MAX_QUBITS", 101))
+# Basis states serialized per chunk when streaming a state vector.
+STREAM_CHUNK_STATES = int(os.environ.get("SIMULATION_STREAM_CHUNK_STATES", 4096))
+
+# Built circuits (plus their pre-measurement state) and finished /simulate
+# payloads, keyed by a hash of the canonicalised circuit JSON.
+compiled_circuit_cache = LRUCache(
+    max_entries=int(os.environ.get("SIMULATION_CACHE_MAX_ENTRIES", 256)),
+    max_bytes=int(os.environ.get("SIMULATION_CACHE_MAX_BYTES", 128 * 2**20)),
+)
+simulation_payload_cache = LRUCache(
+    max_entries=int(os.environ.get("SIMULATION_CACHE_MAX_ENTRIES", 256)),
+    max_bytes=int(os.environ.get("SIMULATION_CACHE_MAX_BYTES", 128 * 2**20)),
+)
+# Intermediate product states keyed by a hash of the operation prefix, so an
+# edit near the end of a circuit only re-simulates the changed suffix.
+simulation_checkpoint_cache = LRUCache(
+    max_entries=int(os.environ.get("SIMULATION_CHECKPOINT_MAX_ENTRIES", 512)),
+    max_bytes=int(os.environ.get("SIMULATION_CHECKPOINT_MAX_BYTES", 256 * 2**20)),
+)
+CHECKPOINT_STRIDE = int(os.environ.get("SIMULATION_CHECKPOINT_STRIDE", 8))
+# Besides the final state, a simulation stores at most this many checkpoints,
+# and none while the state takes more than CHECKPOINT_MAX_STATE_BYTES.
+CHECKPOINTS_PER_RUN = int(os.environ.get("SIMULATION_CHECKPOINTS_PER_RUN", 4))
+CHECKPOINT_MAX_STATE_BYTES = int(
+    os.environ.get("SIMULATION_CHECKPOINT_MAX_STATE_BYTES", 16 * 2**20)
+)
+# Basis-state permutations for ModularExp, reused across Shor attempts on n.
+modular_exp_permutation_cache = LRUCache(
+    max_entries=16,
+    max_bytes=int(os.environ.get("MODULAR_EXP_CACHE_MAX_BYTES", 512 * 2**20)),
+)
+
+# Parallel find_factor: pool size, bases queued at once (default: one per
+# process) and per-attempt time limit in seconds (0 disables it).
+FACTOR_POOL_PROCESSES = int(
+    os.environ.get("FACTOR_POOL_PROCESSES", os.cpu_count() or 1)
+)
+FACTOR_POOL_IN_FLIGHT = int(os.environ.get("FACTOR_POOL_IN_FLIGHT", 0))
+FACTOR_ATTEMPT_TIMEOUT = float(os.environ.get("FACTOR_ATTEMPT_TIMEOUT", 0))
+# factor_number: sieve bound for trial division and wall-clock budget (seconds).
+TRIAL_DIVISION_LIMIT = int(os.environ.get("TRIAL_DIVISION_LIMIT", 10**5))
+FACTOR_TIME_BUDGET = float(os.environ.get("FACTOR_TIME_BUDGET", 30))
+# Largest number factor_number is asked to factor, in bits.
+FACTOR_MAX_BITS = int(os.environ.get("FACTOR_MAX_BITS", 256))
+
+
+def modular_power_table(base: int, modulus: int, exponent_bits: int) -> np.ndarray:
+    """Returns base**e % modulus for every e < 2**exponent_bits.
+
+    Built by repeated squaring: the second half of each doubling step is the
+    first half times base**(2**k).
+    """
+    table = np.ones(2**exponent_bits, dtype=np.int64)
+    power = base % modulus
+    table[0] = 1 % modulus
+    for k in range(exponent_bits):
+        half = 1 << k
+        table[half : 2 * half] = table[:half] * power % modulus
+        power = power * power % modulus
+    return table
+
+
+def modular_exp_permutation(
+    base: int, modulus: int, target_bits: int, exponent_bits: int
+) -> np.ndarray:
+    """Destination index of every (target, exponent) basis state under ModularExp.
+
+    Indices are big-endian with the target register first, matching the
+    qubit order of ``ModularExp.on(*target, *exponent)``.
+    """
+    key = (base, modulus, target_bits, exponent_bits)
+    permutation = modular_exp_permutation_cache.get(key)
+    if permutation is not None:
+        return permutation
+
+    powers = modular_power_table(base, modulus, exponent_bits)
+    target = np.arange(2**target_bits, dtype=np.int64)[:, None]
+    exponent = np.arange(2**exponent_bits, dtype=np.int64)[None, :]
+    new_target = np.where(target < modulus, target * powers[None, :] % modulus, target)
+    dtype = np.int32 if target_bits + exponent_bits < 31 else np.int64
+    permutation = ((new_target << exponent_bits) + exponent).astype(dtype).reshape(-1)
+    modular_exp_permutation_cache.put(key, permutation, size=permutation.nbytes)
+    return permutation
+
 
 class ModularExp(cirq.ArithmeticGate):
     """Quantum modular exponentiation for Shor's algorithm."""
@@ -43,6 +166,33 @@ class ModularExp(cirq.ArithmeticGate):
             return target
         return (target * base**exponent) % modulus
 
+    def _apply_unitary_(self, args: cirq.ApplyUnitaryArgs):
+        """Applies the whole gate as one cached permutation of basis states.
+
+        cirq.ArithmeticGate calls ``apply`` once per basis state with big-int
+        powers; here every amplitude moves in a single fancy-index scatter.
+        """
+        if isinstance(self.target, int) or isinstance(self.exponent, int):
+            return super()._apply_unitary_(args)
+        if any(d != 2 for d in [*self.target, *self.exponent]):
+            return super()._apply_unitary_(args)
+        if self.modulus >= 2**31:
+            # Products of two residues would overflow int64.
+            return super()._apply_unitary_(args)
+
+        permutation = modular_exp_permutation(
+            self.base, self.modulus, len(self.target), len(self.exponent)
+        )
+        transposed_args = args.with_axes_transposed_to_start()
+        src = transposed_args.target_tensor.reshape(len(permutation), -1)
+        dst = transposed_args.available_buffer.reshape(len(permutation), -1)
+        dst[permutation] = src
+        # In case the reshaped arrays were copies instead of views.
+        transposed_args.target_tensor[...] = dst.reshape(
+            transposed_args.target_tensor.shape
+        )
+        return args.target_tensor
+
     def _circuit_diagram_info_(self, args):
         wire_symbols = [f"t{i}" for i in range(len(self.target))]
         e_str = str(self.exponent)
@@ -57,6 +207,25 @@ def make_order_finding_circuit(
     x: int, n: int, shots: int = 100, noise_model: str = "ideal"
 ) -> cirq.Circuit:
     """Returns a quantum circuit that computes the order of x modulo n."""
+    circuit = _order_finding_gates(x, n)
+    if noise_model == "ideal":
+        # Flattened so each qubit's run of inverse-QFT controlled phases
+        # becomes a single phase multiply. Noise models add channels per
+        # moment, so they keep the inverse QFT as one.
+        circuit = cirq.Circuit(
+            statevector.fuse_diagonal_operations(
+                cirq.decompose(
+                    circuit, keep=lambda op: not isinstance(op, cirq.CircuitOperation)
+                )
+            )
+        )
+
+    # Apply noise model
+    return _apply_noise_model(circuit, noise_model)
+
+
+def _order_finding_gates(x: int, n: int) -> cirq.Circuit:
+    """The noiseless order finding circuit, one moment per step."""
     L = n.bit_length()
     target = cirq.LineQubit.range(L)
     exponent = cirq.LineQubit.range(L, 3 * L + 3)
@@ -64,50 +233,325 @@ def make_order_finding_circuit(
     # Create a ModularExp gate sized for these registers.
     mod_exp = ModularExp([2] * L, [2] * (2 * L + 3), x, n)
 
+    # The inverse QFT as a subcircuit of H/controlled-phase/SWAP gates: one
+    # moment like the cirq.qft gate, without cirq building that gate's dense
+    # 2**m x 2**m unitary.
+    inverse_qft = cirq.CircuitOperation(
+        cirq.FrozenCircuit(
+            cirq.decompose(
+                cirq.qft(*exponent, inverse=True),
+                keep=lambda op: cirq.num_qubits(op) <= 2,
+            )
+        )
+    )
     circuit = cirq.Circuit(
         cirq.X(target[L - 1]),
         cirq.H.on_each(*exponent),
         mod_exp.on(*target, *exponent),
-        cirq.qft(*exponent, inverse=True),
+        inverse_qft,
         cirq.measure(*exponent, key="exponent"),
     )
+    return circuit
 
-    # Apply noise model
-    if noise_model == "depolarizing":
-        circuit = circuit.with_noise(cirq.depolarize(0.01))
-    elif noise_model == "bitflip":
-        circuit = circuit.with_noise(cirq.bit_flip(0.02))
 
+def _apply_noise_model(circuit: cirq.Circuit, noise_model: str) -> cirq.Circuit:
+    if noise_model in NOISE_CHANNELS:
+        return circuit.with_noise(NOISE_CHANNELS[noise_model])
     return circuit
 
 
+def run_with_noise(
+    circuit: cirq.Circuit, noise_model: str, repetitions: int
+) -> cirq.Result:
+    """Samples a noiseless circuit under one of the NOISE_CHANNELS models.
+
+    Same distribution as running ``_apply_noise_model(circuit, noise_model)``
+    on cirq.Simulator, but Pauli noise on circuits that only measure at the
+    end is sampled for all shots at once (see
+    pauliframe.sample_with_pauli_noise) instead of one trajectory per shot.
+    """
+    channel = NOISE_CHANNELS.get(noise_model)
+    if channel is not None:
+        result = pauliframe.sample_with_pauli_noise(circuit, channel, repetitions)
+        if result is not None:
+            return result
+    return cirq.Simulator().run(
+        _apply_noise_model(circuit, noise_model), repetitions=repetitions
+    )
+
+
+def make_iterative_order_finding_circuit(
+    x: int, n: int, noise_model: str = "ideal"
+) -> cirq.Circuit:
+    """Order finding with a semiclassical inverse QFT and one recycled control qubit.
+
+    Round t applies a controlled x**(2**(m-1-t)) to the target, undoes the
+    phase contributed by the bits already read out (classically controlled
+    Z rotations), and measures the control into key ``exponent_{t}``. Round
+    t yields bit t of the exponent readout counting from the least
+    significant end, so the circuit needs L + 1 qubits instead of 3L + 3.
+    """
+    L = n.bit_length()
+    m = 2 * L + 3
+    target = cirq.LineQubit.range(L)
+    control = cirq.LineQubit(L)
+
+    circuit = cirq.Circuit(cirq.X(target[L - 1]))
+    for t in range(m):
+        base = pow(x, 2 ** (m - 1 - t), n)
+        circuit.append(
+            [
+                cirq.H(control),
+                ModularExp([2] * L, [2], base, n).on(*target, control),
+            ]
+        )
+        for s in range(t):
+            circuit.append(
+                cirq.ZPowGate(exponent=-1 / 2 ** (t - s))
+                .on(control)
+                .with_classical_controls(f"exponent_{s}")
+            )
+        circuit.append(
+            [
+                cirq.H(control),
+                cirq.measure(control, key=f"exponent_{t}"),
+                cirq.reset(control),
+            ]
+        )
+
+    return _apply_noise_model(circuit, noise_model)
+
+
+def iterative_order_finding_result(
+    x: int,
+    n: int,
+    shots: int = 100,
+    noise_model: str = "ideal",
+    deadline: Optional[float] = None,
+) -> cirq.Result:
+    """Runs the iterative circuit and reassembles an ``exponent`` measurement.
+
+    Every shot is its own simulation, so with a ``deadline`` the shots run
+    in batches of ITERATIVE_BATCH_SHOTS with a deadline check before each.
+    """
+    circuit = make_iterative_order_finding_circuit(x, n)
+    batch = shots if deadline is None else max(1, ITERATIVE_BATCH_SHOTS)
+    batches = []
+    for start in range(0, shots, batch):
+        numtheory.check_deadline(deadline)
+        batches.append(run_with_noise(circuit, noise_model, min(batch, shots - start)))
+    m = 2 * n.bit_length() + 3
+    # Most significant bit first, as in make_order_finding_circuit.
+    bits = np.column_stack(
+        [
+            np.concatenate([b.measurements[f"exponent_{t}"][:, 0] for b in batches])
+            for t in reversed(range(m))
+        ]
+    )
+    return cirq.ResultDict(
+        params=cirq.ParamResolver({}), measurements={"exponent": bits}
+    )
+
+
+def continued_fraction_denominators(
+    numerators: np.ndarray, denominator: int, limit: int
+) -> np.ndarray:
+    """Denominator of the last convergent of each numerators[i] / denominator
+    that is at most ``limit``; 0 where the best approximation is 0/1.
+
+    Runs the continued fraction expansion for every readout at once. When a
+    readout y is within 1/(2M) of s/r with r <= limit, s/r is one of its
+    convergents (Legendre), so this finds the same r as
+    Fraction.limit_denominator.
+    """
+    dtype = np.int64 if denominator < 2**62 else object
+    num = np.asarray(numerators).astype(dtype)
+    den = np.full(num.shape, denominator, dtype=dtype)
+    p_prev, p = np.zeros_like(num), np.ones_like(num)
+    q_prev, q = np.ones_like(num), np.zeros_like(num)
+    best_p, best_q = np.zeros_like(num), np.zeros_like(num)
+    active = np.ones(num.shape, dtype=bool)
+
+    while active.any():
+        a = np.where(active, num // np.where(den == 0, 1, den), 0)
+        # a * q + q_prev <= limit, tested without overflowing int64.
+        fits = active & ((q == 0) | (a <= (limit - q_prev) // np.where(q == 0, 1, q)))
+        new_p = np.where(fits, a * p + p_prev, p)
+        new_q = np.where(fits, a * q + q_prev, q)
+        best_p = np.where(fits, new_p, best_p)
+        best_q = np.where(fits, new_q, best_q)
+        p_prev, p = np.where(fits, p, p_prev), new_p
+        q_prev, q = np.where(fits, q, q_prev), new_q
+        remainder = np.where(fits, num - a * den, 0)
+        num, den = np.where(fits, den, num), np.where(fits, remainder, den)
+        active = fits & (remainder != 0)
+
+    return np.where(best_p == 0, 0, best_q).astype(np.int64)
+
+
 def process_measurement(result: cirq.Result, x: int, n: int) -> Optional[int]:
-    """Interprets the output of the order finding circuit."""
-    # Read the output integer of the exponent register.
-    exponent_as_integer = result.data["exponent"][0]
-    exponent_num_bits = result.measurements["exponent"].shape[1]
-    eigenphase = float(exponent_as_integer / 2**exponent_num_bits)
+    """Interprets the output of the order finding circuit.
+
+    Every shot's readout y estimates s/r for a random s, so each continued
+    fraction denominator divides the order r. Candidates are combined by
+    LCM (most frequent first, capped at n) and the result is reduced to the
+    smallest exponent with x**r % n == 1.
+    """
+    bits = result.measurements["exponent"]
+    exponent_num_bits = bits.shape[1]
+    if exponent_num_bits < 63:
+        weights = np.int64(1) << np.arange(exponent_num_bits - 1, -1, -1)
+        readouts = bits.astype(np.int64) @ weights
+    else:
+        readouts = np.array(
+            [int("".join(map(str, row)), 2) for row in bits], dtype=object
+        )
 
-    # Run the continued fractions algorithm to determine f = s / r.
-    f = fractions.Fraction.from_float(eigenphase).limit_denominator(n)
+    outcomes, counts = np.unique(readouts, return_counts=True)
+    denominators = continued_fraction_denominators(outcomes, 2**exponent_num_bits, n)
 
-    # If the numerator is zero, the order finder failed.
-    if f.numerator == 0:
+    # If every numerator is zero, the order finder failed.
+    candidates = {}
+    for d, count in zip(denominators.tolist(), counts.tolist()):
+        if d > 1:
+            candidates[d] = candidates.get(d, 0) + count
+    if not candidates:
         return None
 
-    # Else, return the denominator if it is valid.
-    r = f.denominator
-    if x**r % n != 1:
+    combined = 1
+    for d in sorted(candidates, key=candidates.get, reverse=True):
+        merged = combined * d // math.gcd(combined, d)
+        if merged <= n:
+            combined = merged
+
+    valid = [d for d in [combined, *candidates] if pow(x, d, n) == 1]
+    if not valid:
         return None
-    return r
+    return min(numtheory.reduce_order(x, n, d) for d in valid)
+
+
+# Above this many exponent outcomes the fast-ideal sampler stops tabulating
+# the whole distribution and samples around its peaks instead.
+_DENSE_QPE_MAX_BITS = 22
+_QPE_PEAK_WINDOW = 256
+
+
+def _qpe_peak_weights(theta, A) -> np.ndarray:
+    """|sum_{j<A} exp(2i*theta*j)|**2, the unnormalised QPE readout weight."""
+    numerator = np.sin(A * theta) ** 2
+    denominator = np.sin(theta) ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = numerator / denominator
+    return np.where(denominator < 1e-30, np.asarray(A, dtype=float) ** 2, weights)
+
+
+def sample_order_finding_outcomes(
+    x: int,
+    n: int,
+    shots: int,
+    rng: Optional[np.random.Generator] = None,
+    deadline: Optional[float] = None,
+) -> np.ndarray:
+    """Samples exponent-register readouts of the ideal order finding circuit.
+
+    After the modular exponentiation the target register holds x**e0 mod n
+    for some e0 < r, leaving the exponent register in an equal superposition
+    of the A = ceil((M - e0) / r) exponents congruent to e0. The inverse QFT
+    then reads out y with probability |sum_{j<A} w**(y*r*j)|**2 / (M * A),
+    where w = exp(2*pi*i/M). Only two values of A occur, so the whole
+    distribution follows from the order r without simulating any qubits.
+
+    Returns a (shots, 2L+3) array of bits, most significant first, exactly
+    like ``cirq.Simulator().run(...).measurements["exponent"]``. Finding r
+    raises FactorizationTimeout once ``deadline`` passes.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    num_bits = 2 * n.bit_length() + 3
+    M = 2**num_bits
+    r = classical_order_finder(x, n, deadline=deadline)
+    q, rem = divmod(M, r)
+
+    # P(A = q + 1) = rem * (q + 1) / M; otherwise A = q.
+    # A is only ever used inside sin(A * theta), so a float is precise enough.
+    A = np.where(rng.random(shots) < rem * (q + 1) / M, float(q + 1), float(q))
+
+    if num_bits <= _DENSE_QPE_MAX_BITS:
+        theta = np.pi * ((np.arange(M) * r) % M) / M
+        outcomes = np.empty(shots, dtype=np.int64)
+        for a in np.unique(A):
+            probabilities = _qpe_peak_weights(theta, a)
+            chosen = A == a
+            outcomes[chosen] = rng.choice(
+                M, size=int(chosen.sum()), p=probabilities / probabilities.sum()
+            )
+    else:
+        # All r peaks sit at k*M/r and carry (almost exactly) equal mass;
+        # pick a peak per shot, then an offset from that peak's window, which
+        # holds all but ~1/(pi**2 * window) of its probability. M can exceed
+        # 64 bits, so peak positions are exact Python integers.
+        k = rng.integers(0, r, size=shots).astype(object)
+        centre = (k * M + r // 2) // r
+        residual = (centre * r - k * M).astype(float)
+        offsets = np.arange(-_QPE_PEAK_WINDOW, _QPE_PEAK_WINDOW + 1)
+        theta = np.pi * (residual[:, None] + offsets[None, :] * r) / M
+        cumulative = np.cumsum(_qpe_peak_weights(theta, A[:, None]), axis=1)
+        u = rng.random(shots) * cumulative[:, -1]
+        picked = (cumulative < u[:, None]).sum(axis=1)
+        outcomes = (centre + offsets[picked].astype(object)) % M
+
+    shifts = np.arange(num_bits - 1, -1, -1).astype(outcomes.dtype)
+    return ((outcomes[:, None] >> shifts) & 1).astype(np.int8)
+
+
+def fast_ideal_order_finding_result(
+    x: int, n: int, shots: int = 100, deadline: Optional[float] = None
+) -> cirq.Result:
+    """Returns a cirq.Result shaped like a run of make_order_finding_circuit."""
+    bits = sample_order_finding_outcomes(x, n, shots, deadline=deadline)
+    return cirq.ResultDict(
+        params=cirq.ParamResolver({}), measurements={"exponent": bits}
+    )
 
 
 def quantum_order_finder(
-    x: int, n: int, shots: int = 100, noise_model: str = "ideal"
+    x: int,
+    n: int,
+    shots: int = 100,
+    noise_model: str = "ideal",
+    method: str = "circuit",
+    deadline: Optional[float] = None,
 ) -> Optional[int]:
-    """Computes smallest positive r such that x**r mod n == 1 using quantum circuit simulation."""
+    """Computes smallest positive r such that x**r mod n == 1 using quantum circuit simulation.
+
+    ``method="iterative"`` runs the L+1 qubit semiclassical circuit, and
+    ``method="fast-ideal"`` samples the ideal circuit's exponent readouts
+    analytically instead of simulating the 3L+3 qubit circuit. Raises
+    FactorizationTimeout once time.monotonic() passes ``deadline``; a
+    single circuit simulation is not interrupted, which is what
+    ORDER_FINDING_MAX_BITS bounds.
+    """
     if x < 2 or n <= x or math.gcd(x, n) > 1:
         raise ValueError(f"Invalid x={x} for modulus n={n}.")
+    numtheory.check_deadline(deadline)
+
+    if method == "fast-ideal":
+        if noise_model != "ideal":
+            raise ValueError(
+                "The fast-ideal method only supports the ideal noise model"
+            )
+        result = fast_ideal_order_finding_result(x, n, shots, deadline)
+        return process_measurement(result, x, n)
+    if method == "iterative":
+        result = iterative_order_finding_result(x, n, shots, noise_model, deadline)
+        return process_measurement(result, x, n)
+    if method != "circuit":
+        raise ValueError(
+            f"Unknown order finding method: {method}. Expected one of {ORDER_FINDING_METHODS}"
+        )
+
+    if noise_model in NOISE_CHANNELS:
+        result = run_with_noise(_order_finding_gates(x, n), noise_model, shots)
+        return process_measurement(result, x, n)
 
     # Create the order finding circuit
     circuit = make_order_finding_circuit(x, n, shots, noise_model)
@@ -120,40 +564,53 @@ def quantum_order_finder(
 
 
 def classical_order_finder(
-    x: int, n: int, shots: int = 100, noise_model: str = "ideal"
+    x: int,
+    n: int,
+    shots: int = 100,
+    noise_model: str = "ideal",
+    factorization: Optional[dict] = None,
+    deadline: Optional[float] = None,
 ) -> Optional[int]:
-    """Computes smallest positive r such that x**r mod n == 1."""
+    """Computes smallest positive r such that x**r mod n == 1.
+
+    Uses Carmichael's λ(n) if the factorization of n is passed in, and
+    baby-step giant-step otherwise, bounded by ``deadline``; see
+    numtheory.multiplicative_order.
+    """
     # Make sure x is both valid and in Z_n.
     if x < 2 or x >= n or math.gcd(x, n) > 1:
         raise ValueError(f"Invalid x={x} for modulus n={n}.")
 
     # Determine the order.
-    r, y = 1, x
-    while y != 1:
-        y = (x * y) % n
-        r += 1
-    return r
+    return numtheory.multiplicative_order(x, n, factorization, deadline)
 
 
 def find_factor_of_prime_power(n: int) -> Optional[int]:
     """Returns non-trivial factor of n if n is a prime power, else None."""
-    for k in range(2, math.floor(math.log2(n)) + 1):
-        c = math.pow(n, 1 / k)
-        c1 = math.floor(c)
-        if c1**k == n:
-            return c1
-        c2 = math.ceil(c)
-        if c2**k == n:
-            return c2
-    return None
+    power = numtheory.perfect_power(n)
+    return None if power is None else power[0]
 
 
 def find_factor(
-    n: int, order_finder: Callable = quantum_order_finder, max_attempts: int = 30
+    n: int,
+    order_finder: Callable = quantum_order_finder,
+    max_attempts: int = 30,
+    attempts: Optional[list] = None,
+    deadline: Optional[float] = None,
 ) -> Optional[int]:
-    """Returns a non-trivial factor of composite integer n."""
+    """Returns a non-trivial factor of composite integer n.
+
+    If ``attempts`` is a list, a record of every random base tried (its
+    order and how the attempt ended) is appended to it. Raises
+    FactorizationTimeout if time.monotonic() passes ``deadline``.
+    """
+
+    def record(x, outcome, order=None):
+        if attempts is not None:
+            attempts.append({"n": n, "base": x, "order": order, "outcome": outcome})
+
     # If the number is prime, there are no non-trivial factors.
-    if sympy.isprime(n):
+    if numtheory.is_prime(n):
         return None
 
     # If the number is even, two is a non-trivial factor.
@@ -166,6 +623,8 @@ def find_factor(
         return c
 
     for _ in range(max_attempts):
+        numtheory.check_deadline(deadline)
+
         # Choose a random number between 2 and n - 1.
         x = random.randint(2, n - 1)
 
@@ -174,204 +633,422 @@ def find_factor(
 
         # If x and n are not relatively prime, we got lucky and found a non-trivial factor.
         if 1 < c < n:
+            record(x, "gcd")
             return c
 
-        # Compute the order r of x modulo n using the order finder.
-        try:
-            r = order_finder(x, n)
-        except Exception as e:
-            continue
+        c, outcome, r = order_finding_attempt(n, x, order_finder)
+        record(x, outcome, r)
+        if c is not None:
+            return c
 
-        # If the order finder failed, try again.
-        if r is None:
-            continue
+    return None
 
-        # If the order r is even, try again.
-        if r % 2 != 0:
-            continue
 
-        # Compute the non-trivial factor.
-        y = x ** (r // 2) % n
-        if not (1 < y < n):
-            continue
+def order_finding_attempt(n: int, x: int, order_finder: Callable) -> tuple:
+    """Tries to split n using the order of x; returns (factor, outcome, order)."""
+    # Compute the order r of x modulo n using the order finder.
+    try:
+        r = order_finder(x, n)
+    except AttemptTimeout:
+        return None, "timeout", None
+    except FactorizationTimeout:
+        raise
+    except Exception:
+        return None, "error", None
 
-        c = math.gcd(y - 1, n)
-        if 1 < c < n:
-            return c
+    # If the order finder failed, try again.
+    if r is None:
+        return None, "no_order", None
 
-    return None
+    # If the order r is even, try again.
+    if r % 2 != 0:
+        return None, "odd_order", r
+
+    # Compute the non-trivial factor.
+    y = pow(x, r // 2, n)
+    if not (1 < y < n):
+        return None, "trivial_root", r
+
+    c = math.gcd(y - 1, n)
+    if 1 < c < n:
+        return c, "factor", r
+    return None, "trivial_factor", r
+
+
+class AttemptTimeout(Exception):
+    """Raised inside a pool worker when an attempt exceeds its time limit."""
+
+
+def _raise_attempt_timeout(signum, frame):
+    raise AttemptTimeout()
+
+
+def _timed_order_finding_attempt(
+    n: int, x: int, order_finder: Callable, timeout: Optional[float]
+) -> tuple:
+    """Runs order_finding_attempt in a pool worker, bounded by SIGALRM if available."""
+    if not timeout or not hasattr(signal, "SIGALRM"):
+        return order_finding_attempt(n, x, order_finder)
+    previous = signal.signal(signal.SIGALRM, _raise_attempt_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return order_finding_attempt(n, x, order_finder)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+_factor_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_factor_pool_lock = threading.Lock()
+
+
+def factor_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """The process pool shared by find_factor_parallel calls, created on first use.
+
+    Workers are spawned rather than forked, so they do not inherit the
+    server's threads, locks and database connections.
+    """
+    global _factor_pool
+    with _factor_pool_lock:
+        if _factor_pool is None:
+            _factor_pool = concurrent.futures.ProcessPoolExecutor(
+                FACTOR_POOL_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _factor_pool
+
+
+def _discard_factor_pool(pool) -> None:
+    """Drops a broken pool (a worker died) so the next call starts a new one."""
+    global _factor_pool
+    with _factor_pool_lock:
+        if _factor_pool is pool:
+            _factor_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def find_factor_parallel(
+    n: int,
+    order_finder: Callable = quantum_order_finder,
+    max_attempts: int = 30,
+    attempts: Optional[list] = None,
+    in_flight: Optional[int] = None,
+    attempt_timeout: Optional[float] = None,
+    deadline: Optional[float] = None,
+) -> Optional[int]:
+    """Like find_factor, but races random bases across the shared factor_pool.
+
+    At most ``in_flight`` bases are queued at once; the first worker that
+    splits n wins and the queued attempts are cancelled. Attempts already
+    running finish in the background, bounded by ``attempt_timeout`` and the
+    time left before ``deadline``. ``order_finder`` must be picklable (a
+    module function or functools.partial).
+    """
+    in_flight = in_flight or FACTOR_POOL_IN_FLIGHT or FACTOR_POOL_PROCESSES
+    if attempt_timeout is None:
+        attempt_timeout = FACTOR_ATTEMPT_TIMEOUT
+
+    def record(x, outcome, order=None):
+        if attempts is not None:
+            attempts.append({"n": n, "base": x, "order": order, "outcome": outcome})
+
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    if numtheory.is_prime(n):
+        return None
+    if n % 2 == 0:
+        return 2
+    c = find_factor_of_prime_power(n)
+    if c is not None:
+        return c
+
+    pending = {}
+    try:
+        submitted = done = 0
+        while done < max_attempts:
+            while submitted < max_attempts and len(pending) < in_flight:
+                x = random.randint(2, n - 1)
+                submitted += 1
+                # Bases sharing a factor with n need no order finding.
+                c = math.gcd(x, n)
+                if 1 < c < n:
+                    record(x, "gcd")
+                    return c
+                timeout = attempt_timeout
+                if deadline is not None:
+                    timeout = min(timeout or math.inf, max(remaining(), 1e-3))
+                pool = factor_pool()
+                try:
+                    future = pool.submit(
+                        _timed_order_finding_attempt, n, x, order_finder, timeout
+                    )
+                except concurrent.futures.BrokenExecutor:
+                    _discard_factor_pool(pool)
+                    pool = factor_pool()
+                    future = pool.submit(
+                        _timed_order_finding_attempt, n, x, order_finder, timeout
+                    )
+                pending[future] = (x, pool)
+            finished, _ = concurrent.futures.wait(
+                pending,
+                timeout=remaining(),
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            if not finished:
+                raise FactorizationTimeout("Factorization exceeded its time budget")
+            for future in finished:
+                x, pool = pending.pop(future)
+                done += 1
+                try:
+                    c, outcome, r = future.result()
+                except concurrent.futures.BrokenExecutor:
+                    _discard_factor_pool(pool)
+                    c, outcome, r = None, "error", None
+                except FactorizationTimeout:
+                    raise
+                except Exception:
+                    c, outcome, r = None, "error", None
+                record(x, outcome, r)
+                if c is not None:
+                    return c
+        return None
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def summarize_attempts(attempts: list) -> dict:
+    """Per-attempt statistics reported as ``quantum_details`` by factor_number."""
+    order_finder_calls = [a for a in attempts if a["outcome"] != "gcd"]
+    successes = sum(1 for a in attempts if a["outcome"] in ("factor", "gcd"))
+    outcomes = {}
+    for a in attempts:
+        outcomes[a["outcome"]] = outcomes.get(a["outcome"], 0) + 1
+    return {
+        "attempts": len(attempts),
+        "order_finder_calls": len(order_finder_calls),
+        "successful_attempts": successes,
+        "success_rate": successes / len(attempts) if attempts else 0.0,
+        "outcomes": outcomes,
+        "attempt_log": attempts,
+    }
 
 
 def factor_number(
-    n: int, use_quantum: bool = False, shots: int = 100, noise_model: str = "ideal"
+    n: int,
+    use_quantum: bool = False,
+    shots: int = 100,
+    noise_model: str = "ideal",
+    method: str = "circuit",
+    parallel: bool = False,
+    time_budget: Optional[float] = None,
 ):
-    """Factor a number using either classical or quantum algorithm."""
+    """Factor a number using either classical or quantum algorithm.
+
+    Composites go through a staged pipeline: trial division by sieved small
+    primes, perfect powers, Pollard-Brent rho and finally order finding.
+    When ``use_quantum`` is set the trial division and rho stages are
+    skipped, so order finding is what splits the number. ``stages`` in the
+    result records which stage found each split.
+
+    With ``parallel``, order finding attempts race across a process pool
+    (see find_factor_parallel). Raises FactorizationTimeout when the run
+    takes longer than ``time_budget`` seconds (FACTOR_TIME_BUDGET by default).
+    """
     if n <= 1:
         return {"error": "Input must be greater than 1"}
 
-    if sympy.isprime(n):
-        return {"result": "prime", "factors": [n]}
+    if numtheory.is_prime(n):
+        return {"result": "prime", "factors": [n], "stages": []}
 
-    # Choose the order finder based on the requested algorithm
-    # Note: classical_order_finder signature needs to match quantum one or be wrapped if we use the lambda below consistently
-    # The original code extracted order_finder and then wrapped it in a lambda inside find_factor.
+    time_budget = FACTOR_TIME_BUDGET if time_budget is None else time_budget
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    if use_quantum:
+        order_finder_func = functools.partial(
+            quantum_order_finder, method=method, deadline=deadline
+        )
+    else:
+        order_finder_func = functools.partial(classical_order_finder, deadline=deadline)
+    order_finder = functools.partial(
+        order_finder_func, shots=shots, noise_model=noise_model
+    )
+    factor_finder = find_factor_parallel if parallel else find_factor
 
-    # Correct approach:
-    # If use_quantum is True, we use quantum_order_finder.
-    # If False, classical_order_finder.
-    # But classical_order_finder doesn't take shots/noise_model in original, but let's make it consistent.
-    # I added shots/noise_model to classical_order_finder signature to match usage.
+    factors, stages, attempts = [], [], []
 
-    order_finder_func = quantum_order_finder if use_quantum else classical_order_finder
+    def split(m, factor, stage):
+        stages.append({"n": m, "factor": factor, "stage": stage})
 
-    # Find first factor
-    p = find_factor(
-        n, order_finder=lambda x, n: order_finder_func(x, n, shots, noise_model)
-    )
+    if not use_quantum:
+        found, cofactor = numtheory.trial_division(n, TRIAL_DIVISION_LIMIT)
+        for p, k in found.items():
+            factors.extend([p] * k)
+            split(n, p, "trial_division")
+        n = cofactor
 
-    if p is None:
-        return {"error": "Failed to find factors"}
+    pending = [n] if n > 1 else []
+    while pending:
+        m = pending.pop()
+        if numtheory.is_prime(m):
+            factors.append(m)
+            continue
+        numtheory.check_deadline(deadline)
 
-    q = n // p
+        power = numtheory.perfect_power(m)
+        if power is not None:
+            base, k = power
+            split(m, base, "perfect_power")
+            pending.extend([base] * k)
+            continue
 
-    # Check if the factors are prime, if not, factor them recursively
-    factors = []
-    for factor in [p, q]:
-        if sympy.isprime(factor):
-            factors.append(factor)
+        if m % 2 == 0:
+            p, stage = 2, "even"
         else:
-            subfactors = factor_number(
-                factor, use_quantum=use_quantum, shots=shots, noise_model=noise_model
-            )
-            if "factors" in subfactors:
-                factors.extend(subfactors["factors"])
+            p, stage = None, "pollard_brent"
+            if not use_quantum:
+                p = numtheory.pollard_brent(m, deadline=deadline)
+            if p is None:
+                stage = "order_finding"
+                p = factor_finder(
+                    m, order_finder=order_finder, attempts=attempts, deadline=deadline
+                )
+        if p is None:
+            return {"error": "Failed to find factors"}
 
-    return {"result": "composite", "factors": sorted(factors)}
+        split(m, p, stage)
+        pending.extend([p, m // p])
 
+    result = {"result": "composite", "factors": sorted(factors), "stages": stages}
+    if use_quantum:
+        result["quantum_details"] = summarize_attempts(attempts)
+    return result
 
-def create_circuit_from_json(circuit_json):
-    circuit_data = circuit_json
-    # pprint(circuit_data)
-    layout = circuit_data["circuit"]["layout"]
-    qubits = {
+
+def qubits_from_json(circuit_json):
+    """Maps layout qubit names to line qubits, in layout order."""
+    layout = circuit_json["circuit"]["layout"]
+    return {
         name: cirq.LineQubit(index)
         for index, name in enumerate(layout["qubits"].keys())
     }
-    circuit = cirq.Circuit()
 
-    for operation in circuit_data["circuit"]["operations"]:
-        gate_type = operation["type"]
-        targets = operation.get("targets", [])
-        control = operation.get(
-            "control"
-        )  # Extract control qubits for controlled gates
-        angle = operation.get("angle")  # Angle for CRZ gate
-
-        # Map target and control qubits to cirq qubits
-        target_qubits = [qubits.get(target) for target in targets]
-        control_qubits = (
-            [qubits.get(c) for c in control.split(",")] if control else []
-        )  # Handle multiple control qubits
-
-        # Validate qubits
-        if None in target_qubits or any(cq is None for cq in control_qubits):
+
+def operations_from_json(operation, qubits):
+    """Returns the cirq operations for one editor operation."""
+    ops = []
+    gate_type = operation["type"]
+    targets = operation.get("targets", [])
+    control = operation.get("control")  # Extract control qubits for controlled gates
+    angle = operation.get("angle")  # Angle for CRZ gate
+
+    # Map target and control qubits to cirq qubits
+    target_qubits = [qubits.get(target) for target in targets]
+    control_qubits = (
+        [qubits.get(c) for c in control.split(",")] if control else []
+    )  # Handle multiple control qubits
+
+    # Validate qubits
+    if None in target_qubits or any(cq is None for cq in control_qubits):
+        raise ValueError(f"Invalid target or control qubits in operation {operation}")
+
+    # Gate logic
+    if gate_type == "H":
+        for target in target_qubits:
+            ops.append(cirq.H(target))
+    elif gate_type == "MEASURE":
+        for target in target_qubits:
+            ops.append(cirq.measure(target, key=str(target)))
+    elif gate_type == "CNOT":
+        if len(control_qubits) == 1 and len(target_qubits) == 1:
+            ops.append(cirq.CNOT(control_qubits[0], target_qubits[0]))
+        else:
             raise ValueError(
-                f"Invalid target or control qubits in operation {operation}"
+                "CNOT gate requires one control qubit and one target qubit"
             )
+    elif gate_type == "SWAP":
+        if len(target_qubits) == 2:
+            target1, target2 = target_qubits
+            ops.append(cirq.SWAP(target1, target2))
+        else:
+            raise ValueError("SWAP gate requires exactly two target qubits")
+    elif gate_type == "X":
+        for target in target_qubits:
+            ops.append(cirq.X(target))
+    elif gate_type == "Y":
+        for target in target_qubits:
+            ops.append(cirq.Y(target))
+    elif gate_type == "Z":
+        for target in target_qubits:
+            ops.append(cirq.Z(target))
+    elif gate_type == "RX" and angle:
+        for target in target_qubits:
+            ops.append(cirq.rx(angle).on(target))
+    elif gate_type == "RY" and angle:
+        for target in target_qubits:
+            ops.append(cirq.ry(angle).on(target))
+    elif gate_type == "RZ" and angle:
+        for target in target_qubits:
+            ops.append(cirq.rz(angle).on(target))
+    elif gate_type == "CRZ":
+        if len(control_qubits) == 1 and len(target_qubits) == 1:
+            # Use the angle provided in the JSON
+            angle = operation.get("angle", 0)  # Default angle to 0 if not provided
+            ops.append(cirq.ControlledGate(cirq.Z)(control_qubits[0], target_qubits[0]))
+        else:
+            raise ValueError("CRZ gate requires one control qubit and one target qubit")
 
-        # Gate logic
-        if gate_type == "H":
-            for target in target_qubits:
-                circuit.append(cirq.H(target))
-        elif gate_type == "MEASURE":
-            for target in target_qubits:
-                circuit.append(cirq.measure(target, key=str(target)))
-        elif gate_type == "CNOT":
-            if len(control_qubits) == 1 and len(target_qubits) == 1:
-                circuit.append(cirq.CNOT(control_qubits[0], target_qubits[0]))
-            else:
-                raise ValueError(
-                    "CNOT gate requires one control qubit and one target qubit"
-                )
-        elif gate_type == "SWAP":
-            if len(target_qubits) == 2:
-                target1, target2 = target_qubits
-                circuit.append(cirq.SWAP(target1, target2))
-            else:
-                raise ValueError("SWAP gate requires exactly two target qubits")
-        elif gate_type == "X":
-            for target in target_qubits:
-                circuit.append(cirq.X(target))
-        elif gate_type == "Y":
-            for target in target_qubits:
-                circuit.append(cirq.Y(target))
-        elif gate_type == "Z":
-            for target in target_qubits:
-                circuit.append(cirq.Z(target))
-        elif gate_type == "RX" and angle:
-            for target in target_qubits:
-                circuit.append(cirq.rx(angle).on(target))
-        elif gate_type == "RY" and angle:
-            for target in target_qubits:
-                circuit.append(cirq.ry(angle).on(target))
-        elif gate_type == "RZ" and angle:
-            for target in target_qubits:
-                circuit.append(cirq.rz(angle).on(target))
-        elif gate_type == "CRZ":
-            if len(control_qubits) == 1 and len(target_qubits) == 1:
-                # Use the angle provided in the JSON
-                angle = operation.get("angle", 0)  # Default angle to 0 if not provided
-                circuit.append(
-                    cirq.ControlledGate(cirq.Z)(control_qubits[0], target_qubits[0])
-                )
-            else:
-                raise ValueError(
-                    "CRZ gate requires one control qubit and one target qubit"
-                )
-
-        elif gate_type == "CZ":
-            if len(control_qubits) == 1 and len(target_qubits) == 1:
-                circuit.append(cirq.CZ(control_qubits[0], target_qubits[0]))
-            else:
-                raise ValueError(
-                    "CZ gate requires one control qubit and one target qubit"
-                )
-        elif gate_type == "CY":
-            if len(control_qubits) == 1 and len(target_qubits) == 1:
-                # Simulate controlled Y gate (CNOT - Y - CNOT)
-                circuit.append(cirq.CNOT(control_qubits[0], target_qubits[0]))
-                circuit.append(cirq.Y(target_qubits[0]))
-                circuit.append(cirq.CNOT(control_qubits[0], target_qubits[0]))
-            else:
-                raise ValueError(
-                    "CY gate requires one control qubit and one target qubit"
-                )
+    elif gate_type == "CZ":
+        if len(control_qubits) == 1 and len(target_qubits) == 1:
+            ops.append(cirq.CZ(control_qubits[0], target_qubits[0]))
+        else:
+            raise ValueError("CZ gate requires one control qubit and one target qubit")
+    elif gate_type == "CY":
+        if len(control_qubits) == 1 and len(target_qubits) == 1:
+            # Simulate controlled Y gate (CNOT - Y - CNOT)
+            ops.append(cirq.CNOT(control_qubits[0], target_qubits[0]))
+            ops.append(cirq.Y(target_qubits[0]))
+            ops.append(cirq.CNOT(control_qubits[0], target_qubits[0]))
+        else:
+            raise ValueError("CY gate requires one control qubit and one target qubit")
 
-        elif gate_type == "CCX":
-            if len(control_qubits) == 2 and len(target_qubits) == 1:
-                circuit.append(
-                    cirq.CCX(control_qubits[0], control_qubits[1], target_qubits[0])
-                )
-            else:
-                raise ValueError(
-                    "CCX gate requires two control qubits and one target qubit"
-                )
-        elif gate_type == "CRX" and angle:
-            if len(control_qubits) == 1 and len(target_qubits) == 1:
-                circuit.append(cirq.CRX(angle).on(control_qubits[0], target_qubits[0]))
-            else:
-                raise ValueError(
-                    "CRX gate requires one control qubit and one target qubit"
+    elif gate_type == "CCX":
+        if len(control_qubits) == 2 and len(target_qubits) == 1:
+            ops.append(cirq.CCX(control_qubits[0], control_qubits[1], target_qubits[0]))
+        else:
+            raise ValueError(
+                "CCX gate requires two control qubits and one target qubit"
+            )
+    elif gate_type == "CRX" and angle:
+        if len(control_qubits) == 1 and len(target_qubits) == 1:
+            ops.append(
+                cirq.ControlledGate(cirq.rx(angle)).on(
+                    control_qubits[0], target_qubits[0]
                 )
-        elif gate_type == "CRY" and angle:
-            if len(control_qubits) == 1 and len(target_qubits) == 1:
-                circuit.append(cirq.CRY(angle).on(control_qubits[0], target_qubits[0]))
-            else:
-                raise ValueError(
-                    "CRY gate requires one control qubit and one target qubit"
+            )
+        else:
+            raise ValueError("CRX gate requires one control qubit and one target qubit")
+    elif gate_type == "CRY" and angle:
+        if len(control_qubits) == 1 and len(target_qubits) == 1:
+            ops.append(
+                cirq.ControlledGate(cirq.ry(angle)).on(
+                    control_qubits[0], target_qubits[0]
                 )
+            )
         else:
-            raise ValueError(f"Unsupported gate type: {gate_type}")
+            raise ValueError("CRY gate requires one control qubit and one target qubit")
+    else:
+        raise ValueError(f"Unsupported gate type: {gate_type}")
+
+    return ops
+
+
+def create_circuit_from_json(circuit_json):
+    qubits = qubits_from_json(circuit_json)
+    circuit = cirq.Circuit()
+
+    for operation in circuit_json["circuit"]["operations"]:
+        circuit.append(operations_from_json(operation, qubits))
 
     circuit.append(cirq.measure(*qubits.values(), key="result"))
     return circuit
@@ -383,6 +1060,7 @@ def process_fault_tolerance(data):
     protocol = data.get("protocol", "non_ft")
     syndrome_rounds = data.get("syndrome_rounds", 3)
     meas_error_prob = data.get("measurement_error_prob", 0.0)
+    noise_model = data.get("noise_model", "ideal")
 
     explanation = []
 
@@ -414,10 +1092,12 @@ def process_fault_tolerance(data):
     circuit_text = str(circuit)  # Cirq's built-in textual representation
     explanation.append("Circuit constructed successfully.")
 
-    simulator = cirq.Simulator()
-    result = simulator.run(circuit, repetitions=1)
+    result = run_with_noise(circuit, noise_model, 1)
     ideal_meas = result.measurements["result"][0].tolist()
-    explanation.append(f"Ideal measurement result: {ideal_meas}")
+    if noise_model in NOISE_CHANNELS:
+        explanation.append(f"Measurement result with {noise_model} noise: {ideal_meas}")
+    else:
+        explanation.append(f"Ideal measurement result: {ideal_meas}")
 
     final_meas = ideal_meas
     if protocol == "ft":
@@ -471,35 +1151,819 @@ def process_fault_tolerance(data):
     }
 
 
-def simulate_circuit(circuit):
-    simulator = cirq.Simulator()
-    return simulator.simulate(circuit)
+def _sweep_values(data, name, cast, default=None):
+    """Values of one sweep parameter: a single value, a list, or a range given
+    as {"start", "stop", "step"} (stop included) or {"start", "stop", "num"}."""
+    spec = data.get(name, default)
+    if spec is None:
+        raise ValueError(f"{name} is required")
+    if isinstance(spec, dict):
+        start, stop = float(spec["start"]), float(spec["stop"])
+        if "num" in spec:
+            values = np.linspace(start, stop, int(spec["num"]))
+        else:
+            step = float(spec.get("step", 1))
+            if step <= 0:
+                raise ValueError(f"{name} step must be positive")
+            values = np.arange(start, stop + step / 2, step)
+        spec = values.tolist()
+    elif not isinstance(spec, list):
+        spec = [spec]
+    if not spec:
+        raise ValueError(f"{name} must have at least one value")
+    return [cast(v) for v in spec]
+
+
+def process_fault_tolerance_sweep(data):
+    """Logical error rates of the repetition code over a parameter grid.
+
+    Sweeps every combination of num_qubits, physical_error_prob,
+    measurement_error_prob and syndrome_rounds (see _sweep_values) with
+    ``trials`` Monte-Carlo trials each, decoded like process_fault_tolerance
+    (see repetition.sample_failures). Each point reports the rate with a
+    Wilson interval at ``confidence``.
+    """
+    protocol = data.get("protocol", "ft")
+    if protocol not in ("ft", "non_ft"):
+        raise ValueError(f"Unknown protocol: {protocol}. Expected 'ft' or 'non_ft'")
+    qubit_counts = _sweep_values(data, "num_qubits", int, 3)
+    physical = _sweep_values(data, "physical_error_prob", float)
+    measurement = _sweep_values(data, "measurement_error_prob", float, 0.0)
+    rounds = _sweep_values(data, "syndrome_rounds", int, 3)
+    trials = int(data.get("trials", 100_000))
+    confidence = float(data.get("confidence", 0.95))
+    seed = data.get("seed")
+
+    if not all(1 <= q <= FAULT_TOLERANCE_MAX_QUBITS for q in qubit_counts):
+        raise ValueError(
+            f"num_qubits must be between 1 and {FAULT_TOLERANCE_MAX_QUBITS}"
+        )
+    if not all(0 <= p <= 1 for p in physical + measurement):
+        raise ValueError("Error probabilities must be between 0 and 1")
+    if not all(r >= 1 for r in rounds):
+        raise ValueError("syndrome_rounds must be a positive integer")
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be between 0 and 1")
+    grid = [
+        (q, p, m, r)
+        for q in qubit_counts
+        for p in physical
+        for m in measurement
+        for r in rounds
+    ]
+    if trials < 1 or trials * len(grid) > FAULT_TOLERANCE_MAX_TRIALS:
+        raise ValueError(
+            f"trials per point ({trials}) times sweep points ({len(grid)}) "
+            f"must be between 1 and {FAULT_TOLERANCE_MAX_TRIALS}"
+        )
+
+    rng = np.random.default_rng(None if seed is None else int(seed))
+    results = [
+        repetition.logical_error_rate(
+            q, p, m, r, trials, protocol=protocol, confidence=confidence, rng=rng
+        )
+        for q, p, m, r in grid
+    ]
+    return {
+        "protocol": protocol,
+        "confidence": confidence,
+        "trials": trials,
+        "results": results,
+    }
 
 
-def create_probability_plot(state_list):
-    prob_data = go.Bar(
-        x=[state["binary"] for state in state_list],
-        y=[state["probability"] for state in state_list],
-        name="Probability",
+def simulate_circuit(circuit, backend: str = "numpy", seed=None, qubit_order=None):
+    """Simulates a circuit with the in-house numpy engine or cirq.Simulator."""
+    if backend == "numpy":
+        return statevector.simulate(circuit, seed=seed, qubit_order=qubit_order)
+    if backend == "cirq":
+        simulator = cirq.Simulator(seed=seed)
+        return simulator.simulate(
+            circuit, qubit_order=qubit_order or cirq.QubitOrder.DEFAULT
+        )
+    raise ValueError(
+        f"Unknown simulator backend: {backend}. Expected one of {SIMULATOR_BACKENDS}"
     )
-    prob_layout = go.Layout(
-        title="State Probabilities", xaxis_title="State", yaxis_title="Probability"
+
+
+def circuit_key(circuit_data) -> str:
+    """Hashes the parts of circuit JSON that affect simulation.
+
+    Qubit order comes from the layout's key order, so it is kept as a list;
+    operation fields are sorted so formatting differences hash the same.
+    """
+    circuit = circuit_data["circuit"]
+    canonical = {
+        "qubits": list(circuit["layout"]["qubits"].keys()),
+        "operations": [_canonical_operation(op) for op in circuit["operations"]],
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _canonical_operation(operation):
+    return {
+        field: operation.get(field) for field in ("type", "targets", "control", "angle")
+    }
+
+
+def prefix_keys(circuit_data):
+    """Chained hashes where entry i identifies the first i operations."""
+    circuit = circuit_data["circuit"]
+    digest = hashlib.sha256(
+        json.dumps(list(circuit["layout"]["qubits"].keys())).encode("utf-8")
     )
-    prob_plot = go.Figure(data=[prob_data], layout=prob_layout)
-    return json.dumps(prob_plot, cls=plotly.utils.PlotlyJSONEncoder)
-
-
-def create_phase_plot(state_list):
-    phase_data = go.Scatterpolar(
-        r=[state["magnitude"] for state in state_list],
-        theta=[state["phase"] * 180 / np.pi for state in state_list],
-        mode="markers",
-        marker=dict(size=10),
-        text=[state["binary"] for state in state_list],
-        name="Phase",
+    keys = [digest.hexdigest()]
+    for operation in circuit["operations"]:
+        encoded = json.dumps(
+            _canonical_operation(operation), sort_keys=True, separators=(",", ":")
+        )
+        digest = hashlib.sha256((keys[-1] + encoded).encode("utf-8"))
+        keys.append(digest.hexdigest())
+    return keys
+
+
+def checkpoint_positions(start: int, length: int) -> list:
+    """Operation counts at which a simulation of ``length`` operations that
+    resumes at ``start`` stores checkpoints: the end, plus up to
+    CHECKPOINTS_PER_RUN stride boundaries CHECKPOINT_STRIDE, 2 * CHECKPOINT_STRIDE,
+    4 * CHECKPOINT_STRIDE, ... operations before it, so edits near the end
+    resume close to the edit."""
+    if length <= start:
+        return []
+    positions = {length}
+    distance = CHECKPOINT_STRIDE
+    for _ in range(CHECKPOINTS_PER_RUN):
+        position = (length - distance) // CHECKPOINT_STRIDE * CHECKPOINT_STRIDE
+        if position <= start:
+            break
+        positions.add(position)
+        distance *= 2
+    return sorted(positions)
+
+
+def simulate_prefix_incremental(circuit_data, qubits, gate_counts=None):
+    """Returns (pre-measurement state, reused operation count) for a circuit
+    without mid-circuit measurements, resuming from the longest cached prefix.
+
+    The uncached suffix is fused and compiled in one piece per interval
+    between checkpoint_positions (fused blocks must end at a checkpoint), so
+    appending a gate or editing one of the last few only simulates the new
+    suffix. If ``gate_counts`` is a dict, the cirq operations simulated are
+    counted into its "before" and "after" fusion entries.
+    """
+    operations = circuit_data["circuit"]["operations"]
+    keys = prefix_keys(circuit_data)
+    qubit_map = qubits_from_json(circuit_data)
+
+    start, state = 0, None
+    for i in range(len(operations), 0, -1):
+        checkpoint = simulation_checkpoint_cache.get(keys[i])
+        if checkpoint is not None:
+            start, state = i, checkpoint.copy()
+            break
+    if state is None:
+        state = statevector.ProductState(len(qubits))
+
+    rng = np.random.default_rng()
+    done = start
+    for stop in checkpoint_positions(start, len(operations)):
+        ops = [
+            op
+            for operation in operations[done:stop]
+            for op in operations_from_json(operation, qubit_map)
+        ]
+        fused = statevector.fuse_gates(ops)
+        if gate_counts is not None:
+            gate_counts["before"] = gate_counts.get("before", 0) + len(ops)
+            gate_counts["after"] = gate_counts.get("after", 0) + len(fused)
+        instructions, _ = statevector.compile_circuit(
+            cirq.Circuit(fused), qubits, fuse=False
+        )
+        statevector.run_instructions(state, instructions, rng)
+        done = stop
+        if state.nbytes <= CHECKPOINT_MAX_STATE_BYTES:
+            # The final state is not modified again, so it needs no copy.
+            checkpoint = state if done == len(operations) else state.copy()
+            simulation_checkpoint_cache.put(keys[done], checkpoint, size=state.nbytes)
+
+    return state.to_tensor().reshape(-1), start
+
+
+def state_vector_to_list(state_vector, indices=None):
+    """One dict per basis state, or per basis state in ``indices`` only."""
+    num_qubits = int(np.log2(max(len(state_vector), 1)))
+    if indices is None:
+        indices, amplitudes = range(len(state_vector)), state_vector
+    else:
+        indices, amplitudes = np.asarray(indices).tolist(), state_vector[indices]
+    return [
+        {
+            "index": i,
+            "binary": f"{i:0{num_qubits}b}",
+            "magnitude": float(abs(amplitude)),
+            "phase": float(np.angle(amplitude)),
+            "probability": float(abs(amplitude) ** 2),
+            "real": float(amplitude.real),
+            "imag": float(amplitude.imag),
+        }
+        for i, amplitude in zip(indices, amplitudes)
+    ]
+
+
+def _build_compiled_entry(circuit_data, backend):
+    circuit = create_circuit_from_json(circuit_data)
+    qubits = sorted(circuit.all_qubits())
+    # Simulations run on fused gates; "circuit" keeps the editor's gates for
+    # diagrams. gate_counts counts the operations that were simulated.
+    operations = list(circuit.all_operations())
+    entry = {"circuit": circuit, "qubits": qubits, "pre_state": None}
+    reused = 0
+    # create_circuit_from_json always ends with a measurement of every qubit;
+    # without other measurements the state before it is deterministic.
+    if any(cirq.is_measurement(op) for op in operations[:-1]):
+        # Simulated again for every request by _final_state.
+        fused = statevector.fuse_gates(operations)
+        entry["fused_circuit"] = cirq.Circuit(fused)
+        entry["gate_counts"] = {"before": len(operations), "after": len(fused)}
+    elif backend == "numpy":
+        gate_counts = {"before": 0, "after": 0}
+        entry["pre_state"], reused = simulate_prefix_incremental(
+            circuit_data, qubits, gate_counts
+        )
+        entry["gate_counts"] = gate_counts
+    else:
+        fused = statevector.fuse_gates(operations[:-1])
+        entry["pre_state"] = simulate_circuit(
+            cirq.Circuit(fused), backend=backend, qubit_order=qubits
+        ).final_state_vector
+        entry["gate_counts"] = {"before": len(operations) - 1, "after": len(fused)}
+    return entry, reused
+
+
+def _stabilizer_entry(key, circuit_data, backend):
+    """The cached tableau program for a circuit, or None if it should run dense.
+
+    Clifford-only circuits are routed here when the stabilizer backend is
+    requested or they are wider than STABILIZER_AUTO_QUBITS. The entry holds
+    the tableau before the final measurement when nothing else measures.
+    Returns (entry, reused operations) like _compiled_entry, or (None, 0).
+    """
+    if backend != "stabilizer":
+        if len(circuit_data["circuit"]["layout"]["qubits"]) <= STABILIZER_AUTO_QUBITS:
+            return None, 0
+    reused = len(circuit_data["circuit"]["operations"])
+    compiled = compiled_circuit_cache.get((key, "stabilizer"))
+    if compiled is None:
+        reused = 0
+        circuit = create_circuit_from_json(circuit_data)
+        qubits = sorted(circuit.all_qubits())
+        program = stabilizer.compile_circuit(circuit, qubits)
+        instructions = None if program is None else program[0]
+        compiled = {"circuit": circuit, "qubits": qubits, "instructions": instructions}
+        size = 200 * len(circuit_data["circuit"]["operations"])
+        if instructions is not None and not any(
+            inst.kind == "measure" for inst in instructions[:-1]
+        ):
+            tableau = stabilizer.StabilizerTableau(len(qubits))
+            stabilizer.run_instructions(
+                tableau, instructions[:-1], np.random.default_rng()
+            )
+            compiled["pre_tableau"] = tableau
+            size += tableau.nbytes
+        compiled_circuit_cache.put((key, "stabilizer"), compiled, size=size)
+    if compiled["instructions"] is None:
+        if backend == "stabilizer":
+            raise ValueError(
+                "The stabilizer backend only supports Clifford circuits "
+                "(H, X, Y, Z, CNOT, CZ, CY, SWAP and measurements)"
+            )
+        return None, 0
+    if "pre_tableau" not in compiled:
+        reused = 0
+    return compiled, reused
+
+
+def _run_stabilizer(compiled, shots, seed):
+    """Samples a compiled Clifford circuit.
+
+    Returns (stabilizer generators before the final measurement,
+    {measurement key: (shots, qubits) bits}). With a cached pre-measurement
+    tableau the shots are drawn from it directly; otherwise every shot is
+    its own run, and the generators are those of the first one.
+    """
+    rng = np.random.default_rng(seed)
+    instructions, n = compiled["instructions"], len(compiled["qubits"])
+    tableau = compiled.get("pre_tableau")
+    if tableau is not None:
+        return tableau.stabilizers(), {"result": tableau.sample(shots, rng)}
+
+    generators, shot_measurements = None, []
+    for _ in range(shots):
+        measurements = {}
+        tableau = stabilizer.run_instructions(
+            stabilizer.StabilizerTableau(n), instructions[:-1], rng, measurements
+        )
+        if generators is None:
+            generators = tableau.stabilizers()
+        stabilizer.run_instructions(tableau, instructions[-1:], rng, measurements)
+        shot_measurements.append(measurements)
+    samples = {
+        key: np.array([m[key] for m in shot_measurements])
+        for key in shot_measurements[0]
+    }
+    return generators, samples
+
+
+def _circuit_diagram(compiled) -> str:
+    """Text diagram of a compiled entry's circuit, drawn once per entry.
+
+    cirq's diagram drawer is quadratic in the circuit size and dominates
+    requests for wide circuits.
+    """
+    if "diagram" not in compiled:
+        compiled["diagram"] = compiled["circuit"].to_text_diagram(transpose=True)
+    return compiled["diagram"]
+
+
+def _compiled_entry(key, circuit_data, backend):
+    """The cached compiled entry for a circuit, built on a miss.
+
+    Returns (entry, reused) where reused counts the operations that did not
+    have to be simulated.
+    """
+    num_operations = len(circuit_data["circuit"]["operations"])
+    compiled = compiled_circuit_cache.get((key, backend))
+    if compiled is not None:
+        return compiled, num_operations
+    compiled, reused = _build_compiled_entry(circuit_data, backend)
+    size = 200 * num_operations
+    if compiled["pre_state"] is not None:
+        size += compiled["pre_state"].nbytes
+    compiled_circuit_cache.put((key, backend), compiled, size=size)
+    return compiled, reused
+
+
+def _sample_outcome(pre_state, seed) -> int:
+    """Samples the final measurement of all qubits from the pre-measurement state."""
+    probabilities = np.abs(pre_state.astype(np.complex128)) ** 2
+    rng = np.random.default_rng(seed)
+    return int(rng.choice(len(probabilities), p=probabilities / probabilities.sum()))
+
+
+def _final_state(compiled, outcome, backend, seed):
+    """State vector after the final measurement (outcome is None without pre_state)."""
+    pre_state = compiled["pre_state"]
+    if pre_state is None:
+        return simulate_circuit(
+            compiled["fused_circuit"],
+            backend=backend,
+            seed=seed,
+            qubit_order=compiled["qubits"],
+        ).final_state_vector
+    # Collapse onto the sampled outcome, keeping its phase like cirq does.
+    state_vector = np.zeros_like(pre_state)
+    amplitude = pre_state[outcome]
+    state_vector[outcome] = amplitude / abs(amplitude)
+    return state_vector
+
+
+def simulate_final_state(circuit_data, backend: str = "numpy", seed=None):
+    """Returns (circuit, state_vector) for an editor circuit, without a payload.
+
+    Shares the compiled-circuit cache with run_custom_simulation but builds
+    nothing besides the state vector itself.
+    """
+    if backend not in SIMULATOR_BACKENDS:
+        raise ValueError(
+            f"Unknown simulator backend: {backend}. Expected one of {SIMULATOR_BACKENDS}"
+        )
+    if backend == "stabilizer":
+        raise ValueError("The stabilizer backend does not produce a state vector")
+    compiled, _ = _compiled_entry(circuit_key(circuit_data), circuit_data, backend)
+    outcome = None
+    if compiled["pre_state"] is not None:
+        outcome = _sample_outcome(compiled["pre_state"], seed)
+    return compiled["circuit"], _final_state(compiled, outcome, backend, seed)
+
+
+def _state_payload(state_vector, qubits, options, circuit_data, distribution=None):
+    """The "state_vector", plot, selection and marginal entries of a payload.
+
+    ``options`` is (state_format, top_k, threshold, marginal_qubits) as
+    validated by run_custom_simulation. The selection and the marginal are
+    computed from ``distribution``, the probabilities the final measurement
+    was sampled from, when given, and from the state vector's own otherwise;
+    the state vector and plots always show ``state_vector`` at the selected
+    basis states. Returns (entries, estimated size).
+    """
+    state_format, top_k, threshold, marginal_qubits = options
+    num_qubits = len(qubits)
+    magnitude, phase, probability = state_columns(state_vector)
+    if distribution is None:
+        distribution = probability
+    indices = select_basis_states(distribution, top_k, threshold)
+    count = len(state_vector) if indices is None else len(indices)
+    if state_format == "list":
+        state = state_vector_to_list(state_vector, indices)
+        state_size = 400 * count
+    else:
+        state = state_vector_columns(
+            state_vector,
+            num_qubits,
+            (magnitude, phase, probability),
+            binary=state_format == "base64",
+            indices=indices,
+        )
+        state_size = (8 if state_format == "base64" else 25) * 6 * count
+    payload = {
+        "state_vector": state,
+        "prob_plot": create_probability_plot(probability, num_qubits, indices),
+        "phase_plot": create_phase_plot(magnitude, phase, num_qubits, indices),
+    }
+    if indices is not None:
+        payload["selection"] = {
+            "returned": count,
+            "total": len(state_vector),
+            "probability": float(distribution[indices].sum(dtype=np.float64)),
+        }
+    if marginal_qubits is not None:
+        layout_qubits = qubits_from_json(circuit_data)
+        positions = [qubits.index(layout_qubits[name]) for name in marginal_qubits]
+        marginal = marginal_probabilities(distribution, num_qubits, positions)
+        payload["marginal"] = {
+            "qubits": list(marginal_qubits),
+            "probability": marginal.tolist(),
+        }
+        payload["marginal_plot"] = create_probability_plot(
+            marginal, len(marginal_qubits)
+        )
+        state_size += 25 * len(marginal) + len(payload["marginal_plot"])
+    return payload, state_size
+
+
+def run_custom_simulation(
+    circuit_data,
+    backend: str = "numpy",
+    seed=None,
+    state_format: str = "list",
+    top_k: Optional[int] = None,
+    threshold: Optional[float] = None,
+    marginal_qubits=None,
+    shots: int = 1,
+):
+    """Builds and simulates an editor circuit, reusing cached work where possible.
+
+    Returns (circuit, payload). Circuits whose only measurement is the final
+    one are simulated once; each request then samples the final measurement
+    from the cached pre-measurement state, and payloads are cached per
+    outcome. Circuits with mid-circuit measurements are only cached when the
+    request supplies a seed. The payload's ``reused_operations`` counts the
+    operations that did not have to be simulated for this request, and
+    ``gate_counts`` the cirq operations simulated to build the cached
+    circuit, before and after statevector.fuse_gates merged them (only the
+    uncached suffix when the numpy path resumed from a checkpoint).
+
+    ``state_format`` (one of STATE_FORMATS) selects how the payload's
+    "state_vector" is encoded. ``top_k`` and ``threshold`` restrict the state
+    vector and plots to the most probable basis states (see
+    select_basis_states); ``marginal_qubits`` adds the "marginal"
+    distribution over those layout qubits, in the order given. Both use the
+    distribution of the final measurement, i.e. the state before it, while
+    the state vector is the one after it; with mid-circuit measurements they
+    describe the final state of the sampled run instead.
+
+    Clifford-only circuits may instead run on the stabilizer tableau (see
+    _stabilizer_entry). Their payload has "simulator": "stabilizer", the
+    "stabilizers" of the state before the final measurement and ``shots``
+    "measurements" per key as bit strings; the state vector, plots,
+    selection and marginal (all of the first shot's collapsed state, with
+    zero global phase) are only included up to STABILIZER_DENSE_MAX_QUBITS.
+    """
+    if backend not in SIMULATOR_BACKENDS:
+        raise ValueError(
+            f"Unknown simulator backend: {backend}. Expected one of {SIMULATOR_BACKENDS}"
+        )
+    if state_format not in STATE_FORMATS:
+        raise ValueError(
+            f"Unknown state format: {state_format}. Expected one of {STATE_FORMATS}"
+        )
+    if top_k is not None and top_k < 1:
+        raise ValueError("top_k must be a positive integer")
+    if threshold is not None and not 0 <= threshold <= 1:
+        raise ValueError("threshold must be between 0 and 1")
+    if marginal_qubits is not None:
+        marginal_qubits = tuple(marginal_qubits)
+        layout_qubits = qubits_from_json(circuit_data)
+        unknown = [name for name in marginal_qubits if name not in layout_qubits]
+        if unknown:
+            raise ValueError(f"Unknown marginal qubits: {unknown}")
+        if len(set(marginal_qubits)) != len(marginal_qubits):
+            raise ValueError("Marginal qubits must be distinct")
+    if not 1 <= shots <= MAX_SHOTS:
+        raise ValueError(f"shots must be between 1 and {MAX_SHOTS}")
+    options = (state_format, top_k, threshold, marginal_qubits)
+    key = circuit_key(circuit_data)
+    num_operations = len(circuit_data["circuit"]["operations"])
+    compiled, reused = _stabilizer_entry(key, circuit_data, backend)
+    if compiled is not None:
+        payload = _stabilizer_payload(compiled, circuit_data, options, shots, seed)
+        return compiled["circuit"], dict(payload, reused_operations=reused)
+    compiled, reused = _compiled_entry(key, circuit_data, backend)
+
+    circuit, pre_state = compiled["circuit"], compiled["pre_state"]
+    outcome = None
+    if pre_state is not None:
+        outcome = _sample_outcome(pre_state, seed)
+        payload_key = (key, backend, options, "outcome", outcome)
+    elif seed is not None:
+        payload_key = (key, backend, options, "seed", seed)
+    else:
+        payload_key = None
+
+    payload = simulation_payload_cache.get(payload_key) if payload_key else None
+    if payload is not None:
+        if pre_state is None:
+            reused = num_operations
+        return circuit, dict(payload, reused_operations=reused)
+
+    state_vector = _final_state(compiled, outcome, backend, seed)
+    distribution = None if pre_state is None else np.abs(pre_state) ** 2
+    entries, state_size = _state_payload(
+        state_vector, compiled["qubits"], options, circuit_data, distribution
+    )
+    payload = {
+        "state_vector": entries.pop("state_vector"),
+        "circuit": _circuit_diagram(compiled),
+        "gate_counts": compiled["gate_counts"],
+        **entries,
+    }
+    if payload_key is not None:
+        size = state_size + sum(
+            len(payload[k]) for k in ("circuit", "prob_plot", "phase_plot")
+        )
+        simulation_payload_cache.put(payload_key, payload, size=size)
+    if pre_state is None:
+        reused = 0
+    return circuit, dict(payload, reused_operations=reused)
+
+
+def _stabilizer_payload(compiled, circuit_data, options, shots, seed):
+    qubits = compiled["qubits"]
+    generators, samples = _run_stabilizer(compiled, shots, seed)
+    payload = {
+        "simulator": "stabilizer",
+        "circuit": _circuit_diagram(compiled),
+        "num_qubits": len(qubits),
+        "stabilizers": generators,
+        "measurements": {
+            key: ["".join(map(str, row)) for row in bits.tolist()]
+            for key, bits in samples.items()
+        },
+    }
+    if len(qubits) <= STABILIZER_DENSE_MAX_QUBITS:
+        outcome = int("".join(map(str, samples["result"][0].tolist())), 2)
+        state_vector = np.zeros(2 ** len(qubits), dtype=np.complex64)
+        state_vector[outcome] = 1
+        entries, _ = _state_payload(state_vector, qubits, options, circuit_data)
+        payload.update(entries)
+    return payload
+
+
+def simulation_cache_stats():
+    return {
+        "compiled": compiled_circuit_cache.stats(),
+        "payload": simulation_payload_cache.stats(),
+        "checkpoints": simulation_checkpoint_cache.stats(),
+    }
+
+
+def state_columns(state_vector):
+    """Vectorized (magnitude, phase, probability) arrays of a state vector.
+
+    Uses the amplitudes' own precision, like the per-state abs/np.angle of
+    state_vector_to_list; values can differ from it in the last bit.
+    """
+    magnitude = np.hypot(state_vector.real, state_vector.imag)
+    phase = np.angle(state_vector)
+    return magnitude, phase, magnitude**2
+
+
+def select_basis_states(probability, top_k=None, threshold=None):
+    """Indices, in ascending order, of the basis states worth returning.
+
+    Keeps the states with probability >= threshold and, of those, the top_k
+    most probable ones (ties broken arbitrarily). Returns None when neither
+    option is set, meaning every basis state.
+    """
+    if top_k is None and threshold is None:
+        return None
+    if threshold is not None:
+        indices = np.flatnonzero(probability >= threshold)
+    else:
+        indices = np.arange(len(probability))
+    if top_k is not None and top_k < len(indices):
+        kept = np.argpartition(probability[indices], len(indices) - top_k)
+        indices = np.sort(indices[kept[len(indices) - top_k :]])
+    return indices
+
+
+def marginal_probabilities(probability, num_qubits: int, positions):
+    """Marginal distribution over the qubits at ``positions`` (in that order).
+
+    The probabilities are viewed as a (2,) * num_qubits tensor, big-endian
+    like cirq's qubit order, and summed over every other axis. Entry i of the
+    result is the probability that those qubits read i in binary, the first
+    position being the most significant bit.
+    """
+    tensor = probability.reshape((2,) * num_qubits)
+    others = tuple(axis for axis in range(num_qubits) if axis not in positions)
+    marginal = tensor.sum(axis=others, dtype=np.float64)
+    # The summed tensor keeps the remaining axes in ascending order.
+    remaining = sorted(positions)
+    return marginal.transpose([remaining.index(p) for p in positions]).reshape(-1)
+
+
+def _iter_state_chunks(state_vector, start, stop, chunk_size):
+    """JSON objects (as in state_vector_to_list) for [start, stop), chunk by chunk.
+
+    Only one chunk of columns and strings exists at a time, on top of the
+    state vector itself.
+    """
+    num_qubits = int(np.log2(max(len(state_vector), 1)))
+    for lo in range(start, stop, chunk_size):
+        hi = min(lo + chunk_size, stop)
+        chunk = state_vector[lo:hi]
+        magnitude, phase, probability = state_columns(chunk)
+        yield [
+            json.dumps(
+                {
+                    "index": i,
+                    "binary": f"{i:0{num_qubits}b}",
+                    "magnitude": m,
+                    "phase": ph,
+                    "probability": p,
+                    "real": re,
+                    "imag": im,
+                }
+            )
+            for i, m, ph, p, re, im in zip(
+                range(lo, hi),
+                magnitude.tolist(),
+                phase.tolist(),
+                probability.tolist(),
+                chunk.real.tolist(),
+                chunk.imag.tolist(),
+            )
+        ]
+
+
+def _stream_range(state_vector, start, stop):
+    total = len(state_vector)
+    stop = total if stop is None else min(stop, total)
+    if not 0 <= start <= stop:
+        raise ValueError(f"Invalid basis state range [{start}, {stop}) of {total}")
+    header = {
+        "num_qubits": int(np.log2(max(total, 1))),
+        "total": total,
+        "start": start,
+        "stop": stop,
+    }
+    return header, stop
+
+
+def iter_state_ndjson(state_vector, start=0, stop=None, chunk_size=None):
+    """Streams basis states [start, stop) as NDJSON.
+
+    The first line is a header with num_qubits, total, start and stop; each
+    following line is one basis state in the state_vector_to_list format.
+    The range is checked before the generator is returned.
+    """
+    header, stop = _stream_range(state_vector, start, stop)
+    chunk_size = chunk_size or STREAM_CHUNK_STATES
+
+    def generate():
+        yield (json.dumps(header) + "\n").encode()
+        for lines in _iter_state_chunks(state_vector, start, stop, chunk_size):
+            yield ("\n".join(lines) + "\n").encode()
+
+    return generate()
+
+
+def iter_state_json(state_vector, start=0, stop=None, chunk_size=None):
+    """Streams basis states [start, stop) as one JSON document.
+
+    The document is the iter_state_ndjson header with the states in a
+    "states" list, written out chunk by chunk.
+    """
+    header, stop = _stream_range(state_vector, start, stop)
+    chunk_size = chunk_size or STREAM_CHUNK_STATES
+
+    def generate():
+        yield (json.dumps(header)[:-1] + ', "states": [').encode()
+        separator = ""
+        for lines in _iter_state_chunks(state_vector, start, stop, chunk_size):
+            yield (separator + ", ".join(lines)).encode()
+            separator = ", "
+        yield b"]}"
+
+    return generate()
+
+
+def _encode_float32(values) -> str:
+    """Base64 of the values as little-endian float32."""
+    return base64.b64encode(np.asarray(values, dtype="<f4").tobytes()).decode("ascii")
+
+
+def state_vector_columns(
+    state_vector, num_qubits, columns=None, binary=False, indices=None
+):
+    """Columnar form of a state vector: one array per field of state_vector_to_list.
+
+    Entry i of every array describes basis state i, so "index" and "binary"
+    are implied by the position. With ``binary`` each array is a base64
+    string of little-endian float32 values instead of a JSON list.
+    ``columns`` may pass in an existing state_columns(state_vector) result.
+
+    With ``indices`` only those basis states are included, and an "index"
+    list (always plain JSON) gives the basis state of each entry.
+    """
+    magnitude, phase, probability = columns or state_columns(state_vector)
+    arrays = {
+        "magnitude": magnitude,
+        "phase": phase,
+        "probability": probability,
+        "real": state_vector.real,
+        "imag": state_vector.imag,
+    }
+    state = {"format": "base64" if binary else "columnar", "num_qubits": num_qubits}
+    if indices is not None:
+        arrays = {name: a[indices] for name, a in arrays.items()}
+        state["index"] = indices.tolist()
+    if binary:
+        state["dtype"] = "<f4"
+        state.update((name, _encode_float32(a)) for name, a in arrays.items())
+    else:
+        state.update((name, a.tolist()) for name, a in arrays.items())
+    return state
+
+
+@functools.lru_cache(maxsize=4)
+def _basis_labels_json(num_qubits: int) -> str:
+    """JSON list of the basis state labels "00...0" to "11...1"."""
+    return json.dumps([f"{i:0{num_qubits}b}" for i in range(2**num_qubits)])
+
+
+def _labels_json(num_qubits: int, indices=None) -> str:
+    if indices is None:
+        return _basis_labels_json(num_qubits)
+    return json.dumps([f"{i:0{num_qubits}b}" for i in indices.tolist()])
+
+
+@functools.lru_cache(maxsize=None)
+def _figure_layout_json(kind: str) -> str:
+    """Serialized layout (with the default template) of the probability or phase plot."""
+    if kind == "probability":
+        layout = go.Layout(
+            title="State Probabilities", xaxis_title="State", yaxis_title="Probability"
+        )
+    else:
+        layout = go.Layout(
+            title="State Phases",
+            polar=dict(radialaxis=dict(visible=True, range=[0, 1])),
+        )
+    figure = go.Figure(layout=layout)
+    return json.dumps(
+        figure.to_plotly_json()["layout"], cls=plotly.utils.PlotlyJSONEncoder
     )
-    phase_layout = go.Layout(
-        title="State Phases", polar=dict(radialaxis=dict(visible=True, range=[0, 1]))
+
+
+def create_probability_plot(probability, num_qubits: int, indices=None) -> str:
+    """Plotly bar chart JSON of the state probabilities (only ``indices``, if given).
+
+    Written directly from the arrays instead of through graph_objs
+    validation; keys, key order and layout (including the default template)
+    are the ones go.Figure(...) with PlotlyJSONEncoder produces.
+    """
+    labels = _labels_json(num_qubits, indices)
+    if indices is not None:
+        probability = probability[indices]
+    values = json.dumps(probability.tolist())
+    return (
+        f'{{"data": [{{"name": "Probability", "x": {labels}, "y": {values}, '
+        f'"type": "bar"}}], "layout": {_figure_layout_json("probability")}}}'
+    )
+
+
+def create_phase_plot(magnitude, phase, num_qubits: int, indices=None) -> str:
+    """Plotly polar scatter JSON of amplitude magnitudes and phases (in degrees)."""
+    labels = _labels_json(num_qubits, indices)
+    if indices is not None:
+        magnitude, phase = magnitude[indices], phase[indices]
+    r = json.dumps(magnitude.tolist())
+    theta = json.dumps((phase.astype(np.float64) * 180 / np.pi).tolist())
+    return (
+        f'{{"data": [{{"marker": {{"size": 10}}, "mode": "markers", "name": "Phase", '
+        f'"r": {r}, "text": {labels}, "theta": {theta}, "type": "scatterpolar"}}], '
+        f'"layout": {_figure_layout_json("phase")}}}'
     )
-    phase_plot = go.Figure(data=[phase_data], layout=phase_layout)
-    return json.dumps(phase_plot, cls=plotly.utils.PlotlyJSONEncoder)
@@ -0,0 +1,105 @@
+import math
+import os
+from statistics import NormalDist
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Memory budget of each per-qubit temporary array of a batch of trials (the
+# float64 uniforms and int64 flip counts are the widest).
+CHUNK_BYTES = int(os.environ.get("FAULT_TOLERANCE_CHUNK_BYTES", 16 * 2**20))
+
+
+def chunk_trials(num_qubits: int) -> int:
+    """Trials per batch so that a (trials, num_qubits) array of 8-byte items
+    fits in CHUNK_BYTES. The syndrome rounds are drawn as one binomial count
+    per qubit, so they do not add a dimension."""
+    return max(1, CHUNK_BYTES // (8 * max(num_qubits, 1)))
+
+
+def sample_failures(
+    num_qubits: int,
+    physical_error_prob: float,
+    measurement_error_prob: float,
+    syndrome_rounds: int,
+    trials: int,
+    protocol: str = "ft",
+    rng: Optional[np.random.Generator] = None,
+) -> Tuple[int, int]:
+    """Monte-Carlo trials of the repetition code of process_fault_tolerance.
+
+    Each trial encodes a random logical bit, flips every qubit with
+    probability ``physical_error_prob`` and decodes like the "ft" protocol:
+    ``syndrome_rounds`` readouts, each bit flipped with probability
+    ``measurement_error_prob``, a per-qubit majority vote (ties read 0) and a
+    majority vote over the qubits (ties fail). "non_ft" reads the qubits
+    once, without measurement errors. Returns (failures, ties).
+    """
+    rng = rng or np.random.default_rng()
+    failures = ties = 0
+    chunk = chunk_trials(num_qubits)
+    for start in range(0, trials, chunk):
+        size = min(chunk, trials - start)
+        secret = rng.random(size) < 0.5
+        data = secret[:, None] ^ (rng.random((size, num_qubits)) < physical_error_prob)
+        if protocol == "ft":
+            # Only the number of flipped readouts per qubit matters to the
+            # vote, so the rounds are drawn as one binomial count each.
+            flips = rng.binomial(syndrome_rounds, measurement_error_prob, data.shape)
+            ones = np.where(data, syndrome_rounds - flips, flips)
+            votes = 2 * ones > syndrome_rounds
+        else:
+            votes = data
+        total = np.count_nonzero(votes, axis=1)
+        tie = 2 * total == num_qubits
+        failures += int(np.count_nonzero(tie | ((2 * total > num_qubits) != secret)))
+        ties += int(np.count_nonzero(tie))
+    return failures, ties
+
+
+def wilson_interval(
+    failures: int, trials: int, confidence: float
+) -> Tuple[float, float]:
+    """Wilson score interval for a binomial proportion."""
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    rate = failures / trials
+    denominator = 1 + z**2 / trials
+    center = (rate + z**2 / (2 * trials)) / denominator
+    half_width = (
+        z * math.sqrt(rate * (1 - rate) / trials + z**2 / (4 * trials**2)) / denominator
+    )
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def logical_error_rate(
+    num_qubits: int,
+    physical_error_prob: float,
+    measurement_error_prob: float,
+    syndrome_rounds: int,
+    trials: int,
+    protocol: str = "ft",
+    confidence: float = 0.95,
+    rng: Optional[np.random.Generator] = None,
+) -> Dict:
+    """One sweep point: the sampled logical error rate and its confidence interval."""
+    failures, ties = sample_failures(
+        num_qubits,
+        physical_error_prob,
+        measurement_error_prob,
+        syndrome_rounds,
+        trials,
+        protocol,
+        rng,
+    )
+    low, high = wilson_interval(failures, trials, confidence)
+    return {
+        "num_qubits": num_qubits,
+        "physical_error_prob": physical_error_prob,
+        "measurement_error_prob": measurement_error_prob,
+        "syndrome_rounds": syndrome_rounds,
+        "trials": trials,
+        "failures": failures,
+        "ties": ties,
+        "logical_error_rate": failures / trials,
+        "confidence_interval": [low, high],
+    }
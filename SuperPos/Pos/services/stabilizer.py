@@ -0,0 +1,253 @@
+import cirq
+import numpy as np
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class Instruction(NamedTuple):
+    """A single compiled step applied to the tableau."""
+
+    kind: str  # "h", "s", "x", "y", "z", "cnot", "cz", "swap" or "measure"
+    targets: Tuple[int, ...]
+    key: Optional[str] = None
+
+
+_PAULI_GATES = {cirq.X: "x", cirq.Y: "y", cirq.Z: "z", cirq.H: "h", cirq.S: "s"}
+
+
+def _clifford_steps(gate) -> Optional[List[Tuple[str, Tuple[int, ...]]]]:
+    """Tableau steps (kind, operand positions) for a gate, or None if unknown."""
+    if gate in _PAULI_GATES:
+        return [(_PAULI_GATES[gate], (0,))]
+    if gate == cirq.S**-1:
+        return [("s", (0,)), ("z", (0,))]
+    if gate == cirq.CNOT:
+        return [("cnot", (0, 1))]
+    if gate == cirq.CZ:
+        return [("cz", (0, 1))]
+    if gate == cirq.SWAP:
+        return [("swap", (0, 1))]
+    if isinstance(gate, cirq.ControlledGate) and gate.num_controls() == 1:
+        if gate != cirq.ControlledGate(gate.sub_gate):
+            return None
+        if gate.sub_gate == cirq.X:
+            return [("cnot", (0, 1))]
+        if gate.sub_gate == cirq.Z:
+            return [("cz", (0, 1))]
+        if gate.sub_gate == cirq.Y:
+            # CY = S_t CNOT S_t^dagger
+            return [("s", (1,)), ("z", (1,)), ("cnot", (0, 1)), ("s", (1,))]
+    return None
+
+
+def compile_circuit(
+    circuit: cirq.Circuit, qubit_order: Optional[Sequence[cirq.Qid]] = None
+) -> Optional[Tuple[List[Instruction], List[cirq.Qid]]]:
+    """Lowers a Clifford circuit into tableau instructions.
+
+    Returns None when the circuit contains anything besides H, S, Paulis,
+    CNOT, CZ, CY, SWAP and plain measurements, so callers can use the result
+    both to detect Clifford circuits and to simulate them.
+    """
+    qubits = (
+        list(qubit_order) if qubit_order is not None else sorted(circuit.all_qubits())
+    )
+    axis = {q: i for i, q in enumerate(qubits)}
+    instructions = []
+    for op in circuit.all_operations():
+        axes = tuple(axis[q] for q in op.qubits)
+        if cirq.is_measurement(op):
+            gate = op.gate
+            if not isinstance(gate, cirq.MeasurementGate) or any(
+                gate.full_invert_mask()
+            ):
+                return None
+            instructions.append(
+                Instruction("measure", axes, key=cirq.measurement_key_name(op))
+            )
+            continue
+        steps = _clifford_steps(op.gate)
+        if steps is None:
+            return None
+        for kind, operands in steps:
+            instructions.append(Instruction(kind, tuple(axes[i] for i in operands)))
+    return instructions, qubits
+
+
+def _g_sum(x1, z1, x2, z2) -> np.ndarray:
+    """Sum over qubits of the CHP phase exponent g for multiplying Paulis 1 * 2.
+
+    Accepts a single row for 1 and many rows for 2 (or vice versa); the sum
+    runs over the last axis.
+    """
+    x1, z1 = x1.astype(np.int8), z1.astype(np.int8)
+    x2, z2 = x2.astype(np.int8), z2.astype(np.int8)
+    g = (
+        x1 * z1 * (z2 - x2)
+        + x1 * (1 - z1) * z2 * (2 * x2 - 1)
+        + (1 - x1) * z1 * x2 * (1 - 2 * z2)
+    )
+    return g.sum(axis=-1, dtype=np.int64)
+
+
+class StabilizerTableau:
+    """Aaronson-Gottesman (CHP) tableau of an n-qubit stabilizer state.
+
+    Rows 0..n-1 are the destabilizers and rows n..2n-1 the stabilizer
+    generators; row i is the Pauli product with X part x[i], Z part z[i] and
+    sign (-1)**r[i]. Gates update whole columns at once, so each costs O(n)
+    and a measurement O(n**2), instead of the 2**n of a statevector.
+    """
+
+    def __init__(self, num_qubits: int):
+        self.num_qubits = num_qubits
+        eye = np.eye(num_qubits, dtype=bool)
+        zero = np.zeros((num_qubits, num_qubits), dtype=bool)
+        self.x = np.vstack([eye, zero])
+        self.z = np.vstack([zero, eye])
+        self.r = np.zeros(2 * num_qubits, dtype=bool)
+
+    def copy(self) -> "StabilizerTableau":
+        other = StabilizerTableau(0)
+        other.num_qubits = self.num_qubits
+        other.x, other.z, other.r = self.x.copy(), self.z.copy(), self.r.copy()
+        return other
+
+    @property
+    def nbytes(self) -> int:
+        return self.x.nbytes + self.z.nbytes + self.r.nbytes
+
+    def h(self, a: int) -> None:
+        self.r ^= self.x[:, a] & self.z[:, a]
+        self.x[:, a], self.z[:, a] = self.z[:, a].copy(), self.x[:, a].copy()
+
+    def s(self, a: int) -> None:
+        self.r ^= self.x[:, a] & self.z[:, a]
+        self.z[:, a] ^= self.x[:, a]
+
+    def cnot(self, a: int, b: int) -> None:
+        x, z = self.x, self.z
+        self.r ^= x[:, a] & z[:, b] & ~(x[:, b] ^ z[:, a])
+        x[:, b] ^= x[:, a]
+        z[:, a] ^= z[:, b]
+
+    def cz(self, a: int, b: int) -> None:
+        self.h(b)
+        self.cnot(a, b)
+        self.h(b)
+
+    def swap(self, a: int, b: int) -> None:
+        self.x[:, [a, b]] = self.x[:, [b, a]]
+        self.z[:, [a, b]] = self.z[:, [b, a]]
+
+    def pauli(self, kind: str, a: int) -> None:
+        # A Pauli flips the sign of every row it anticommutes with.
+        if kind == "x":
+            self.r ^= self.z[:, a]
+        elif kind == "z":
+            self.r ^= self.x[:, a]
+        else:
+            self.r ^= self.x[:, a] ^ self.z[:, a]
+
+    def measure(self, a: int, rng: np.random.Generator) -> int:
+        """Measures qubit a in the Z basis, updating the tableau in place."""
+        n = self.num_qubits
+        x, z, r = self.x, self.z, self.r
+        anticommuting = np.flatnonzero(x[n:, a])
+        if len(anticommuting):
+            # Random outcome: multiply stabilizer p into every other row that
+            # anticommutes with Z_a, then replace it with +-Z_a.
+            p = n + anticommuting[0]
+            rows = np.flatnonzero(x[:, a])
+            rows = rows[rows != p]
+            phase = 2 * r[rows] + 2 * r[p] + _g_sum(x[p], z[p], x[rows], z[rows])
+            r[rows] = phase % 4 == 2
+            x[rows] ^= x[p]
+            z[rows] ^= z[p]
+            x[p - n], z[p - n], r[p - n] = x[p], z[p], r[p]
+            outcome = int(rng.integers(2))
+            x[p], z[p] = False, False
+            z[p, a] = True
+            r[p] = outcome
+            return outcome
+
+        # Deterministic outcome: Z_a is (+-) the product of the stabilizers
+        # whose destabilizers anticommute with it. Each factor is multiplied
+        # into the running product of the ones before it, so the phases of
+        # all steps come from one vectorized pass over the prefix products.
+        rows = n + np.flatnonzero(x[:n, a])
+        prefix_x = np.logical_xor.accumulate(x[rows], axis=0)
+        prefix_z = np.logical_xor.accumulate(z[rows], axis=0)
+        prefix_x = np.vstack([np.zeros((1, n), dtype=bool), prefix_x[:-1]])
+        prefix_z = np.vstack([np.zeros((1, n), dtype=bool), prefix_z[:-1]])
+        phase = 2 * int(np.count_nonzero(r[rows]))
+        phase += int(_g_sum(x[rows], z[rows], prefix_x, prefix_z).sum())
+        return int(phase % 4 == 2)
+
+    def stabilizers(self) -> List[str]:
+        """The stabilizer generators as signed Pauli strings, e.g. "+XX"."""
+        n = self.num_qubits
+        letters = np.array(list("IXZY"))[self.x[n:] + 2 * self.z[n:].astype(np.int8)]
+        return [
+            ("-" if sign else "+") + "".join(row)
+            for sign, row in zip(self.r[n:].tolist(), letters)
+        ]
+
+    def sample(self, shots: int, rng: np.random.Generator) -> np.ndarray:
+        """Samples Z-basis measurements of all qubits without disturbing the state.
+
+        The outcomes of a stabilizer state are uniform over b0 + V, where b0
+        is any possible outcome and V is spanned by the X parts of the
+        stabilizer generators; b0 comes from measuring a copy, V from
+        Gaussian elimination. Returns a (shots, n) uint8 array.
+        """
+        n = self.num_qubits
+        probe = self.copy()
+        b0 = np.array([probe.measure(a, rng) for a in range(n)], dtype=np.uint8)
+        basis = _row_basis(self.x[n:])
+        flips = rng.integers(2, size=(shots, len(basis)), dtype=np.uint8)
+        return (b0 ^ (flips.astype(np.int64) @ basis % 2)).astype(np.uint8)
+
+
+def _row_basis(rows: np.ndarray) -> np.ndarray:
+    """A basis of the GF(2) row space of a bool matrix, as a uint8 matrix."""
+    rows = rows.copy()
+    basis = []
+    for column in range(rows.shape[1]):
+        pivots = np.flatnonzero(rows[:, column])
+        if not len(pivots):
+            continue
+        pivot = rows[pivots[0]].copy()
+        basis.append(pivot)
+        rows[pivots] ^= pivot
+    if not basis:
+        return np.zeros((0, rows.shape[1]), dtype=np.uint8)
+    return np.array(basis, dtype=np.uint8)
+
+
+def run_instructions(
+    tableau: StabilizerTableau,
+    instructions: Sequence[Instruction],
+    rng: np.random.Generator,
+    measurements: Optional[Dict[str, np.ndarray]] = None,
+) -> StabilizerTableau:
+    """Applies compiled instructions to a tableau in place."""
+    for inst in instructions:
+        if inst.kind == "h":
+            tableau.h(*inst.targets)
+        elif inst.kind == "s":
+            tableau.s(*inst.targets)
+        elif inst.kind in ("x", "y", "z"):
+            tableau.pauli(inst.kind, *inst.targets)
+        elif inst.kind == "cnot":
+            tableau.cnot(*inst.targets)
+        elif inst.kind == "cz":
+            tableau.cz(*inst.targets)
+        elif inst.kind == "swap":
+            tableau.swap(*inst.targets)
+        elif inst.kind == "measure":
+            bits = np.array([tableau.measure(a, rng) for a in inst.targets], np.uint8)
+            if measurements is not None:
+                measurements[inst.key] = bits
+        else:
+            raise ValueError(f"Unknown instruction kind: {inst.kind}")
+    return tableau
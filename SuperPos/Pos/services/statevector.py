@@ -0,0 +1,653 @@
+import functools
+import itertools
+
+import cirq
+import numpy as np
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class Instruction(NamedTuple):
+    """A single compiled step applied to the statevector tensor."""
+
+    kind: str  # "matrix", "diagonal", "swap" or "measure"
+    targets: Tuple[int, ...]
+    controls: Tuple[int, ...] = ()
+    matrix: Optional[np.ndarray] = None
+    key: Optional[str] = None
+
+
+class StatevectorResult:
+    """Mirrors the parts of cirq.StateVectorTrialResult used by the views."""
+
+    def __init__(self, state: np.ndarray, qubits, measurements: Dict[str, np.ndarray]):
+        self._state = state
+        self.qubits = tuple(qubits)
+        self.measurements = measurements
+
+    @property
+    def final_state_vector(self) -> np.ndarray:
+        return self._state.reshape(-1)
+
+
+_X = np.array([[0, 1], [1, 0]], dtype=np.complex128)
+_Z = np.array([[1, 0], [0, -1]], dtype=np.complex128)
+
+
+def _controlled_parts(gate) -> Optional[Tuple[int, np.ndarray]]:
+    """Returns (num_controls, target matrix) for the controlled gates we know."""
+    if gate == cirq.CNOT:
+        return 1, _X
+    if gate == cirq.CZ:
+        return 1, _Z
+    if gate == cirq.CCX:
+        return 2, _X
+    if gate == cirq.CCZ:
+        return 2, _Z
+    if isinstance(gate, cirq.ControlledGate):
+        plain = cirq.ControlledGate(gate.sub_gate, num_controls=gate.num_controls())
+        if gate != plain or cirq.num_qubits(gate.sub_gate) != 1:
+            return None
+        if not cirq.has_unitary(gate.sub_gate):
+            return None
+        return gate.num_controls(), cirq.unitary(gate.sub_gate)
+    return None
+
+
+class PhaseVectorGate(cirq.Gate):
+    """Diagonal unitary given by its (2,) * k tensor of phases.
+
+    Produced by fuse_diagonal_operations; applying it is one elementwise
+    multiply, in cirq.Simulator (via _apply_unitary_) and in this engine.
+    """
+
+    def __init__(self, phases: np.ndarray, num_fused: int = 0):
+        self.phases = phases
+        self.num_fused = num_fused
+
+    def _num_qubits_(self) -> int:
+        return self.phases.ndim
+
+    def _has_unitary_(self) -> bool:
+        return True
+
+    def _apply_unitary_(self, args: cirq.ApplyUnitaryArgs):
+        tensor = args.target_tensor
+        k = self.phases.ndim
+        phases = self.phases.astype(tensor.dtype, copy=False)
+        expanded = phases.reshape(phases.shape + (1,) * (tensor.ndim - k))
+        tensor *= np.moveaxis(expanded, tuple(range(k)), args.axes)
+        return tensor
+
+    def _circuit_diagram_info_(self, args):
+        k = self.phases.ndim
+        return cirq.CircuitDiagramInfo(
+            wire_symbols=(f"Diag[{self.num_fused}]",) + ("#",) * (k - 1)
+        )
+
+
+_MAX_DIAGONAL_CHECK_QUBITS = 3
+
+PhaseTerms = Tuple[Tuple[Tuple[int, ...], float], ...]
+
+
+@functools.lru_cache(maxsize=256)
+def _gate_phase_terms(gate: cirq.Gate) -> Optional[PhaseTerms]:
+    """The phase angles of a diagonal gate as a multilinear polynomial in its
+    operand bits: (operand positions S, coefficient of prod_{i in S} b_i)
+    pairs. None if the gate is not diagonal.
+    """
+    if cirq.num_qubits(gate) > _MAX_DIAGONAL_CHECK_QUBITS or not cirq.has_unitary(gate):
+        return None
+    matrix = cirq.unitary(gate)
+    if np.any(matrix - np.diag(np.diag(matrix))):
+        return None
+    # Moebius transform: differences along each axis give the coefficient of
+    # every product of bits.
+    coefficients = np.angle(np.diag(matrix)).reshape((2,) * cirq.num_qubits(gate))
+    for i in range(coefficients.ndim):
+        coefficients = np.moveaxis(coefficients, i, 0)
+        coefficients = np.stack([coefficients[0], coefficients[1] - coefficients[0]])
+        coefficients = np.moveaxis(coefficients, 0, i)
+    return tuple(
+        (tuple(np.flatnonzero(bits)), float(coefficients[bits]))
+        for bits in itertools.product((0, 1), repeat=coefficients.ndim)
+        if coefficients[bits]
+    )
+
+
+def _phase_terms(op: cirq.Operation) -> Optional[PhaseTerms]:
+    """_gate_phase_terms of a plain gate operation, None for anything else."""
+    gate = op.gate
+    if gate is None or cirq.is_measurement(op):
+        return None
+    try:
+        return _gate_phase_terms(gate)
+    except TypeError:  # unhashable gate
+        return _gate_phase_terms.__wrapped__(gate)
+
+
+def is_diagonal(op: cirq.Operation) -> bool:
+    """True for unitary operations of up to three qubits with a diagonal matrix."""
+    return isinstance(op.gate, PhaseVectorGate) or _phase_terms(op) is not None
+
+
+def _linear_phases(weights: np.ndarray) -> np.ndarray:
+    """The (2,) * k tensor of exp(i * sum_j weights[j] * b_j).
+
+    It factors into one [1, exp(i w)] per bit, so it is built by outer
+    products in O(2**k) multiplies without exponentiating the full tensor.
+    """
+    tensor = np.ones((), dtype=np.complex128)
+    for factor in np.exp(1j * weights):
+        tensor = np.multiply.outer(tensor, [1, factor])
+    return tensor
+
+
+def _phase_tensor(ops: Sequence[cirq.Operation], qubits: Sequence[cirq.Qid]):
+    """Product of diagonal operations as a (2,) * len(qubits) phase tensor.
+
+    The phase polynomials of the gates (see _gate_phase_terms) are summed and
+    evaluated by grouping terms on all but their least shared bit: a group
+    with fixed bits P multiplies the slice where all of P are 1 by the phases
+    of a linear form over the other qubits. A run of QFT controlled phases,
+    which share one qubit, is then a single linear form. Already fused gates
+    are multiplied in as they are.
+    """
+    axis = {q: i for i, q in enumerate(qubits)}
+    terms: Dict[Tuple[int, ...], float] = {}
+    fused = []
+    for op in ops:
+        if isinstance(op.gate, PhaseVectorGate):
+            fused.append(op)
+            continue
+        op_axes = [axis[q] for q in op.qubits]
+        for positions, c in _phase_terms(op):
+            subset = tuple(sorted(op_axes[i] for i in positions))
+            terms[subset] = terms.get(subset, 0.0) + c
+
+    frequency = np.zeros(len(qubits), dtype=int)
+    for subset in terms:
+        if len(subset) > 1:
+            frequency[list(subset)] += 1
+    groups: Dict[Tuple[int, ...], np.ndarray] = {}
+    constant = terms.pop((), 0.0)
+    for subset, c in terms.items():
+        free = min(subset, key=lambda a: (frequency[a], -a))
+        fixed = tuple(a for a in subset if a != free)
+        groups.setdefault(fixed, np.zeros(len(qubits)))[free] += c
+
+    phases = np.full((2,) * len(qubits), np.exp(1j * constant))
+    for fixed, weights in groups.items():
+        free_axes = [a for a in range(len(qubits)) if a not in fixed]
+        index = tuple(1 if a in fixed else slice(None) for a in range(len(qubits)))
+        phases[index] *= _linear_phases(weights[free_axes])
+    for op in fused:
+        op_axes = [axis[q] for q in op.qubits]
+        shape = [1] * len(qubits)
+        for a in op_axes:
+            shape[a] = 2
+        order = np.argsort(op_axes)
+        phases *= np.transpose(op.gate.phases, order).reshape(shape)
+    return phases
+
+
+def fuse_diagonal_operations(
+    operations: Iterable[cirq.Operation],
+) -> List[cirq.Operation]:
+    """Merges runs of diagonal gates (Z, RZ, CZ, CRZ, controlled phases...)
+    into PhaseVectorGates, one per set of qubits they connect.
+
+    Diagonal gates commute with each other, and a pending run also commutes
+    with any operation on disjoint qubits, which is emitted ahead of it. The
+    run is flushed before the first operation touching its qubits. Each
+    fused gate costs one pass over the state instead of one per gate.
+    """
+    fused, pending, pending_qubits = [], [], set()
+
+    def flush():
+        # Split the run into groups of operations connected by shared qubits.
+        components: List[Tuple[set, list]] = []
+        for op in pending:
+            merged = (set(op.qubits), [])
+            rest = []
+            for component in components:
+                if component[0] & merged[0]:
+                    merged[0].update(component[0])
+                    merged[1].extend(component[1])
+                else:
+                    rest.append(component)
+            merged[1].append(op)
+            components = rest + [merged]
+        for component_qubits, ops in components:
+            if len(ops) == 1:
+                fused.append(ops[0])
+                continue
+            qubits = sorted(component_qubits)
+            gate = PhaseVectorGate(_phase_tensor(ops, qubits), len(ops))
+            fused.append(gate.on(*qubits))
+        pending.clear()
+        pending_qubits.clear()
+
+    for op in operations:
+        if is_diagonal(op):
+            pending.append(op)
+            pending_qubits.update(op.qubits)
+        else:
+            if pending_qubits & set(op.qubits):
+                flush()
+            fused.append(op)
+    flush()
+    return fused
+
+
+class FusedGate(cirq.MatrixGate):
+    """Product of the gates merged by fuse_gates.
+
+    cirq applies a MatrixGate with einsum; tensordot, as in _apply_matrix, is
+    about twice as fast on large states.
+    """
+
+    def __init__(self, matrix: np.ndarray, num_fused: int):
+        super().__init__(matrix, name=f"Fused[{num_fused}]")
+        self.num_fused = num_fused
+
+    def _apply_unitary_(self, args: cirq.ApplyUnitaryArgs):
+        tensor, axes = args.target_tensor, tuple(args.axes)
+        k = len(axes)
+        matrix = self._matrix.astype(tensor.dtype).reshape((2,) * (2 * k))
+        result = np.tensordot(matrix, tensor, axes=(tuple(range(k, 2 * k)), axes))
+        args.available_buffer[...] = np.moveaxis(result, tuple(range(k)), axes)
+        return args.available_buffer
+
+
+@functools.lru_cache(maxsize=256)
+def _gate_unitary(gate: cirq.Gate) -> Optional[np.ndarray]:
+    return cirq.unitary(gate, None)
+
+
+def _op_unitary(op: cirq.Operation) -> Optional[np.ndarray]:
+    """Unitary of a plain one- or two-qubit gate operation, else None."""
+    gate = op.gate
+    if gate is None or cirq.num_qubits(op) > 2 or cirq.is_measurement(op):
+        return None
+    try:
+        return _gate_unitary(gate)
+    except TypeError:  # unhashable gate
+        return cirq.unitary(gate, None)
+
+
+_IDENTITY_2 = np.eye(2)
+_SWAP_4 = cirq.unitary(cirq.SWAP)
+
+
+def fuse_gates(operations: Iterable[cirq.Operation]) -> List[cirq.Operation]:
+    """Merges one- and two-qubit gates into blocks of at most two qubits.
+
+    Each qubit has at most one open block: a one-qubit gate multiplies into
+    it, and a two-qubit gate either multiplies into the block on the same
+    pair or closes the blocks on its qubits and opens a new 4x4 one,
+    absorbing one-qubit blocks on either qubit. SWAPs are emitted as they
+    are and just relabel the open blocks. Blocks are emitted when closed,
+    which only moves them past operations on other qubits: as the original
+    operation if it is alone, as a FusedGate otherwise, and not at all
+    when they multiply to the identity (X X, CNOT CNOT, rz(t) rz(-t), ...).
+    Measurements and wider operations close the blocks they touch.
+    """
+    fused = []
+    blocks: Dict[cirq.Qid, dict] = {}
+
+    def close(block):
+        for q in block["qubits"]:
+            del blocks[q]
+        if np.allclose(block["matrix"], np.eye(len(block["matrix"])), atol=1e-8):
+            return
+        if len(block["ops"]) == 1:
+            # Its qubits may have been relabeled by SWAPs emitted before it.
+            fused.append(block["ops"][0].with_qubits(*block["qubits"]))
+            return
+        gate = FusedGate(block["matrix"], len(block["ops"]))
+        fused.append(gate.on(*block["qubits"]))
+
+    def open_block(qubits, matrix, ops):
+        block = {"qubits": list(qubits), "matrix": matrix, "ops": ops}
+        for q in qubits:
+            blocks[q] = block
+
+    for op in operations:
+        if op.gate == cirq.SWAP:
+            swapped = {op.qubits[0]: op.qubits[1], op.qubits[1]: op.qubits[0]}
+            moved = {id(blocks[q]): blocks.pop(q) for q in op.qubits if q in blocks}
+            for block in moved.values():
+                block["qubits"] = [swapped.get(q, q) for q in block["qubits"]]
+                for q in block["qubits"]:
+                    blocks[q] = block
+            fused.append(op)
+            continue
+        unitary = _op_unitary(op)
+        if unitary is None:
+            for q in op.qubits:
+                if q in blocks:
+                    close(blocks[q])
+            fused.append(op)
+            continue
+        if len(op.qubits) == 1:
+            (q,) = op.qubits
+            block = blocks.get(q)
+            if block is None:
+                open_block(op.qubits, unitary, [op])
+                continue
+            if len(block["qubits"]) == 2:
+                factors = [unitary if b == q else _IDENTITY_2 for b in block["qubits"]]
+                unitary = np.kron(*factors)
+            block["matrix"] = unitary @ block["matrix"]
+            block["ops"].append(op)
+            continue
+
+        a, b = op.qubits
+        block = blocks.get(a)
+        if block is not None and block is blocks.get(b):
+            if block["qubits"] != [a, b]:
+                unitary = _SWAP_4 @ unitary @ _SWAP_4
+            block["matrix"] = unitary @ block["matrix"]
+            block["ops"].append(op)
+            continue
+        ops, factors = [], []
+        for q in (a, b):
+            block = blocks.get(q)
+            if block is not None and len(block["qubits"]) == 1:
+                del blocks[q]
+                ops += block["ops"]
+                factors.append(block["matrix"])
+            else:
+                if block is not None:
+                    close(block)
+                factors.append(_IDENTITY_2)
+        open_block((a, b), unitary @ np.kron(*factors), ops + [op])
+
+    for block in list({id(b): b for b in blocks.values()}.values()):
+        close(block)
+    return fused
+
+
+def compile_circuit(
+    circuit: cirq.Circuit,
+    qubit_order: Optional[Sequence[cirq.Qid]] = None,
+    fuse: bool = True,
+) -> Tuple[List[Instruction], List[cirq.Qid]]:
+    """Lowers a cirq circuit into instructions over statevector tensor axes.
+
+    Pass ``fuse=False`` for operations that already went through fuse_gates.
+    """
+    qubits = (
+        list(qubit_order) if qubit_order is not None else sorted(circuit.all_qubits())
+    )
+    axis = {q: i for i, q in enumerate(qubits)}
+    instructions = []
+    operations = circuit.all_operations()
+    if fuse:
+        operations = fuse_gates(operations)
+    operations = fuse_diagonal_operations(operations)
+    for op in operations:
+        axes = tuple(axis[q] for q in op.qubits)
+        if isinstance(op.gate, PhaseVectorGate):
+            instructions.append(Instruction("diagonal", axes, matrix=op.gate.phases))
+            continue
+        if cirq.is_measurement(op):
+            instructions.append(
+                Instruction("measure", axes, key=cirq.measurement_key_name(op))
+            )
+            continue
+        if op.gate == cirq.SWAP:
+            instructions.append(Instruction("swap", axes))
+            continue
+        controlled = _controlled_parts(op.gate)
+        if controlled is not None:
+            num_controls, matrix = controlled
+            instructions.append(
+                Instruction(
+                    "matrix",
+                    axes[num_controls:],
+                    controls=axes[:num_controls],
+                    matrix=matrix,
+                )
+            )
+            continue
+        if not cirq.has_unitary(op):
+            raise ValueError(f"Unsupported operation for numpy backend: {op}")
+        instructions.append(Instruction("matrix", axes, matrix=cirq.unitary(op)))
+    return instructions, qubits
+
+
+def _grouped(
+    state: np.ndarray, axes: Sequence[int]
+) -> Tuple[np.ndarray, Dict[int, int]]:
+    """Reshapes the state so only `axes` stay separate, merging the runs between them.
+
+    Numpy iterates a handful of large dimensions much faster than n tiny ones,
+    and a reshape of the contiguous state tensor is always a view.
+    """
+    shape, position, prev = [], {}, 0
+    for a in sorted(set(axes)):
+        if a > prev:
+            shape.append(1 << (a - prev))
+        position[a] = len(shape)
+        shape.append(2)
+        prev = a + 1
+    if prev < state.ndim:
+        shape.append(1 << (state.ndim - prev))
+    return state.reshape(shape), position
+
+
+def _index(ndim: int, fixed: Dict[int, int]) -> tuple:
+    # Length-one slices keep every axis, so the result is always a view.
+    return tuple(
+        slice(fixed[i], fixed[i] + 1) if i in fixed else slice(None)
+        for i in range(ndim)
+    )
+
+
+def _apply_matrix(
+    state: np.ndarray,
+    matrix: np.ndarray,
+    targets: Tuple[int, ...],
+    controls: Tuple[int, ...] = (),
+) -> None:
+    """Applies a (controlled) unitary to the state tensor in place."""
+    grouped, position = _grouped(state, targets + controls)
+    view = grouped[_index(grouped.ndim, {position[c]: 1 for c in controls})]
+    axes = tuple(position[t] for t in targets)
+    matrix = np.asarray(matrix, dtype=state.dtype)
+
+    if len(axes) == 1:
+        (m00, m01), (m10, m11) = matrix
+        s0 = view[_index(view.ndim, {axes[0]: 0})]
+        s1 = view[_index(view.ndim, {axes[0]: 1})]
+        if m01 == 0 and m10 == 0:
+            if m00 != 1:
+                s0 *= m00
+            if m11 != 1:
+                s1 *= m11
+        elif m00 == 0 and m11 == 0:
+            tmp = s0.copy()
+            np.multiply(s1, m01, out=s0)
+            np.multiply(tmp, m10, out=s1)
+        else:
+            tmp = s0.copy()
+            s0 *= m00
+            s0 += m01 * s1
+            s1 *= m11
+            s1 += m10 * tmp
+        return
+
+    k = len(axes)
+    tensor = matrix.reshape((2,) * (2 * k))
+    result = np.tensordot(tensor, view, axes=(tuple(range(k, 2 * k)), axes))
+    view[...] = np.moveaxis(result, tuple(range(k)), axes)
+
+
+def _measure(
+    state: np.ndarray, axes: Tuple[int, ...], rng: np.random.Generator
+) -> np.ndarray:
+    """Samples the measured qubits and collapses the state tensor in place."""
+    grouped, position = _grouped(state, axes)
+    kept = tuple(position[a] for a in axes)
+    others = tuple(i for i in range(grouped.ndim) if i not in kept)
+    marginal = np.sum(np.abs(grouped) ** 2, axis=others)
+    # np.sum keeps the remaining axes in ascending order; reorder to `axes`.
+    marginal = np.transpose(marginal, np.argsort(np.argsort(axes))).reshape(-1)
+    marginal = marginal / marginal.sum()
+    outcome = int(rng.choice(len(marginal), p=marginal))
+    bits = np.array(
+        [(outcome >> (len(axes) - 1 - i)) & 1 for i in range(len(axes))],
+        dtype=np.uint8,
+    )
+    for a, bit in zip(kept, bits):
+        grouped[_index(grouped.ndim, {a: 1 - bit})] = 0
+    state /= np.sqrt(marginal[outcome])
+    return bits
+
+
+class ProductState:
+    """Statevector stored as a tensor product of independent qubit groups.
+
+    Qubits start in their own one-qubit group and groups are only merged when a
+    gate entangles them, so sparse editor circuits never pay for the full 2**n
+    tensor until the final state is requested. Like cirq's
+    ``split_untangled_states``, measured qubits are split back out.
+    """
+
+    def __init__(self, num_qubits: int, dtype=np.complex64):
+        self.num_qubits = num_qubits
+        self.dtype = dtype
+        self.groups: List[Tuple[List[int], np.ndarray]] = []
+        for q in range(num_qubits):
+            self.groups.append(([q], np.array([1, 0], dtype=dtype)))
+
+    def copy(self) -> "ProductState":
+        other = ProductState(0, self.dtype)
+        other.num_qubits = self.num_qubits
+        other.groups = [(list(axes), tensor.copy()) for axes, tensor in self.groups]
+        return other
+
+    @property
+    def nbytes(self) -> int:
+        return sum(tensor.nbytes for _, tensor in self.groups)
+
+    def _group_of(self, qubit: int) -> int:
+        for i, (axes, _) in enumerate(self.groups):
+            if qubit in axes:
+                return i
+        raise ValueError(f"Qubit {qubit} is not part of this state")
+
+    def _merged(self, qubits: Sequence[int]) -> Tuple[List[int], np.ndarray]:
+        """Merges the groups holding `qubits` into one and returns it."""
+        indices = sorted({self._group_of(q) for q in qubits})
+        if len(indices) > 1:
+            axes, tensor = [], np.ones((), dtype=self.dtype)
+            for i in indices:
+                group_axes, group_tensor = self.groups[i]
+                axes += group_axes
+                tensor = np.multiply.outer(tensor, group_tensor)
+            for i in reversed(indices):
+                del self.groups[i]
+            self.groups.append((axes, tensor))
+            return self.groups[-1]
+        return self.groups[indices[0]]
+
+    def apply(self, inst: Instruction) -> None:
+        axes, tensor = self._merged(inst.targets + inst.controls)
+        local = {q: axes.index(q) for q in inst.targets + inst.controls}
+        _apply_matrix(
+            tensor,
+            inst.matrix,
+            tuple(local[q] for q in inst.targets),
+            tuple(local[q] for q in inst.controls),
+        )
+
+    def apply_diagonal(self, inst: Instruction) -> None:
+        """Multiplies the group holding inst.targets by the phase tensor."""
+        axes, tensor = self._merged(inst.targets)
+        local = [axes.index(q) for q in inst.targets]
+        phases = np.transpose(inst.matrix, np.argsort(local))
+        shape = [1] * tensor.ndim
+        for position in local:
+            shape[position] = 2
+        tensor *= phases.reshape(shape)
+
+    def swap(self, a: int, b: int) -> None:
+        # A swap only relabels which tensor axis holds which qubit.
+        for axes, _ in self.groups:
+            for i, q in enumerate(axes):
+                if q == a:
+                    axes[i] = b
+                elif q == b:
+                    axes[i] = a
+
+    def measure(self, qubits: Sequence[int], rng: np.random.Generator) -> np.ndarray:
+        bits = {}
+        for i in sorted({self._group_of(q) for q in qubits}):
+            axes, tensor = self.groups[i]
+            measured = [q for q in qubits if q in axes]
+            outcome = _measure(tensor, tuple(axes.index(q) for q in measured), rng)
+            bits.update(zip(measured, outcome))
+        for q, bit in bits.items():
+            self._split(q, int(bit))
+        return np.array([bits[q] for q in qubits], dtype=np.uint8)
+
+    def _split(self, qubit: int, bit: int) -> None:
+        """Factors a collapsed qubit out of its group."""
+        i = self._group_of(qubit)
+        axes, tensor = self.groups[i]
+        if len(axes) == 1:
+            return
+        a = axes.index(qubit)
+        rest = np.ascontiguousarray(np.take(tensor, bit, axis=a))
+        self.groups[i] = (axes[:a] + axes[a + 1 :], rest)
+        single = np.zeros(2, dtype=self.dtype)
+        single[bit] = 1
+        self.groups.append(([qubit], single))
+
+    def to_tensor(self) -> np.ndarray:
+        """Returns the full (2,)*n state tensor in qubit order."""
+        axes, tensor = [], np.ones((), dtype=self.dtype)
+        for group_axes, group_tensor in self.groups:
+            axes += group_axes
+            tensor = np.multiply.outer(tensor, group_tensor)
+        return np.ascontiguousarray(np.transpose(tensor, np.argsort(axes)))
+
+
+def run_instructions(
+    state: ProductState,
+    instructions: Sequence[Instruction],
+    rng: np.random.Generator,
+    measurements: Optional[Dict[str, np.ndarray]] = None,
+) -> ProductState:
+    """Applies compiled instructions to a product state in place."""
+    for inst in instructions:
+        if inst.kind == "matrix":
+            state.apply(inst)
+        elif inst.kind == "diagonal":
+            state.apply_diagonal(inst)
+        elif inst.kind == "swap":
+            state.swap(*inst.targets)
+        elif inst.kind == "measure":
+            bits = state.measure(inst.targets, rng)
+            if measurements is not None:
+                measurements[inst.key] = bits
+        else:
+            raise ValueError(f"Unknown instruction kind: {inst.kind}")
+    return state
+
+
+def simulate(
+    circuit: cirq.Circuit,
+    seed=None,
+    qubit_order: Optional[Sequence[cirq.Qid]] = None,
+    dtype=np.complex64,
+) -> StatevectorResult:
+    """Simulates a circuit with the numpy backend, matching cirq.Simulator.simulate."""
+    instructions, qubits = compile_circuit(circuit, qubit_order)
+    state = ProductState(len(qubits), dtype=dtype)
+    measurements = {}
+    run_instructions(state, instructions, np.random.default_rng(seed), measurements)
+    return StatevectorResult(state.to_tensor(), qubits, measurements)
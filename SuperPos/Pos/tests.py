@@ -0,0 +1,968 @@
+import collections
+import io
+import json
+import math
+import os
+import random
+import tempfile
+import time
+
+import cirq
+import numpy as np
+import sympy
+from benchmarks.common import random_circuit_data
+from django.test import SimpleTestCase
+from django.urls import reverse
+from scipy import stats
+
+from .serializers import FactorInputSerializer
+from .services import (
+    circuit3d,
+    crypto,
+    numtheory,
+    pauliframe,
+    quantum,
+    repetition,
+    statevector,
+)
+
+
+def without_measurements(circuit):
+    return cirq.Circuit(
+        op for op in circuit.all_operations() if not cirq.is_measurement(op)
+    )
+
+
+def cirq_state(circuit, qubits):
+    return cirq.Simulator().simulate(circuit, qubit_order=qubits).final_state_vector
+
+
+class StatevectorEquivalenceTests(SimpleTestCase):
+    """The numpy engine against cirq.Simulator on random editor circuits."""
+
+    def test_unitary_circuits_match_cirq(self):
+        rng = random.Random(1)
+        for _ in range(150):
+            circuit_data = random_circuit_data(rng.randint(1, 7), 30, rng)
+            circuit = without_measurements(
+                quantum.create_circuit_from_json(circuit_data)
+            )
+            qubits = sorted(circuit.all_qubits())
+            expected = cirq_state(circuit, qubits)
+            got = statevector.simulate(circuit, qubit_order=qubits)
+            self.assertEqual(got.final_state_vector.shape, expected.shape)
+            np.testing.assert_allclose(got.final_state_vector, expected, atol=1e-5)
+
+    def test_fused_circuits_match_cirq(self):
+        rng = random.Random(2)
+        for _ in range(50):
+            circuit_data = random_circuit_data(rng.randint(2, 6), 60, rng)
+            circuit = without_measurements(
+                quantum.create_circuit_from_json(circuit_data)
+            )
+            qubits = sorted(circuit.all_qubits())
+            fused = cirq.Circuit(statevector.fuse_gates(circuit.all_operations()))
+            expected = cirq_state(circuit, qubits)
+            np.testing.assert_allclose(
+                statevector.simulate(fused, qubit_order=qubits).final_state_vector,
+                expected,
+                atol=1e-5,
+            )
+            np.testing.assert_allclose(cirq_state(fused, qubits), expected, atol=1e-5)
+
+    def test_incremental_prefixes_match_cirq(self):
+        quantum.simulation_checkpoint_cache.clear()
+        rng = random.Random(3)
+        circuit_data = random_circuit_data(5, 40, rng)
+        operations = circuit_data["circuit"]["operations"]
+        for length in range(1, len(operations) + 1):
+            prefix = {
+                "circuit": dict(circuit_data["circuit"], operations=operations[:length])
+            }
+            qubits = list(quantum.qubits_from_json(prefix).values())
+            got, reused = quantum.simulate_prefix_incremental(prefix, qubits)
+            # The previous prefix left a checkpoint at its end.
+            self.assertEqual(reused, length - 1)
+            circuit = without_measurements(quantum.create_circuit_from_json(prefix))
+            np.testing.assert_allclose(got, cirq_state(circuit, qubits), atol=1e-5)
+
+        # Editing a gate resumes from the checkpoint of the unchanged prefix.
+        edited = {
+            "circuit": dict(
+                circuit_data["circuit"],
+                operations=operations[:20]
+                + [{"type": "H", "targets": ["q0"]}]
+                + operations[21:],
+            )
+        }
+        qubits = list(quantum.qubits_from_json(edited).values())
+        got, reused = quantum.simulate_prefix_incremental(edited, qubits)
+        self.assertEqual(reused, 20)
+        circuit = without_measurements(quantum.create_circuit_from_json(edited))
+        np.testing.assert_allclose(got, cirq_state(circuit, qubits), atol=1e-5)
+
+    def test_cold_run_stores_few_checkpoints(self):
+        circuit_data = random_circuit_data(6, 200, random.Random(6))
+        qubits = list(quantum.qubits_from_json(circuit_data).values())
+        operations = circuit_data["circuit"]["operations"]
+        keys = quantum.prefix_keys(circuit_data)
+        quantum.simulation_checkpoint_cache.clear()
+        quantum.simulate_prefix_incremental(circuit_data, qubits)
+        positions = quantum.checkpoint_positions(0, len(operations))
+        self.assertEqual(positions, [136, 168, 184, 192, 200])
+        self.assertEqual(len(quantum.simulation_checkpoint_cache), len(positions))
+        for position in positions:
+            self.assertIsNotNone(
+                quantum.simulation_checkpoint_cache.get(keys[position])
+            )
+
+        # Editing a gate after the last checkpoint resumes from it.
+        edited = dict(circuit_data["circuit"], operations=list(operations))
+        edited["operations"][190] = {"type": "X", "targets": ["q1"]}
+        got, reused = quantum.simulate_prefix_incremental({"circuit": edited}, qubits)
+        self.assertEqual(reused, 184)
+        circuit = without_measurements(
+            quantum.create_circuit_from_json({"circuit": edited})
+        )
+        np.testing.assert_allclose(got, cirq_state(circuit, qubits), atol=1e-5)
+
+        # States above the size limit are not checkpointed at all.
+        quantum.simulation_checkpoint_cache.clear()
+        limit = quantum.CHECKPOINT_MAX_STATE_BYTES
+        quantum.CHECKPOINT_MAX_STATE_BYTES = 0
+        try:
+            quantum.simulate_prefix_incremental(circuit_data, qubits)
+        finally:
+            quantum.CHECKPOINT_MAX_STATE_BYTES = limit
+        self.assertEqual(len(quantum.simulation_checkpoint_cache), 0)
+
+    def test_gate_counts_report_simulated_operations(self):
+        quantum.simulation_checkpoint_cache.clear()
+        circuit_data = random_circuit_data(6, 120, random.Random(7))
+        circuit = quantum.create_circuit_from_json(circuit_data)
+        # Everything but the final measurement, which is sampled.
+        simulated = len(list(circuit.all_operations())) - 1
+        for backend in ("numpy", "cirq"):
+            quantum.compiled_circuit_cache.clear()
+            _, payload = quantum.run_custom_simulation(circuit_data, backend=backend)
+            counts = payload["gate_counts"]
+            self.assertEqual(counts["before"], simulated)
+            self.assertLess(counts["after"], counts["before"])
+
+        # Resuming from the full-circuit checkpoint simulates nothing.
+        quantum.compiled_circuit_cache.clear()
+        _, payload = quantum.run_custom_simulation(circuit_data)
+        self.assertEqual(payload["gate_counts"], {"before": 0, "after": 0})
+
+    def test_mid_circuit_measurement_statistics_match_cirq(self):
+        circuit = quantum.create_circuit_from_json(
+            random_circuit_data(3, 12, random.Random(5), measure=True)
+        )
+        qubits = sorted(circuit.all_qubits())
+        shots = 1000
+        counts = {"numpy": np.zeros(8), "cirq": np.zeros(8)}
+        for seed in range(shots):
+            got = statevector.simulate(circuit, seed=seed, qubit_order=qubits)
+            counts["numpy"][np.argmax(np.abs(got.final_state_vector))] += 1
+            expected = cirq.Simulator(seed=seed).simulate(circuit, qubit_order=qubits)
+            counts["cirq"][np.argmax(np.abs(expected.final_state_vector))] += 1
+        tvd = 0.5 * np.abs(counts["numpy"] - counts["cirq"]).sum() / shots
+        self.assertLess(tvd, 0.08)
+
+
+def order_finding_distribution(x, n):
+    """Exact exponent readout distribution of the full order finding circuit."""
+    circuit = without_measurements(quantum.make_order_finding_circuit(x, n))
+    qubits = sorted(circuit.all_qubits())
+    probability = np.abs(cirq_state(circuit, qubits)) ** 2
+    # The target register comes first in qubit order.
+    return probability.reshape(2 ** n.bit_length(), -1).sum(axis=0)
+
+
+def readout_p_value(bits, probability):
+    """Chi-square p-value of exponent readouts against a distribution, over
+    the outcomes expected at least 5 times with the rest pooled into one bin."""
+    shots = len(bits)
+    expected = np.asarray(probability, dtype=float) * shots
+    readouts = bits.dot(1 << np.arange(bits.shape[1] - 1, -1, -1))
+    observed = np.bincount(readouts, minlength=len(expected))
+    large = expected >= 5
+    observed = np.append(observed[large], observed[~large].sum())
+    expected = np.append(expected[large], expected[~large].sum())
+    keep = expected > 0
+    return stats.chisquare(
+        observed[keep], expected[keep] * observed.sum() / expected.sum()
+    ).pvalue
+
+
+class StateSelectionTests(SimpleTestCase):
+    """top_k, threshold and marginals against cirq's pre-measurement state."""
+
+    def setUp(self):
+        circuit_data = random_circuit_data(5, 30, seed=19)
+        circuit = without_measurements(quantum.create_circuit_from_json(circuit_data))
+        qubits = sorted(circuit.all_qubits())
+        self.circuit_data = circuit_data
+        self.layout = quantum.qubits_from_json(circuit_data)
+        self.positions = {name: qubits.index(q) for name, q in self.layout.items()}
+        self.probability = np.abs(cirq_state(circuit, qubits)) ** 2
+
+    def simulate(self, backend="numpy", **options):
+        _, payload = quantum.run_custom_simulation(
+            self.circuit_data, backend=backend, state_format="columnar", **options
+        )
+        return payload
+
+    def test_top_k_keeps_the_most_probable_states(self):
+        for backend in ("numpy", "cirq"):
+            payload = self.simulate(backend, top_k=5, seed=1)
+            index = payload["state_vector"]["index"]
+            self.assertEqual(len(index), 5)
+            dropped = np.delete(self.probability, index)
+            self.assertGreaterEqual(self.probability[index].min(), dropped.max() - 1e-6)
+            self.assertAlmostEqual(
+                payload["selection"]["probability"],
+                self.probability[index].sum(),
+                places=5,
+            )
+
+    def test_threshold_keeps_states_above_it(self):
+        values = np.unique(self.probability.round(6))
+        threshold = float(values[-4] + values[-5]) / 2
+        payload = self.simulate(threshold=threshold, seed=2)
+        self.assertEqual(
+            payload["state_vector"]["index"],
+            np.flatnonzero(self.probability >= threshold).tolist(),
+        )
+
+    def test_marginal_matches_cirq(self):
+        names = ["q3", "q0"]
+        expected = np.zeros(4)
+        for index, probability in enumerate(self.probability):
+            bits = [index >> (4 - self.positions[name]) & 1 for name in names]
+            expected[2 * bits[0] + bits[1]] += probability
+        for seed in range(3):
+            payload = self.simulate(marginal_qubits=names, seed=seed)
+            self.assertEqual(payload["marginal"]["qubits"], names)
+            np.testing.assert_allclose(
+                payload["marginal"]["probability"], expected, atol=1e-5
+            )
+
+    def test_marginal_is_not_collapsed_by_the_final_measurement(self):
+        bell = {
+            "circuit": {
+                "layout": {"qubits": {"q0": {}, "q1": {}}},
+                "operations": [
+                    {"type": "H", "targets": ["q0"]},
+                    {"type": "CNOT", "targets": ["q1"], "control": "q0"},
+                ],
+            }
+        }
+        _, payload = quantum.run_custom_simulation(
+            bell, marginal_qubits=["q1"], top_k=2, seed=5
+        )
+        np.testing.assert_allclose(payload["marginal"]["probability"], [0.5, 0.5])
+        self.assertAlmostEqual(payload["selection"]["probability"], 1, places=5)
+
+
+def random_clifford_data(num_qubits, depth, seed, measure=False):
+    """Editor circuit JSON of random gates the stabilizer backend supports."""
+    rng = random.Random(seed)
+    names = [f"q{i}" for i in range(num_qubits)]
+    operations = []
+    for _ in range(depth):
+        gate = rng.choice(["H", "X", "Y", "Z", "CNOT", "CZ", "CY", "SWAP"])
+        if gate in ("H", "X", "Y", "Z"):
+            operations.append({"type": gate, "targets": [rng.choice(names)]})
+        elif gate == "SWAP":
+            operations.append({"type": gate, "targets": rng.sample(names, 2)})
+        else:
+            a, b = rng.sample(names, 2)
+            operations.append({"type": gate, "targets": [a], "control": b})
+    if measure:
+        operations.insert(depth // 2, {"type": "MEASURE", "targets": ["q0"]})
+    return {
+        "circuit": {
+            "layout": {"qubits": {name: {} for name in names}},
+            "operations": operations,
+        }
+    }
+
+
+def pauli_matrix(pauli):
+    """Dense matrix of a signed Pauli string such as "-XIZ"."""
+    letters = {
+        "I": np.eye(2),
+        "X": np.array([[0, 1], [1, 0]]),
+        "Y": np.array([[0, -1j], [1j, 0]]),
+        "Z": np.diag([1, -1]),
+    }
+    matrix = np.array([[-1 if pauli[0] == "-" else 1]])
+    for letter in pauli[1:]:
+        matrix = np.kron(matrix, letters[letter])
+    return matrix
+
+
+def sample_distribution(bit_strings):
+    counts = collections.Counter(bit_strings)
+    return {bits: count / len(bit_strings) for bits, count in counts.items()}
+
+
+def total_variation(p, q):
+    return sum(abs(p.get(k, 0) - q.get(k, 0)) for k in set(p) | set(q)) / 2
+
+
+class StabilizerBackendTests(SimpleTestCase):
+    """The tableau simulator against cirq.Simulator on random Clifford circuits."""
+
+    def setUp(self):
+        quantum.compiled_circuit_cache.clear()
+
+    def test_stabilizers_fix_the_cirq_state(self):
+        for seed in range(5):
+            circuit_data = random_clifford_data(4, 30, seed)
+            circuit = quantum.create_circuit_from_json(circuit_data)
+            qubits = sorted(circuit.all_qubits())
+            state = cirq_state(without_measurements(circuit), qubits)
+            _, payload = quantum.run_custom_simulation(
+                circuit_data, backend="stabilizer", seed=seed
+            )
+            self.assertEqual(payload["simulator"], "stabilizer")
+            self.assertEqual(len(payload["stabilizers"]), 4)
+            for pauli in payload["stabilizers"]:
+                np.testing.assert_allclose(
+                    pauli_matrix(pauli) @ state, state, atol=1e-5
+                )
+
+    def test_sampled_distribution_matches_cirq(self):
+        for seed in range(3):
+            circuit_data = random_clifford_data(5, 40, seed)
+            circuit = quantum.create_circuit_from_json(circuit_data)
+            qubits = sorted(circuit.all_qubits())
+            probability = np.abs(cirq_state(without_measurements(circuit), qubits)) ** 2
+            _, payload = quantum.run_custom_simulation(
+                circuit_data, backend="stabilizer", shots=4000, seed=seed
+            )
+            got = sample_distribution(payload["measurements"]["result"])
+            expected = {f"{i:05b}": p for i, p in enumerate(probability) if p > 1e-6}
+            self.assertEqual(set(got), set(expected))
+            self.assertLess(total_variation(got, expected), 0.05)
+
+    def test_mid_circuit_measurements_match_cirq(self):
+        for seed in range(3):
+            circuit_data = random_clifford_data(4, 30, seed, measure=True)
+            circuit = quantum.create_circuit_from_json(circuit_data)
+            qubits = sorted(circuit.all_qubits())
+            # Deferred measurement: copying q0 onto an ancilla gives the exact
+            # joint distribution of the mid-circuit and final readouts.
+            ancilla = cirq.LineQubit(len(qubits))
+            deferred = cirq.Circuit(
+                cirq.CNOT(op.qubits[0], ancilla) if cirq.is_measurement(op) else op
+                for op in circuit[:-1].all_operations()
+            )
+            probability = np.abs(cirq_state(deferred, qubits + [ancilla])) ** 2
+            expected = {
+                (f"{i & 1}", f"{i >> 1:04b}"): p
+                for i, p in enumerate(probability)
+                if p > 1e-6
+            }
+            _, payload = quantum.run_custom_simulation(
+                circuit_data, backend="stabilizer", shots=4000, seed=seed
+            )
+            measurements = payload["measurements"]
+            got = sample_distribution(
+                list(zip(measurements["q(0)"], measurements["result"]))
+            )
+            self.assertEqual(set(got), set(expected))
+            self.assertLess(total_variation(got, expected), 0.05)
+
+    def test_wide_clifford_circuits_are_routed_to_the_tableau(self):
+        default = quantum.STABILIZER_AUTO_QUBITS
+        quantum.STABILIZER_AUTO_QUBITS = 4
+        try:
+            _, narrow = quantum.run_custom_simulation(random_clifford_data(4, 20, 1))
+            _, wide = quantum.run_custom_simulation(random_clifford_data(5, 20, 1))
+            _, dense = quantum.run_custom_simulation(random_circuit_data(5, 20, 1))
+        finally:
+            quantum.STABILIZER_AUTO_QUBITS = default
+        self.assertNotIn("simulator", narrow)
+        self.assertEqual(wide["simulator"], "stabilizer")
+        self.assertNotIn("simulator", dense)
+
+    def test_non_clifford_circuit_is_a_bad_request(self):
+        circuit_data = random_clifford_data(3, 5, 0)
+        circuit_data["circuit"]["operations"].append(
+            {"type": "RX", "targets": ["q0"], "angle": 0.3}
+        )
+        response = self.client.post(
+            reverse("simulate"),
+            {"circuit_data": json.dumps(circuit_data), "backend": "stabilizer"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Clifford", response.json()["error"])
+
+
+class FastIdealSamplerTests(SimpleTestCase):
+    """fast-ideal exponent readouts against the full order finding circuit."""
+
+    def test_readout_frequencies_match_circuit(self):
+        rng = np.random.default_rng(4)
+        for x, n in ((7, 15), (2, 15), (4, 21), (2, 21)):
+            bits = quantum.sample_order_finding_outcomes(x, n, 20000, rng)
+            p_value = readout_p_value(bits, order_finding_distribution(x, n))
+            self.assertGreater(p_value, 1e-3, (x, n))
+
+
+class IterativeOrderFindingTests(SimpleTestCase):
+    """Semiclassical (one control qubit) readouts against the full circuit."""
+
+    def test_readout_frequencies_match_circuit(self):
+        # cirq.Simulator() draws from numpy's global random state.
+        np.random.seed(6)
+        for x, n, shots in ((7, 15, 500), (2, 21, 1000)):
+            result = quantum.iterative_order_finding_result(x, n, shots)
+            bits = result.measurements["exponent"]
+            self.assertEqual(bits.shape, (shots, 2 * n.bit_length() + 3))
+            p_value = readout_p_value(bits, order_finding_distribution(x, n))
+            self.assertGreater(p_value, 1e-3, (x, n))
+
+    def test_finds_the_order(self):
+        np.random.seed(7)
+        for x, n in ((7, 15), (2, 21), (5, 33)):
+            self.assertEqual(
+                quantum.quantum_order_finder(x, n, method="iterative"),
+                sympy.n_order(x, n),
+            )
+
+
+class FactorBudgetTests(SimpleTestCase):
+    def test_fast_ideal_honours_the_time_budget(self):
+        n = sympy.prevprime(2**28) * sympy.prevprime(2**27)
+        start = time.monotonic()
+        with self.assertRaises(quantum.FactorizationTimeout):
+            quantum.factor_number(
+                n, use_quantum=True, method="fast-ideal", time_budget=1
+            )
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_quantum_methods_cap_the_number(self):
+        for method, max_bits in quantum.ORDER_FINDING_MAX_BITS.items():
+            for number, valid in ((2**max_bits - 1, True), (2**max_bits + 1, False)):
+                serializer = FactorInputSerializer(
+                    data={"number": number, "use_quantum": True, "method": method}
+                )
+                self.assertEqual(serializer.is_valid(), valid, (method, number))
+        serializer = FactorInputSerializer(data={"number": 2**max_bits + 1})
+        self.assertTrue(serializer.is_valid())
+
+
+def peak_hit_rate(result, x, n):
+    """Share of exponent readouts on an exact peak k * 2**m / r."""
+    bits = result.measurements["exponent"]
+    readouts = bits.dot(1 << np.arange(bits.shape[1] - 1, -1, -1))
+    order = quantum.classical_order_finder(x, n)
+    return np.mean(readouts * order % 2 ** bits.shape[1] == 0)
+
+
+class NoisyOrderFindingTests(SimpleTestCase):
+    """Noise models see the order finding circuit moment by moment as
+    X/H, ModularExp, inverse QFT and measurement."""
+
+    def test_noisy_circuit_keeps_one_moment_per_step(self):
+        for noise_model, channel in quantum.NOISE_CHANNELS.items():
+            circuit = quantum.make_order_finding_circuit(7, 15, noise_model=noise_model)
+            noise = [op for op in circuit.all_operations() if op.gate == channel]
+            # 4 steps on 15 qubits, each followed by a layer of noise.
+            self.assertEqual(len(circuit), 8)
+            self.assertEqual(len(noise), 60)
+
+    def test_inverse_qft_step_is_the_qft(self):
+        n = 5
+        L = n.bit_length()
+        (step,) = [
+            op
+            for op in quantum._order_finding_gates(2, n).all_operations()
+            if isinstance(op, cirq.CircuitOperation)
+        ]
+        exponent = cirq.LineQubit.range(L, 3 * L + 3)
+        np.testing.assert_allclose(
+            cirq.unitary(step),
+            cirq.unitary(cirq.qft(*exponent, inverse=True)),
+            atol=1e-6,
+        )
+
+    def test_noisy_peak_hit_rate_matches_baseline(self):
+        # With one noise layer per step, about 84% of depolarizing shots hit
+        # a peak for x=7, n=15; a layer per decomposed gate gives about 25%.
+        circuit = quantum.make_order_finding_circuit(7, 15, noise_model="depolarizing")
+        result = cirq.Simulator(seed=1).run(circuit, repetitions=150)
+        self.assertGreater(peak_hit_rate(result, 7, 15), 0.72)
+
+
+class PauliFrameSamplerTests(SimpleTestCase):
+    """Frame-sampled Pauli noise against cirq.DensityMatrixSimulator."""
+
+    def random_circuit(self, rng, num_qubits, depth):
+        qubits = cirq.LineQubit.range(num_qubits)
+        operations = []
+        for _ in range(depth):
+            a, b = rng.sample(qubits, 2)
+            t = rng.uniform(-2, 2)
+            operations.append(
+                rng.choice(
+                    [
+                        cirq.H(a),
+                        cirq.S(a),
+                        cirq.X(a),
+                        cirq.T(a),
+                        cirq.rx(t)(a),
+                        cirq.ry(t)(a),
+                        cirq.CNOT(a, b),
+                        cirq.CZ(a, b),
+                        (cirq.CZ**t)(a, b),
+                        cirq.SWAP(a, b),
+                        cirq.ControlledGate(cirq.ry(t))(a, b),
+                    ]
+                )
+            )
+        return cirq.Circuit(operations, cirq.measure(*qubits, key="m"))
+
+    def exact_distribution(self, circuit, channel):
+        # Noise after a qubit's measurement cannot change its readout, and
+        # the density matrix simulator would apply it to the collapsed state.
+        measured, kept = set(), []
+        for op in circuit.with_noise(channel).all_operations():
+            if cirq.is_measurement(op):
+                measured.update(op.qubits)
+            elif not measured.intersection(op.qubits):
+                kept.append(op)
+        qubits = sorted(circuit.all_qubits())
+        rho = (
+            cirq.DensityMatrixSimulator()
+            .simulate(cirq.Circuit(kept), qubit_order=qubits)
+            .final_density_matrix
+        )
+        probability = np.clip(np.real(np.diag(rho)), 0, None)
+        return probability / probability.sum()
+
+    def test_readout_distribution_matches_density_matrix(self):
+        rng = random.Random(7)
+        shots = 10000
+        for seed in range(6):
+            circuit = self.random_circuit(rng, 4, rng.randint(5, 25))
+            for channel in (
+                cirq.depolarize(0.05),
+                cirq.bit_flip(0.08),
+                cirq.phase_flip(0.1),
+            ):
+                result = pauliframe.sample_with_pauli_noise(
+                    circuit, channel, shots, seed=seed
+                )
+                bits = result.measurements["m"]
+                readouts = bits.dot(1 << np.arange(bits.shape[1] - 1, -1, -1))
+                observed = np.bincount(readouts, minlength=16) / shots
+                expected = self.exact_distribution(circuit, channel)
+                tvd = 0.5 * np.abs(observed - expected).sum()
+                self.assertLess(tvd, 0.03, (seed, channel))
+
+    def test_noisy_order_finding_peak_hit_rate(self):
+        # The circuit quantum_order_finder samples for noise models; same
+        # threshold as the trajectory check in NoisyOrderFindingTests.
+        circuit = quantum._order_finding_gates(7, 15)
+        result = quantum.run_with_noise(circuit, "depolarizing", 2000)
+        self.assertGreater(peak_hit_rate(result, 7, 15), 0.72)
+
+
+class MultiplicativeOrderTests(SimpleTestCase):
+    def test_capped_baby_step_table_finds_the_order(self):
+        rng = random.Random(9)
+        default = numtheory.BSGS_MAX_BABY_STEPS
+        numtheory.BSGS_MAX_BABY_STEPS = 16
+        try:
+            for _ in range(300):
+                n = rng.randint(3, 20000)
+                x = rng.randint(2, n - 1)
+                if math.gcd(x, n) == 1:
+                    self.assertEqual(
+                        numtheory.multiplicative_order(x, n), sympy.n_order(x, n)
+                    )
+        finally:
+            numtheory.BSGS_MAX_BABY_STEPS = default
+
+    def test_large_modulus_times_out_instead_of_factoring(self):
+        n = sympy.prevprime(2**62) * (2**61 - 1)
+        deadline = time.monotonic() + 0.5
+        start = time.monotonic()
+        with self.assertRaises(numtheory.FactorizationTimeout):
+            numtheory.multiplicative_order(3, n, deadline=deadline)
+        self.assertLess(time.monotonic() - start, 5)
+
+
+class RSAPrivateKeyTests(SimpleTestCase):
+    """CRT decryption against textbook RSA, and the recovered-key cache."""
+
+    def setUp(self):
+        crypto.private_key_cache.clear()
+
+    def test_crt_decryption_matches_the_private_exponent(self):
+        rng = random.Random(13)
+        for bits in (8, 16, 32, 256):
+            p = crypto.generate_prime(bits)
+            q = crypto.generate_prime(bits + 1)
+            key = crypto.RSAPrivateKey(p, q, 65537)
+            d = pow(65537, -1, (p - 1) * (q - 1))
+            for _ in range(50):
+                c = rng.randrange(key.n)
+                self.assertEqual(key.decrypt_int(c), pow(c, d, key.n))
+
+    def test_messages_round_trip(self):
+        message = "Shor's algorithm — été, 量子 " * 20
+        for bits in (16, 32, 256):
+            p, q = crypto.generate_prime(bits), crypto.generate_prime(bits)
+            if p == q:
+                continue
+            key = crypto.RSAPrivateKey(p, q, 65537)
+            d = pow(65537, -1, (p - 1) * (q - 1))
+            encrypted = crypto.encrypt_message(message, 65537, key.n)
+            self.assertEqual(key.decrypt_message(encrypted), message)
+            self.assertEqual(crypto.decrypt_message(encrypted, d, key.n), message)
+
+        # The key recovered by factoring a generated public key.
+        n, e, _ = crypto.generate_rsa_keypair(64)
+        encrypted = crypto.encrypt_message(message, e, n)
+        self.assertEqual(
+            crypto.rsa_private_key(n, e).decrypt_message(encrypted), message
+        )
+
+    def test_failed_factorization_is_not_cached(self):
+        n, e = 61 * 53, 17
+        factor_n = crypto.factor_n
+        calls = []
+
+        def failing_once(n):
+            calls.append(n)
+            return (None, None) if len(calls) == 1 else factor_n(n)
+
+        crypto.factor_n = failing_once
+        try:
+            self.assertIsNone(crypto.rsa_private_key(n, e))
+            key = crypto.rsa_private_key(n, e)
+            self.assertEqual((key.p, key.q), (53, 61))
+            self.assertIs(crypto.rsa_private_key(n, e), key)
+        finally:
+            crypto.factor_n = factor_n
+        self.assertEqual(len(calls), 2)
+
+
+class CircuitViewerCacheTests(SimpleTestCase):
+    """The viewer is built from files alone, as in a worker that never simulated."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        default = circuit3d.CACHE_DIR
+        circuit3d.CACHE_DIR = directory.name
+        self.addCleanup(setattr, circuit3d, "CACHE_DIR", default)
+
+    def test_viewer_is_generated_from_the_stored_circuit(self):
+        circuit_data = random_circuit_data(3, 4, seed=2)
+        key = quantum.circuit_key(circuit_data)
+        circuit3d.remember(key, circuit_data)
+        self.assertIsNone(circuit3d.open_html("0" * 64))
+        with circuit3d.open_html(key) as f:
+            html = f.read().decode("utf-8")
+        diagram = quantum.create_circuit_from_json(circuit_data).to_text_diagram(
+            transpose=True
+        )
+        self.assertIn(diagram, html)
+        self.assertEqual(
+            sorted(os.listdir(circuit3d.CACHE_DIR)), [f"{key}.html", f"{key}.json"]
+        )
+
+    def test_page_and_circuit_are_evicted_together(self):
+        default = circuit3d.CACHE_MAX_ENTRIES
+        circuit3d.CACHE_MAX_ENTRIES = 2
+        try:
+            keys = []
+            for seed in range(3):
+                circuit_data = random_circuit_data(2, 2, seed=seed)
+                keys.append(quantum.circuit_key(circuit_data))
+                circuit3d.remember(keys[-1], circuit_data)
+                os.utime(circuit3d._path(keys[-1], ".json"), (seed, seed))
+            circuit3d._evict()
+        finally:
+            circuit3d.CACHE_MAX_ENTRIES = default
+        self.assertIsNone(circuit3d.open_html(keys[0]))
+        self.assertEqual(
+            sorted(os.listdir(circuit3d.CACHE_DIR)),
+            sorted(f"{key}.json" for key in keys[1:]),
+        )
+
+
+class PrimeGenerationTests(SimpleTestCase):
+    """Miller-Rabin and sieved prime generation against sympy."""
+
+    def test_is_prime_matches_sympy(self):
+        rng = random.Random(11)
+        numbers = list(range(-2, 5000)) + [rng.getrandbits(64) for _ in range(300)]
+        for n in numbers:
+            self.assertEqual(crypto.is_prime(n), sympy.isprime(n), n)
+
+    def test_known_primes_and_pseudoprimes(self):
+        primes = [2**31 - 1, 2**61 - 1, 2**89 - 1, 2**127 - 1, 2**521 - 1]
+        for p in primes:
+            self.assertTrue(crypto.is_prime(p), p)
+        # Carmichael numbers, strong pseudoprimes to the first bases, and the
+        # smallest one that fools all 13 deterministic bases.
+        composites = [561, 1105, 1729, 41041, 825265, 2047, 3215031751]
+        composites += [3825123056546413051, 3317044064679887385961981]
+        composites += [(2**61 - 1) * (2**89 - 1), (2**127 - 1) ** 2]
+        for n in composites:
+            self.assertFalse(crypto.is_prime(n), n)
+
+    def test_generated_primes_have_the_requested_size(self):
+        for bits in (3, 8, 16, 17, 32, 64, 256, 1024):
+            p = crypto.generate_prime(bits)
+            self.assertEqual(p.bit_length(), bits)
+            self.assertEqual(p >> (bits - 2), 3)
+            self.assertTrue(sympy.isprime(p))
+        with self.assertRaises(ValueError):
+            crypto.generate_prime(2)
+
+    def test_keypairs_have_the_requested_size(self):
+        for key_size in (16, 17, 32, 63, 64, 512, 2048):
+            n, e, d = crypto.generate_rsa_keypair(key_size)
+            self.assertEqual(n.bit_length(), key_size)
+            m = random.Random(key_size).randrange(2, n)
+            self.assertEqual(pow(pow(m, e, n), d, n), m)
+        for key_size in (crypto.MIN_KEY_SIZE - 1, crypto.MAX_KEY_SIZE + 1):
+            with self.assertRaises(ValueError):
+                crypto.generate_rsa_keypair(key_size)
+
+
+class FactorNTests(SimpleTestCase):
+    """crypto.factor_n results, and its time budget as seen by the RSA views."""
+
+    def setUp(self):
+        crypto.private_key_cache.clear()
+        # Two 100-bit primes: far beyond rho and ECM within the budgets below.
+        self.hard = sympy.prevprime(2**100) * sympy.prevprime(2**99)
+
+    def test_factors_semiprimes(self):
+        for bits in (8, 16, 24, 32):
+            p = crypto.generate_prime(bits)
+            q = crypto.generate_prime(bits + 1)
+            self.assertEqual(crypto.factor_n(p * q), (min(p, q), max(p, q)))
+        self.assertEqual(crypto.factor_n(2 * 101), (2, 101))
+        self.assertEqual(crypto.factor_n(65537**3), (65537, 65537**2))
+        for n in (1, 3, 65537, 2**61 - 1):
+            self.assertEqual(crypto.factor_n(n), (None, None))
+
+    def test_time_budget(self):
+        start = time.monotonic()
+        with self.assertRaises(numtheory.FactorizationTimeout):
+            crypto.factor_n(self.hard, time_budget=0.2)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_views_answer_timeouts_with_408(self):
+        default = crypto.FACTOR_TIME_BUDGET
+        crypto.FACTOR_TIME_BUDGET = 0.2
+        try:
+            encrypted = crypto.encrypt_message("hi", 65537, self.hard)
+            responses = [
+                self.client.post(
+                    reverse("rsa_decrypt"),
+                    {"encrypted_message": encrypted, "n": self.hard, "e": 65537},
+                    content_type="application/json",
+                ),
+                self.client.post(
+                    reverse("rsa_decrypt_batch"),
+                    {"encrypted_messages": [encrypted], "n": self.hard, "e": 65537},
+                    content_type="application/json",
+                ),
+                self.client.post(
+                    f"{reverse('rsa_decrypt_stream')}?n={self.hard}&e=65537",
+                    encrypted,
+                    content_type="text/plain",
+                ),
+            ]
+        finally:
+            crypto.FACTOR_TIME_BUDGET = default
+        for response in responses:
+            self.assertEqual(response.status_code, 408)
+            self.assertIn("error", response.json())
+
+
+class RSABatchStreamTests(SimpleTestCase):
+    """Batch and streaming RSA endpoints round-trip their payloads."""
+
+    def setUp(self):
+        crypto.private_key_cache.clear()
+        self.n, self.e, _ = crypto.generate_rsa_keypair(64)
+        rng = random.Random(15)
+        # Decrypted blocks drop leading zero bytes, so the plaintext has none.
+        self.plaintext = bytes(rng.randrange(1, 256) for _ in range(5000))
+
+    def test_batch_round_trip(self):
+        messages = ["", "hello", "été 量子 " * 50]
+        response = self.client.post(
+            reverse("rsa_encrypt_batch"),
+            {"messages": messages, "n": self.n, "e": self.e},
+            content_type="application/json",
+        )
+        encrypted = response.json()["encrypted_messages"]
+        self.assertEqual(
+            encrypted, [crypto.encrypt_message(m, self.e, self.n) for m in messages]
+        )
+        response = self.client.post(
+            reverse("rsa_decrypt_batch"),
+            {"encrypted_messages": encrypted, "n": self.n, "e": self.e},
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["decrypted_messages"], messages)
+
+    def test_stream_round_trip_with_wrapped_base64(self):
+        query = f"?n={self.n}&e={self.e}"
+        response = self.client.post(
+            reverse("rsa_encrypt_stream") + query,
+            self.plaintext,
+            content_type="application/octet-stream",
+        )
+        encrypted = b"".join(response.streaming_content).decode("ascii")
+        # CRLF every 75 characters, so line breaks split Base64 groups and
+        # shift them across the decrypter's read buffers.
+        wrapped = "\r\n".join(
+            encrypted[i : i + 75] for i in range(0, len(encrypted), 75)
+        )
+        response = self.client.post(
+            reverse("rsa_decrypt_stream") + query,
+            wrapped,
+            content_type="text/plain",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.plaintext)
+
+    def test_stream_batches_match_whole_messages(self):
+        message = "streamed " * 300
+        expected = crypto.encrypt_message(message, self.e, self.n)
+        key = crypto.RSAPrivateKey(*crypto.factor_n(self.n), self.e)
+        for batch_blocks in (1, 3, 4, 7, 100):
+            pieces = crypto.iter_encrypt(
+                io.BytesIO(message.encode()), self.e, self.n, batch_blocks
+            )
+            encrypted = b"".join(pieces)
+            self.assertEqual(encrypted.decode("ascii"), expected)
+            plain = crypto.iter_decrypt(
+                io.BytesIO(encrypted), self.n, key.decrypt_int, batch_blocks
+            )
+            self.assertEqual(b"".join(plain).decode(), message)
+
+
+class StateStreamTests(SimpleTestCase):
+    """Paged /simulate/stream output against the in-memory state vector."""
+
+    def setUp(self):
+        self.circuit_data = random_circuit_data(5, 30, seed=20)
+        _, state_vector = quantum.simulate_final_state(self.circuit_data, seed=3)
+        self.states = quantum.state_vector_to_list(state_vector)
+        default = quantum.STREAM_CHUNK_STATES
+        quantum.STREAM_CHUNK_STATES = 3
+        self.addCleanup(setattr, quantum, "STREAM_CHUNK_STATES", default)
+
+    def stream(self, query):
+        return self.client.post(
+            f"{reverse('simulate_stream')}?{query}",
+            {"circuit_data": json.dumps(self.circuit_data), "seed": 3},
+            content_type="application/json",
+        )
+
+    def test_ndjson_pages_cover_the_state_vector(self):
+        states = []
+        for page in range(5):
+            response = self.stream(f"page={page}&page_size=7")
+            self.assertEqual(response["Content-Type"], "application/x-ndjson")
+            lines = b"".join(response.streaming_content).decode().splitlines()
+            header = json.loads(lines[0])
+            self.assertEqual(
+                header,
+                {
+                    "num_qubits": 5,
+                    "total": 32,
+                    "start": 7 * page,
+                    "stop": min(7 * page + 7, 32),
+                },
+            )
+            states += [json.loads(line) for line in lines[1:]]
+        self.assertEqual(states, self.states)
+        self.assertEqual(self.stream("page=5&page_size=7").status_code, 400)
+
+    def test_json_range(self):
+        response = self.stream("start=5&stop=19&format=json")
+        document = json.loads(b"".join(response.streaming_content))
+        self.assertEqual((document["start"], document["stop"]), (5, 19))
+        self.assertEqual(document["states"], self.states[5:19])
+
+
+def repetition_failure_rate(num_qubits, physical, measurement, rounds):
+    """Exact logical error rate of the "ft" repetition code for odd sizes."""
+    readout = stats.binom.sf(rounds // 2, rounds, measurement)
+    flipped = physical * (1 - readout) + (1 - physical) * readout
+    return stats.binom.sf(num_qubits // 2, num_qubits, flipped)
+
+
+class FaultToleranceSweepTests(SimpleTestCase):
+    """Monte-Carlo sweep points against exact binomial failure rates."""
+
+    def sweep(self, **data):
+        return self.client.post(
+            reverse("fault_tolerance_sweep"), data, content_type="application/json"
+        )
+
+    def test_wilson_interval_matches_scipy(self):
+        for failures, trials in [(0, 10), (3, 10), (10, 10), (17, 1000), (1, 10**6)]:
+            for confidence in (0.9, 0.95, 0.999):
+                expected = stats.binomtest(failures, trials).proportion_ci(
+                    confidence, method="wilson"
+                )
+                np.testing.assert_allclose(
+                    repetition.wilson_interval(failures, trials, confidence),
+                    (expected.low, expected.high),
+                    atol=1e-12,
+                )
+
+    def test_sweep_rates_fall_in_their_intervals(self):
+        response = self.sweep(
+            num_qubits=[3, 5],
+            physical_error_prob=[0.05, 0.15],
+            measurement_error_prob=[0, 0.02],
+            syndrome_rounds=[1, 3],
+            trials=100_000,
+            confidence=0.999,
+            seed=25,
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 16)
+        for point in results:
+            low, high = point["confidence_interval"]
+            self.assertEqual(
+                [low, high],
+                list(repetition.wilson_interval(point["failures"], 100_000, 0.999)),
+            )
+            exact = repetition_failure_rate(
+                point["num_qubits"],
+                point["physical_error_prob"],
+                point["measurement_error_prob"],
+                point["syndrome_rounds"],
+            )
+            self.assertTrue(low <= exact <= high, (point, exact))
+
+    def test_seeded_sweeps_repeat_and_bad_input_is_rejected(self):
+        first = self.sweep(physical_error_prob=0.1, trials=1000, seed=1).json()
+        second = self.sweep(physical_error_prob=0.1, trials=1000, seed=1).json()
+        self.assertEqual(first, second)
+        self.assertEqual(
+            self.sweep(physical_error_prob=0.1, protocol="surface").status_code, 400
+        )
+        self.assertEqual(self.sweep(physical_error_prob=1.5).status_code, 400)
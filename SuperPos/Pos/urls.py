@@ -3,11 +3,19 @@ from . import views
 
 urlpatterns = [
     path('rsa_generate_keys/',views. rsa_generate_keys, name='rsa_generate_keys'),
+    path('rsa_pool/stats/', views.rsa_pool_stats, name='rsa_pool_stats'),
     path('rsa_encrypt/', views.rsa_encrypt, name='rsa_encrypt'),
     path('rsa_decrypt/', views.rsa_decrypt, name='rsa_decrypt'),
-    path('3dckt/', views.get_3d, name='get_3d'),
+    path('rsa_encrypt/batch/', views.rsa_encrypt_batch, name='rsa_encrypt_batch'),
+    path('rsa_decrypt/batch/', views.rsa_decrypt_batch, name='rsa_decrypt_batch'),
+    path('rsa_encrypt/stream/', views.rsa_encrypt_stream, name='rsa_encrypt_stream'),
+    path('rsa_decrypt/stream/', views.rsa_decrypt_stream, name='rsa_decrypt_stream'),
+    path('3dckt/<str:circuit_hash>/', views.get_3d, name='get_3d_circuit'),
     path('simulate', views.simulate_custom_circuit, name='simulate'),
+    path('simulate/cache', views.simulate_cache_stats, name='simulate_cache_stats'),
+    path('simulate/stream', views.simulate_stream, name='simulate_stream'),
     path('chat', views.chat, name='chat'),
     path('run_fault_tolerance/', views.run_fault_tolerance, name='fault_tolerance'),
+    path('run_fault_tolerance/sweep/', views.fault_tolerance_sweep, name='fault_tolerance_sweep'),
 
 ]
@@ -1,22 +1,25 @@
 import json
 import traceback
-import cirq
-import cirq_web
-import plotly
-from plotly import graph_objs as go
-from django.shortcuts import render
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.urls import reverse
+from django.utils.http import parse_header_parameters
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 import os
-import numpy as np
-from django.conf import settings
 
 # Import services
-from .services import quantum, crypto, ai
-from .serializers import FactorInputSerializer
+from .services import quantum, crypto, ai, circuit3d
+from .services.numtheory import FactorizationTimeout
+from .serializers import FactorInputSerializer, RSAKeyInputSerializer
 
 # Configure AI
 ai.configure_genai(os.environ.get("GENERATIVEAI_API_KEY"))
@@ -32,13 +35,35 @@ def run_fault_tolerance(request):
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(["POST"])
+def fault_tolerance_sweep(request):
+    """Monte-Carlo logical error rates of the repetition code over a parameter grid."""
+    try:
+        result = quantum.process_fault_tolerance_sweep(request.data)
+        return Response(result)
+    except (KeyError, TypeError, ValueError) as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(["POST"])
 def rsa_generate_keys(request):
     """Generate RSA keys."""
-    n, e, d = crypto.generate_rsa_keypair()
+    serializer = RSAKeyInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    n, e, d = crypto.keypair_pool.get(serializer.validated_data["key_size"])
     return Response({"n": n, "e": e, "d": d})
 
 
+@api_view(["GET"])
+def rsa_pool_stats(request):
+    """Depth and refill rate of the pre-generated RSA keypair pool."""
+    return Response(crypto.keypair_pool.stats())
+
+
 @api_view(["POST"])
 def rsa_encrypt(request):
     """Encrypt a message using RSA."""
@@ -62,20 +87,108 @@ def rsa_decrypt(request):
         n = int(data.get("n"))
         e = int(data.get("e"))
 
-        p, q = crypto.factor_n(n)
-        if p is None:
+        key = crypto.rsa_private_key(n, e)
+        if key is None:
             return Response(
                 {"error": "Failed to factor n"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        phi = (p - 1) * (q - 1)
-        d = crypto.mod_inverse(e, phi)
-        decrypted_message = crypto.decrypt_message(encrypted_message, d, n)
+        decrypted_message = key.decrypt_message(encrypted_message)
         return Response({"decrypted_message": decrypted_message})
+    except FactorizationTimeout as e:
+        return Response({"error": str(e)}, status=status.HTTP_408_REQUEST_TIMEOUT)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(["POST"])
+def rsa_encrypt_batch(request):
+    """Encrypt a list of messages with one RSA public key."""
+    try:
+        data = request.data
+        messages = data.get("messages")
+        if not isinstance(messages, list):
+            return Response(
+                {"error": "messages must be a list"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        n = int(data.get("n"))
+        e = int(data.get("e"))
+        encrypted_messages = [crypto.encrypt_message(m, e, n) for m in messages]
+        return Response({"encrypted_messages": encrypted_messages})
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(["POST"])
+def rsa_decrypt_batch(request):
+    """Decrypt a list of messages, factoring n once for all of them."""
+    try:
+        data = request.data
+        encrypted_messages = data.get("encrypted_messages")
+        if not isinstance(encrypted_messages, list):
+            return Response(
+                {"error": "encrypted_messages must be a list"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        n = int(data.get("n"))
+        e = int(data.get("e"))
+
+        key = crypto.rsa_private_key(n, e)
+        if key is None:
+            return Response(
+                {"error": "Failed to factor n"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        decrypted_messages = [key.decrypt_message(m) for m in encrypted_messages]
+        return Response({"decrypted_messages": decrypted_messages})
+    except FactorizationTimeout as e:
+        return Response({"error": str(e)}, status=status.HTTP_408_REQUEST_TIMEOUT)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@csrf_exempt
+@require_POST
+def rsa_encrypt_stream(request):
+    """Stream-encrypt the raw request body; n and e come from the query string.
+
+    The response is the Base64 ciphertext, produced block by block.
+    """
+    try:
+        n = int(request.GET["n"])
+        e = int(request.GET["e"])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("n and e query parameters are required")
+    return StreamingHttpResponse(
+        crypto.iter_encrypt(request, e, n), content_type="text/plain"
+    )
+
+
+@csrf_exempt
+@require_POST
+def rsa_decrypt_stream(request):
+    """Stream-decrypt a raw Base64 request body; n and e come from the query string."""
+    try:
+        n = int(request.GET["n"])
+        e = int(request.GET["e"])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("n and e query parameters are required")
+
+    # Factor before streaming starts, while an error status can still be sent.
+    try:
+        key = crypto.rsa_private_key(n, e)
+    except FactorizationTimeout as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_408_REQUEST_TIMEOUT)
+    if key is None:
+        return JsonResponse(
+            {"error": "Failed to factor n"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    return StreamingHttpResponse(
+        key.iter_decrypt(request), content_type="application/octet-stream"
+    )
+
+
 @api_view(["POST"])
 def factor_view(request):
     """Django REST API view to factor a number with quantum circuit options."""
@@ -89,6 +202,8 @@ def factor_view(request):
         use_quantum = data["use_quantum"]
         shots = data.get("shots", 100)
         noise_model = data.get("noise_model", "ideal")
+        method = data.get("method", "circuit")
+        parallel = data.get("parallel", False)
 
         if n <= 1:
             return Response(
@@ -97,10 +212,17 @@ def factor_view(request):
             )
 
         result = quantum.factor_number(
-            n, use_quantum=use_quantum, shots=shots, noise_model=noise_model
+            n,
+            use_quantum=use_quantum,
+            shots=shots,
+            noise_model=noise_model,
+            method=method,
+            parallel=parallel,
         )
         return Response(result)
 
+    except FactorizationTimeout as e:
+        return Response({"error": str(e)}, status=status.HTTP_408_REQUEST_TIMEOUT)
     except ValueError:
         return Response(
             {"error": "Invalid input. Please provide a valid integer."},
@@ -134,9 +256,19 @@ def chat(request):
         )
 
 
-def get_3d(request):
-    """Legacy view for 36D circuit visualization."""
-    return render(request, "Ckt3d.html")
+def get_3d(request, circuit_hash):
+    """3D circuit visualization for a simulated circuit's hash."""
+    html_file = circuit3d.open_html(circuit_hash)
+    if html_file is None:
+        raise Http404("Unknown circuit; simulate it first")
+    return FileResponse(html_file, content_type="text/html; charset=utf-8")
+
+
+def requested_state_format(request):
+    """The "state" parameter of the negotiated media type, e.g.
+    ``Accept: application/json; state=columnar``; the legacy list otherwise."""
+    _, params = parse_header_parameters(request.accepted_media_type or "")
+    return params.get("state", "list")
 
 
 @api_view(["POST"])
@@ -152,109 +284,109 @@ def simulate_custom_circuit(request):
         if "circuit" not in circuit_data:
             raise ValueError("Invalid JSON payload. Missing 'circuit' key.")
 
-        # Create and simulate the circuit
-        circuit = quantum.create_circuit_from_json(circuit_data)
-        result = quantum.simulate_circuit(circuit)
-
-        # Extract state vector
-        state_vector = result.final_state_vector
-        num_qubits = int(np.log2(max(len(state_vector), 1)))
-
-        state_list = [
-            {
-                "index": i,
-                "binary": f"{i:0{num_qubits}b}",
-                "magnitude": float(abs(amplitude)),
-                "phase": float(np.angle(amplitude)),
-                "probability": float(abs(amplitude) ** 2),
-                "real": float(amplitude.real),
-                "imag": float(amplitude.imag),
-            }
-            for i, amplitude in enumerate(state_vector)
-        ]
-
-        prob_plot_json = quantum.create_probability_plot(state_list)
-        phase_plot_json = quantum.create_phase_plot(state_list)
-
-        # 3D visualization handling
-        try:
-            ckt = cirq_web.Circuit3D(circuit)
-            templates_dir = os.path.join(settings.BASE_DIR, "Pos", "templates")
-            os.makedirs(templates_dir, exist_ok=True)
-
-            html_file = ckt.generate_html_file(output_directory=templates_dir)
-            destination_file = os.path.join(templates_dir, "Ckt3d.html")
-
-            with open(html_file, "r", encoding="utf-8") as f:
-                html_content = f.read()
-
-            # Full template with custom styling
-            template = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Quantum Circuit Documentation</title>
-    <style>
-        :root {{
-            --background: 222.2 84% 4.9%;
-            --foreground: 210 40% 98%;
-            --card: 222.2 84% 4.9%;
-            --card-foreground: 210 40% 98%;
-            --primary: 217.2 91.2% 59.8%;
-            --secondary: 217.2 32.6% 17.5%;
-            --muted: 217.2 32.6% 17.5%;
-            --muted-foreground: 215 20.2% 65.1%;
-            --accent: 217.2 32.6% 17.5%;
-            --border: 217.2 32.6% 17.5%;
-            --radius: 0.5rem;
-        }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif;
-            background-color: hsl(var(--background));
-            color: hsl(var(--foreground));
-            margin: 0; padding: 0;
-        }}
-        .container {{ max-width: 80rem; margin: 0 auto; padding: 2rem; }}
-        .base {{ display: flex; gap: 2rem; width: 100%; margin-bottom: 2rem; }}
-        .model, .documentation {{ flex: 1; background-color: hsl(var(--card)); border-radius: var(--radius); padding: 1.5rem; border: 1px solid hsl(var(--border)); }}
-        h2 {{ color: hsl(var(--primary)); font-size: 1.5rem; margin-top: 0; }}
-        pre {{ background-color: hsl(var(--secondary)); padding: 1rem; border-radius: var(--radius); overflow-x: auto; font-family: monospace; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="base">
-            <div class="model">
-                <h2>Model Content</h2>
-                {html_content}
-            </div>
-            <div class="documentation">
-                <h2>Technical Documentation</h2>
-                <p>Circuit diagram and state vector information are generated dynamically from the simulation kernel.</p>
-                <h3>Gate Set Applied:</h3>
-                <pre>{circuit.to_text_diagram(transpose=True)}</pre>
-            </div>
-        </div>
-    </div>
-</body>
-</html>"""
-            with open(destination_file, "w", encoding="utf-8") as f:
-                f.write(template)
-        except Exception as sim_err:
-            print(f"3D Generation Error: {sim_err}")
-
-        return Response(
-            {
-                "state_vector": state_list,
-                "circuit": circuit.to_text_diagram(transpose=True),
-                "prob_plot": prob_plot_json,
-                "phase_plot": phase_plot_json,
-            }
+        backend = circuit_json.get("backend", "numpy")
+        seed = circuit_json.get("seed")
+        if seed is not None:
+            seed = int(seed)
+
+        # Optional sparsification of the state vector and marginal distribution
+        top_k = circuit_json.get("top_k")
+        if top_k is not None:
+            top_k = int(top_k)
+        threshold = circuit_json.get("threshold")
+        if threshold is not None:
+            threshold = float(threshold)
+        marginal_qubits = circuit_json.get("marginal_qubits")
+        if isinstance(marginal_qubits, str):
+            marginal_qubits = marginal_qubits.split(",")
+        shots = int(circuit_json.get("shots", 1))
+
+        # Create and simulate the circuit, reusing cached results when possible
+        circuit, payload = quantum.run_custom_simulation(
+            circuit_data,
+            backend=backend,
+            seed=seed,
+            state_format=requested_state_format(request),
+            top_k=top_k,
+            threshold=threshold,
+            marginal_qubits=marginal_qubits,
+            shots=shots,
         )
 
+        # The 3D viewer is generated lazily by get_3d, keyed by circuit hash
+        key = quantum.circuit_key(circuit_data)
+        circuit3d.remember(key, circuit_data)
+        payload = {
+            **payload,
+            "circuit_hash": key,
+            "circuit_3d_url": reverse("get_3d_circuit", args=[key]),
+        }
+
+        return Response(payload)
+
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response(
             {"error": str(e), "traceback": traceback.format_exc()},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
+
+
+@csrf_exempt
+@require_POST
+def simulate_stream(request):
+    """Simulate like /simulate and stream the final state vector.
+
+    The JSON body takes circuit_data, backend and seed as for /simulate. The
+    query string selects the basis states, either with start/stop or with
+    page and page_size (default: all of them), and format=ndjson (default)
+    or format=json.
+    """
+    try:
+        body = json.loads(request.body)
+        circuit_data = json.loads(body["circuit_data"])
+        if "circuit" not in circuit_data:
+            raise ValueError("Invalid JSON payload. Missing 'circuit' key.")
+        seed = body.get("seed")
+        if seed is not None:
+            seed = int(seed)
+        if "page_size" in request.GET:
+            page_size = int(request.GET["page_size"])
+            if page_size < 1:
+                raise ValueError("page_size must be a positive integer")
+            start = int(request.GET.get("page", 0)) * page_size
+            stop = start + page_size
+        else:
+            start = int(request.GET.get("start", 0))
+            stop = request.GET.get("stop")
+            stop = None if stop is None else int(stop)
+        stream_format = request.GET.get("format", "ndjson")
+        if stream_format not in ("ndjson", "json"):
+            raise ValueError("format must be 'ndjson' or 'json'")
+    except (KeyError, TypeError, ValueError) as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        _, state_vector = quantum.simulate_final_state(
+            circuit_data, backend=body.get("backend", "numpy"), seed=seed
+        )
+        if stream_format == "ndjson":
+            chunks = quantum.iter_state_ndjson(state_vector, start, stop)
+            content_type = "application/x-ndjson"
+        else:
+            chunks = quantum.iter_state_json(state_vector, start, stop)
+            content_type = "application/json"
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return JsonResponse(
+            {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+@api_view(["GET"])
+def simulate_cache_stats(request):
+    """Hit/miss/eviction counters for the /simulate caches."""
+    return Response(quantum.simulation_cache_stats())
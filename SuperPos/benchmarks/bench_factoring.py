@@ -0,0 +1,66 @@
+"""Time to factor balanced RSA moduli: the old trial division vs
+crypto.factor_n (Pollard-Brent, then ECM)."""
+
+import argparse
+import math
+import random
+import statistics
+import time
+
+import common  # noqa: F401  (puts Pos on sys.path)
+
+from Pos.services import crypto
+
+# Trial division takes minutes per modulus past this key size.
+TRIAL_DIVISION_MAX_KEY_SIZE = 48
+
+
+def trial_division(n):
+    """The crypto.factor_n this replaced."""
+    for i in range(2, int(math.sqrt(n)) + 1):
+        if n % i == 0:
+            return i, n // i
+    return None
+
+
+def timed(function, n):
+    start = time.perf_counter()
+    factors = function(n)
+    return time.perf_counter() - start, factors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[32, 48, 64, 80, 96, 112, 128]
+    )
+    parser.add_argument("--keys", type=int, default=3, help="moduli per key size")
+    parser.add_argument(
+        "--budget", type=float, default=120, help="factor_n time budget in seconds"
+    )
+    args = parser.parse_args()
+    random.seed(4)
+
+    print(f"{'bits':>5} {'trial division':>15} {'factor_n median':>16} {'max':>9}")
+    for key_size in args.sizes:
+        old, new = [], []
+        for _ in range(args.keys):
+            n, _, _ = crypto.generate_rsa_keypair(key_size)
+            seconds, (p, q) = timed(
+                lambda n: crypto.factor_n(n, time_budget=args.budget), n
+            )
+            assert p * q == n and 1 < p < n
+            new.append(seconds)
+            if key_size <= TRIAL_DIVISION_MAX_KEY_SIZE:
+                seconds, factors = timed(trial_division, n)
+                assert factors == (p, q)
+                old.append(seconds)
+        old_median = f"{statistics.median(old):.4f}s" if old else "-"
+        print(
+            f"{key_size:>5} {old_median:>15} {statistics.median(new):>15.4f}s"
+            f" {max(new):>8.4f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""run_custom_simulation with and without statevector.fuse_gates on random
+nearest-neighbour rotation/CNOT/CY/CZ circuits, per backend."""
+
+import argparse
+import random
+from unittest import mock
+
+from common import best_time
+
+from Pos.services import quantum, statevector
+
+SIZES = [(12, 600), (16, 600), (20, 300)]
+
+
+def rotation_circuit_data(num_qubits, depth, salt):
+    """Editor circuit JSON; ``salt`` perturbs the angles so that every run
+    misses the simulation caches."""
+    rng = random.Random(7)
+    operations = []
+    for _ in range(depth):
+        i = rng.randrange(num_qubits - 1)
+        a, b = f"q{i}", f"q{i + 1}"
+        kind = rng.choice(["RX", "RY", "RZ", "H", "CNOT", "CY", "CZ", "X"])
+        if kind in ("RX", "RY", "RZ"):
+            operations.append(
+                {
+                    "type": kind,
+                    "targets": [rng.choice([a, b])],
+                    "angle": rng.uniform(0.1, 3) + salt * 1e-9,
+                }
+            )
+        elif kind in ("H", "X"):
+            operations.append({"type": kind, "targets": [a]})
+        else:
+            operations.append({"type": kind, "targets": [b], "control": a})
+    return {
+        "circuit": {
+            "layout": {"qubits": {f"q{i}": {} for i in range(num_qubits)}},
+            "operations": operations,
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs=2,
+        action="append",
+        metavar=("QUBITS", "DEPTH"),
+        help="repeatable; defaults to 12x600, 16x600 and 20x300",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    salt = 0
+
+    def run(num_qubits, depth, backend):
+        nonlocal salt
+        salt += 1
+        circuit_data = rotation_circuit_data(num_qubits, depth, salt)
+        return quantum.run_custom_simulation(
+            circuit_data, backend=backend, seed=1, top_k=4
+        )
+
+    print(
+        f"{'qubits':>6} {'ops':>5} {'backend':>7} {'gates':>11} {'unfused':>9} {'fused':>8}"
+    )
+    for num_qubits, depth in args.sizes or SIZES:
+        for backend in ("numpy", "cirq"):
+            _, payload = run(num_qubits, depth, backend)
+            counts = payload["gate_counts"]
+            with mock.patch.object(statevector, "fuse_gates", list):
+                unfused = best_time(
+                    lambda: run(num_qubits, depth, backend), args.repeat
+                )
+            fused = best_time(lambda: run(num_qubits, depth, backend), args.repeat)
+            gates = f"{counts['before']} -> {counts['after']}"
+            print(
+                f"{num_qubits:>6} {depth:>5} {backend:>7} {gates:>11}"
+                f" {unfused:>8.3f}s {fused:>7.3f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""RSA keypair generation time per key size: the old trial-division prime
+search vs the sieved Miller-Rabin generator."""
+
+import argparse
+import math
+import random
+
+from common import best_time
+
+from Pos.services import crypto
+
+# Trial division takes seconds per prime past this key size.
+TRIAL_DIVISION_MAX_KEY_SIZE = 64
+
+
+def trial_division_is_prime(n):
+    """The crypto.is_prime this replaced."""
+    if n < 2:
+        return False
+    for i in range(2, int(math.sqrt(n)) + 1):
+        if n % i == 0:
+            return False
+    return True
+
+
+def trial_division_prime(bit_length):
+    """The crypto.generate_prime this replaced (which could return a shorter
+    prime; kept as it was)."""
+    while True:
+        p = random.getrandbits(bit_length)
+        if p % 2 == 0:
+            p += 1
+        if trial_division_is_prime(p):
+            return p
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[32, 48, 64, 128, 256, 512, 1024, 2048],
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    random.seed(0)
+
+    print(f"{'bits':>5} {'trial division':>15} {'miller-rabin':>13}")
+    for key_size in args.sizes:
+        old = "-"
+        if key_size <= TRIAL_DIVISION_MAX_KEY_SIZE:
+            seconds = best_time(
+                lambda: [trial_division_prime(key_size // 2) for _ in range(2)],
+                args.repeat,
+            )
+            old = f"{seconds:.4f}s"
+        new = best_time(lambda: crypto.generate_rsa_keypair(key_size), args.repeat)
+        print(f"{key_size:>5} {old:>15} {new:>12.4f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Classical order finding: the old linear loop vs baby-step giant-step and
+Carmichael λ, on random semiprime moduli by bit length.
+
+Past about 44 bits the baby-step table is capped at BSGS_MAX_BABY_STEPS and
+baby-step giant-step runs until its --budget is used up.
+"""
+
+import argparse
+import random
+import time
+
+import common  # noqa: F401  (puts Pos on sys.path)
+import sympy
+
+from Pos.services import numtheory, quantum
+
+# The loop takes seconds past this many bits, so it is skipped above it.
+LOOP_MAX_BITS = 28
+
+
+def linear_order(x, n):
+    """The classical_order_finder this replaced: walk x**r until it is 1."""
+    r, y = 1, x
+    while y != 1:
+        y = x * y % n
+        r += 1
+    return r
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--bits", type=int, nargs="+", default=[20, 24, 28, 34, 40, 48, 56, 64]
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budget", type=float, default=10.0, help="seconds")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"{'bits':>4} {'order':>8} {'loop':>9} {'bsgs':>9} {'lambda':>9}")
+    for bits in args.bits:
+        p = sympy.randprime(2 ** (bits // 2 - 1), 2 ** (bits // 2))
+        q = sympy.randprime(2 ** (bits // 2 - 1), 2 ** (bits // 2))
+        n = p * q
+        x = random.randrange(2, n)
+        while sympy.gcd(x, n) != 1:
+            x = random.randrange(2, n)
+        r, carmichael = timed(
+            quantum.classical_order_finder, x, n, factorization={p: 1, q: 1}
+        )
+        deadline = time.monotonic() + args.budget
+        try:
+            r_bsgs, seconds = timed(
+                quantum.classical_order_finder, x, n, deadline=deadline
+            )
+            assert r_bsgs == r
+            bsgs = f"{seconds:.4f}s"
+        except numtheory.FactorizationTimeout:
+            bsgs = "timeout"
+        loop = "-"
+        if bits <= LOOP_MAX_BITS:
+            r_loop, seconds = timed(linear_order, x, n)
+            assert r_loop == r
+            loop = f"{seconds:.4f}s"
+        print(
+            f"{bits:>4} 2^{r.bit_length():<6} {loop:>9} {bsgs:>9} "
+            f"{carmichael:>8.5f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Probability and phase plot JSON: the old per-state list and plotly
+graph_objs path vs the column builders, with an output equivalence check."""
+
+import argparse
+import json
+
+import numpy as np
+import plotly
+from plotly import graph_objs as go
+
+from common import best_time
+
+from Pos.services import quantum
+
+
+def graph_objs_plots(state_vector):
+    """The plot path this replaced: a dict per basis state, then go.Figure."""
+    state_list = quantum.state_vector_to_list(state_vector)
+    probability = go.Figure(
+        data=[
+            go.Bar(
+                x=[s["binary"] for s in state_list],
+                y=[s["probability"] for s in state_list],
+                name="Probability",
+            )
+        ],
+        layout=go.Layout(
+            title="State Probabilities", xaxis_title="State", yaxis_title="Probability"
+        ),
+    )
+    phase = go.Figure(
+        data=[
+            go.Scatterpolar(
+                r=[s["magnitude"] for s in state_list],
+                theta=[s["phase"] * 180 / np.pi for s in state_list],
+                mode="markers",
+                marker=dict(size=10),
+                text=[s["binary"] for s in state_list],
+                name="Phase",
+            )
+        ],
+        layout=go.Layout(
+            title="State Phases",
+            polar=dict(radialaxis=dict(visible=True, range=[0, 1])),
+        ),
+    )
+    return tuple(
+        json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+        for figure in (probability, phase)
+    )
+
+
+def column_plots(state_vector, num_qubits):
+    magnitude, phase, probability = quantum.state_columns(state_vector)
+    return (
+        quantum.create_probability_plot(probability, num_qubits),
+        quantum.create_phase_plot(magnitude, phase, num_qubits),
+    )
+
+
+def assert_equivalent(old, new):
+    for old_plot, new_plot in zip(old, new):
+        old_plot, new_plot = json.loads(old_plot), json.loads(new_plot)
+        assert old_plot["layout"] == new_plot["layout"]
+        old_trace, new_trace = old_plot["data"][0], new_plot["data"][0]
+        assert list(old_trace) == list(new_trace)
+        for key, value in old_trace.items():
+            if key in ("y", "theta"):
+                np.testing.assert_allclose(new_trace[key], value, rtol=1e-6, atol=1e-9)
+            else:
+                assert new_trace[key] == value, key
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--qubits", type=int, nargs="+", default=[1, 2, 4, 8, 12, 16, 20]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'qubits':>6} {'graph_objs':>11} {'columns':>9} {'speedup':>8}")
+    for num_qubits in args.qubits:
+        state_vector = rng.normal(size=2**num_qubits) + 1j * rng.normal(
+            size=2**num_qubits
+        )
+        state_vector = (state_vector / np.linalg.norm(state_vector)).astype(
+            np.complex64
+        )
+        if num_qubits >= 2:
+            # Exact zeros take the zero-phase branch.
+            state_vector[1] = 0
+            state_vector[2] = -0.0
+        assert_equivalent(
+            graph_objs_plots(state_vector), column_plots(state_vector, num_qubits)
+        )
+        old = best_time(lambda: graph_objs_plots(state_vector), args.repeat)
+        new = best_time(lambda: column_plots(state_vector, num_qubits), args.repeat)
+        print(f"{num_qubits:>6} {old:>10.4f}s {new:>8.4f}s {old / new:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""numpy statevector engine vs cirq.Simulator on random editor circuits."""
+
+import argparse
+
+from common import best_time, random_circuit_data
+
+from Pos.services import quantum
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--qubits", type=int, nargs="+", default=[5, 10, 15, 20, 22])
+    parser.add_argument("--depth", type=int, default=60)
+    args = parser.parse_args()
+
+    print(f"{'qubits':>6} {'cirq':>10} {'numpy':>10} {'speedup':>8}")
+    for num_qubits in args.qubits:
+        circuit = quantum.create_circuit_from_json(
+            random_circuit_data(num_qubits, args.depth, seed=num_qubits)
+        )
+        repeat = 3 if num_qubits < 20 else 1
+        times = {
+            backend: best_time(
+                lambda: quantum.simulate_circuit(circuit, backend=backend), repeat
+            )
+            for backend in ("cirq", "numpy")
+        }
+        print(
+            f"{num_qubits:>6} {times['cirq'] * 1e3:>8.1f}ms "
+            f"{times['numpy'] * 1e3:>8.1f}ms {times['cirq'] / times['numpy']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Shared helpers for the benchmark scripts.
+
+Run the scripts from the SuperPos directory, e.g.
+``python benchmarks/bench_statevector.py``.
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+# Make the Pos package importable when run as a script.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+SINGLE_QUBIT_GATES = ["H", "X", "Y", "Z", "RX", "RY", "RZ"]
+TWO_QUBIT_GATES = ["CNOT", "CZ", "CY", "CRX", "CRY", "CRZ", "SWAP"]
+
+
+def random_circuit_data(num_qubits, depth, seed=0, measure=False):
+    """Editor circuit JSON of ``depth`` random supported gates, plus one
+    mid-circuit MEASURE if ``measure``. ``seed`` is an int or a random.Random
+    to draw from. Also used by Pos/tests.py."""
+    rng = seed if isinstance(seed, random.Random) else random.Random(seed)
+    names = [f"q{i}" for i in range(num_qubits)]
+    operations = []
+    for _ in range(depth):
+        r = rng.random()
+        if r < 0.5 or num_qubits < 2:
+            gate = rng.choice(SINGLE_QUBIT_GATES)
+            operation = {"type": gate, "targets": [rng.choice(names)]}
+        elif r < 0.9 or num_qubits < 3:
+            gate = rng.choice(TWO_QUBIT_GATES)
+            a, b = rng.sample(names, 2)
+            if gate == "SWAP":
+                operation = {"type": gate, "targets": [a, b]}
+            else:
+                operation = {"type": gate, "targets": [a], "control": b}
+        else:
+            a, b, c = rng.sample(names, 3)
+            operation = {"type": "CCX", "targets": [a], "control": f"{b},{c}"}
+        if operation["type"] in ("RX", "RY", "RZ", "CRX", "CRY", "CRZ"):
+            operation["angle"] = rng.uniform(0.1, 3)
+        operations.append(operation)
+    if measure:
+        operations.insert(
+            depth // 2, {"type": "MEASURE", "targets": [rng.choice(names)]}
+        )
+    return {
+        "circuit": {
+            "layout": {"qubits": {name: {} for name in names}},
+            "operations": operations,
+        }
+    }
+
+
+def best_time(function, repeat=3):
+    """Best wall-clock time of ``repeat`` calls, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)